@@ -0,0 +1,288 @@
+"""
+Benchmark das etapas do relatório com planilhas sintéticas no formato de NITEROI_BIRA.xlsx
+
+Uso:
+    python benchmark.py --rows 1000,10000,100000 --repeat 3 --output bench.json
+
+Cada tamanho gera (uma vez, em --data-dir) um arquivo com as planilhas CARGAS_NITEROI,
+NITEROI_BIRA_1 e NITEROI_BIRA_2 e mede load_excel_data, clean_data, create_calls_chart,
+calculate_metrics, get_excel_download_link e generate_html_report separadamente.
+O resultado sai em JSON, para comparar entre versões.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import statistics
+import tempfile
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import python as app  # noqa: E402
+
+# Limite de linhas de uma planilha do Excel, descontando título e cabeçalho
+MAX_LINHAS = 1_048_000
+
+# Proporção de linhas de cada planilha no arquivo original (656 / 107 / 870)
+PLANILHAS = {
+    'CARGAS_NITEROI': 0.40,
+    'NITEROI_BIRA_1': 0.07,
+    'NITEROI_BIRA_2': 0.53,
+}
+TITULOS = {
+    'CARGAS_NITEROI': 'CARGAS NITERÓI',
+    'NITEROI_BIRA_1': 'CARGA NITEROI BIRA',
+    'NITEROI_BIRA_2': 'NITEROI BIRA 2',
+}
+COLUNAS_BASE = ['CNPJ', 'RAZÃO SOCIAL', 'TEL 1', 'TEL 2', 'E-MAIL']
+COLUNAS_DATA = ['Data / Hora 1', 'Data / Hora 2', 'Data / Hora 3']
+
+# Situações como aparecem no arquivo real (grafias misturadas), com o peso de cada uma
+SITUACOES = [
+    ('NÃO ATENDE', 60), ('Não atende', 25), ('Número incorreto', 2), ('NÃO ACATOU', 2),
+    ('Não acatou', 1), ('Baixada', 1), ('BAIXADA', 1), ('TEL ERRADO', 1), ('Telefone incorreto', 1),
+    ('SEM CONTATO', 2), ('NÃO COMPLETA LIGAÇÕES', 1), ('Retornar em horario', 1),
+    ('CNPJ NÃO EXISTENTE', 1), ('EMPRESA BAIXADA', 1), ('CONTATO REALIZADO', 1), (None, 1),
+]
+OBSERVACOES = [
+    'CAIXA POSTAL', 'LIGAÇÃO NÃO COMPLETA', 'CORREIOS DE VOZ', 'CHAMADA NÃO COMPLETA',
+    'A empresa não possui colaboradores',
+    'PROPRIETARIO ATENDEU, MAS QUANDO INDENTIFICADO O SINDICATO ENCERROU A LIGAÇÃO',
+]
+PALAVRAS = ['TRANSPORTES', 'LOGISTICA', 'CARGAS', 'EXPRESS', 'TRANSLOG', 'RODOVIARIO', 'SERVICOS', 'LOCACAO']
+DOMINIOS = ['gmail.com', 'hotmail.com', 'yahoo.com.br', 'outlook.com']
+
+# Primeira data de cada tentativa (as tentativas do arquivo real são de set/out)
+INICIO_TENTATIVAS = [datetime(2025, 9, 3), datetime(2025, 9, 25), datetime(2025, 10, 14)]
+
+ETAPAS = [
+    'load_excel_data', 'clean_data', 'create_calls_chart',
+    'calculate_metrics', 'get_excel_download_link', 'generate_html_report',
+]
+
+# Função para gerar um CNPJ formatado (dígitos verificadores válidos)
+def _cnpj(rng):
+    base = [rng.randint(0, 9) for _ in range(8)] + [0, 0, 0, 1]
+    for pesos in ([5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2], [6, 5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2]):
+        resto = sum(d * p for d, p in zip(base, pesos)) % 11
+        base.append(0 if resto < 2 else 11 - resto)
+    d = ''.join(map(str, base))
+    return f"{d[:2]}.{d[2:5]}.{d[5:8]}/{d[8:12]}-{d[12:]}"
+
+# Função para gerar uma data/hora de ligação nos formatos misturados do arquivo real
+def _data_hora(rng, tentativa):
+    momento = INICIO_TENTATIVAS[tentativa] + timedelta(
+        days=rng.randint(0, 20), hours=rng.randint(8, 17), minutes=rng.randint(0, 59), seconds=rng.randint(0, 59)
+    )
+    sorteio = rng.random()
+    if tentativa < 2 and sorteio < 0.45:
+        return momento
+    if sorteio < 0.80:
+        return momento.strftime('%d/%m - %H:%M')
+    if sorteio < 0.88:
+        return momento.strftime('%d/%m/%y - %H:%M:%S')
+    if sorteio < 0.96:
+        return momento.strftime('%d/%m/%Y - %H:%M')
+    return momento.strftime('%d/%m -')
+
+# Função para gerar as linhas de uma planilha
+def _linhas_planilha(rng, sheet_name, n_linhas):
+    situacoes, pesos = zip(*SITUACOES)
+    com_datas = sheet_name == 'CARGAS_NITEROI'
+
+    for i in range(n_linhas):
+        cnpj = _cnpj(rng)
+        nome = f"{rng.choice(PALAVRAS)} {rng.choice(PALAVRAS)} {i} LTDA"
+        if com_datas:
+            tel1 = int(f"219{rng.randint(10000000, 99999999)}")
+        else:
+            tel1 = f"21 9{rng.randint(10000000, 99999999)}"
+        tel2 = f"21 2{rng.randint(1000000, 9999999)}" if rng.random() < 0.05 else None
+        email = f"contato{i}@{rng.choice(DOMINIOS)}" if rng.random() < 0.9 else None
+        linha = [cnpj, nome, tel1, tel2, email]
+
+        if com_datas:
+            # Sempre a 1ª tentativa; a 2ª em ~75% das linhas e a 3ª em ~15%
+            linha += [
+                _data_hora(rng, 0),
+                _data_hora(rng, 1) if rng.random() < 0.75 else None,
+                _data_hora(rng, 2) if rng.random() < 0.15 else None,
+            ]
+
+        linha += [
+            rng.choices(situacoes, pesos)[0],
+            rng.choice(OBSERVACOES) if rng.random() < 0.2 else None,
+        ]
+        yield linha
+
+# Função para gerar um arquivo sintético com o layout de NITEROI_BIRA.xlsx
+def generate_workbook(path, rows, seed=0):
+    """
+    Escreve em path um .xlsx com as três planilhas do arquivo original, somando
+    aproximadamente rows linhas (título na 1ª linha, cabeçalho na 2ª)
+    """
+    from openpyxl import Workbook
+
+    if not 1 <= rows <= MAX_LINHAS:
+        raise ValueError(f"rows deve estar entre 1 e {MAX_LINHAS}")
+
+    rng = random.Random(seed)
+    workbook = Workbook(write_only=True)
+    for sheet_name, proporcao in PLANILHAS.items():
+        worksheet = workbook.create_sheet(sheet_name)
+        colunas = COLUNAS_BASE + (COLUNAS_DATA if sheet_name == 'CARGAS_NITEROI' else []) + ['SITUAÇÃO', 'OBSERVAÇÃO']
+        worksheet.append([TITULOS[sheet_name]])
+        worksheet.append(colunas)
+        for linha in _linhas_planilha(rng, sheet_name, max(1, round(rows * proporcao))):
+            worksheet.append(linha)
+
+    tmp_path = f"{path}.tmp"
+    workbook.save(tmp_path)
+    os.replace(tmp_path, path)
+    return path
+
+# Função para medir uma etapa: tempo de cada execução, em segundos
+def _medir(funcao, repeticoes, preparar=None):
+    tempos = []
+    for _ in range(repeticoes):
+        if preparar:
+            preparar()
+        inicio = time.perf_counter()
+        funcao()
+        tempos.append(time.perf_counter() - inicio)
+    return {
+        'min_s': round(min(tempos), 6),
+        'mediana_s': round(statistics.median(tempos), 6),
+        'execucoes_s': [round(t, 6) for t in tempos],
+    }
+
+# Função para medir todas as etapas em um arquivo
+def benchmark_workbook(path, repeticoes=3, etapas=None, out_dir=None):
+    """
+    Mede cada etapa isoladamente: as etapas seguintes usam o resultado da
+    anterior calculado uma vez fora da medição
+    """
+    etapas = etapas or ETAPAS
+    resultados = {}
+
+    # Leitura (o cache do Streamlit é limpo antes de cada execução)
+    if 'load_excel_data' in etapas:
+        resultados['load_excel_data'] = _medir(
+            lambda: app.load_excel_data(path, os.path.basename(path)), repeticoes, app.load_excel_data.clear
+        )
+    dfs = app.read_workbook(path)
+
+    if 'clean_data' in etapas:
+        resultados['clean_data'] = _medir(
+            lambda: {sheet_name: app.clean_data(df, sheet_name) for sheet_name, df in dfs.items()}, repeticoes
+        )
+    dfs_clean = {sheet_name: app.clean_data(df, sheet_name) for sheet_name, df in dfs.items()}
+
+    if 'create_calls_chart' in etapas and 'CARGAS_NITEROI' in dfs_clean:
+        resultados['create_calls_chart'] = _medir(
+            lambda: app.create_calls_chart(dfs_clean['CARGAS_NITEROI'], "Horários de Ligações"), repeticoes
+        )
+
+    if 'calculate_metrics' in etapas:
+        resultados['calculate_metrics'] = _medir(
+            lambda: {sheet_name: app.calculate_metrics(df, sheet_name) for sheet_name, df in dfs_clean.items()},
+            repeticoes
+        )
+
+    if 'get_excel_download_link' in etapas:
+        resultados['get_excel_download_link'] = _medir(
+            lambda: app.get_excel_download_link(dfs_clean, "dados_tratados.xlsx"), repeticoes
+        )
+
+    if 'generate_html_report' in etapas:
+        # Sem out_dir, o relatório vai para uma pasta temporária apagada ao final
+        with tempfile.TemporaryDirectory(prefix="relatorio_bench_") as tmp_dir:
+            html_path = os.path.join(out_dir or tmp_dir, "relatorio_benchmark.html")
+            resultados['generate_html_report'] = _medir(
+                lambda: app.generate_html_report(dfs_clean, html_path), repeticoes
+            )
+
+    return {
+        'planilhas': {sheet_name: len(df) for sheet_name, df in dfs_clean.items()},
+        'etapas': resultados,
+    }
+
+# Função de entrada da linha de comando
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python benchmark.py",
+        description="Mede as etapas do relatório em planilhas sintéticas de vários tamanhos"
+    )
+    parser.add_argument("--rows", default="1000,10000,100000",
+                        help="total de linhas de cada arquivo, separado por vírgula (1k a 1M)")
+    parser.add_argument("--repeat", type=int, default=3, help="execuções de cada etapa")
+    parser.add_argument("--seed", type=int, default=0, help="semente do gerador")
+    parser.add_argument("--stages", default=",".join(ETAPAS), help="etapas medidas, separadas por vírgula")
+    parser.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "relatorio_bench"),
+                        help="pasta dos arquivos gerados (reaproveitados entre execuções)")
+    parser.add_argument("--output", help="arquivo JSON de saída (padrão: saída padrão)")
+
+    args = parser.parse_args(argv)
+
+    try:
+        tamanhos = [int(valor.replace("_", "")) for valor in args.rows.split(",") if valor.strip()]
+    except ValueError:
+        parser.error("--rows deve ser uma lista de inteiros")
+    if not tamanhos or any(not 1 <= n <= MAX_LINHAS for n in tamanhos):
+        parser.error(f"--rows deve ter valores entre 1 e {MAX_LINHAS}")
+    etapas = [etapa.strip() for etapa in args.stages.split(",") if etapa.strip()]
+    desconhecidas = sorted(set(etapas) - set(ETAPAS))
+    if desconhecidas:
+        parser.error(f"etapas desconhecidas: {', '.join(desconhecidas)}")
+    if args.repeat < 1:
+        parser.error("--repeat deve ser pelo menos 1")
+
+    os.makedirs(args.data_dir, exist_ok=True)
+
+    execucoes = []
+    for rows in tamanhos:
+        path = os.path.join(args.data_dir, f"sintetico_{rows}_s{args.seed}.xlsx")
+        if not os.path.exists(path):
+            inicio = time.perf_counter()
+            generate_workbook(path, rows, args.seed)
+            print(f"gerado {path} em {time.perf_counter() - inicio:.1f}s", file=sys.stderr)
+
+        resultado = benchmark_workbook(path, args.repeat, etapas)
+        resultado = {'linhas': rows, 'arquivo_bytes': os.path.getsize(path), **resultado}
+        execucoes.append(resultado)
+
+        resumo = ", ".join(f"{etapa} {tempos['mediana_s']:.3f}s" for etapa, tempos in resultado['etapas'].items())
+        print(f"{rows} linhas: {resumo}", file=sys.stderr)
+
+    saida = {
+        'gerado_em': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'plataforma': platform.platform(),
+        'cpus': os.cpu_count(),
+        'repeticoes': args.repeat,
+        'seed': args.seed,
+        'configuracao': {
+            'excel_engine': app.EXCEL_ENGINE,
+            'excel_writer': app.EXCEL_WRITER_ENGINE,
+            'html_plotlyjs': app.HTML_PLOTLYJS,
+        },
+        'resultados': execucoes,
+    }
+
+    texto = json.dumps(saida, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(texto + "\n")
+    else:
+        print(texto)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
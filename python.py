@@ -1,45 +1,56 @@
 import pandas as pd
 import streamlit as st
-import plotly.express as px
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
 from datetime import datetime
 import numpy as np
-from io import BytesIO
+from io import BytesIO, TextIOWrapper
 import os
 import re
-import plotly.io as pio
-from jinja2 import Template
+import sys
+import time
+import argparse
+import json
+import shutil
+import logging
+import threading
+import tracemalloc
+import tempfile
+import hashlib
+import zipfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
 
-# Configuração da página
-st.set_page_config(
-    page_title="Relatório de Contatos - CARGAS NITERÓI",
-    page_icon="📊",
-    layout="wide"
-)
+# plotly e jinja2 são importados dentro das funções que os usam: carregar plotly.express
+# custa mais que o resto do módulo, e nem todo uso (tela inicial, CLI só com xlsx,
+# workers de leitura) precisa deles
 
-# Cabeçalho
-st.title("📊 Relatório de Contatos - CARGAS NITERÓI")
-st.markdown("**Análise feita por Kaynan Monteiro e David Florencio**")
-st.markdown("---")
+# Tabela de tradução para remover acentos (equivalente às antigas substituições via regex)
+ACCENT_TABLE = str.maketrans({
+    **dict.fromkeys('áàãâä', 'a'),
+    **dict.fromkeys('éèêë', 'e'),
+    **dict.fromkeys('íìîï', 'i'),
+    **dict.fromkeys('óòõôö', 'o'),
+    **dict.fromkeys('úùûü', 'u'),
+    'ç': 'c',
+})
+
+# Mapeamento de situações equivalentes (texto normalizado -> situação padronizada)
+SITUACOES_EQUIVALENTES = {
+    **dict.fromkeys(['não atende', 'nao atende', 'não atend', 'n atend'], "Não atende"),
+    **dict.fromkeys(['não acatou', 'nao acatou', 'n acatou'], "Não acatou"),
+    **dict.fromkeys(['número incorreto', 'numero incorreto', 'tel errado', 'telefone incorreto'], "Número incorreto"),
+    **dict.fromkeys(['baixada', 'empresa baixada'], "Baixada"),
+}
 
 # Função para normalizar texto (remover acentos e maiúsculas)
 def normalize_text(text):
     if pd.isna(text):
         return text
     text = str(text)
-    # Remover espaços extras
-    text = text.strip()
-    # Converter para minúsculas
-    text = text.lower()
+    # Remover espaços extras e converter para minúsculas
+    text = text.strip().lower()
     # Remover acentos
-    text = re.sub(r'[áàãâä]', 'a', text)
-    text = re.sub(r'[éèêë]', 'e', text)
-    text = re.sub(r'[íìîï]', 'i', text)
-    text = re.sub(r'[óòõôö]', 'o', text)
-    text = re.sub(r'[úùûü]', 'u', text)
-    text = re.sub(r'[ç]', 'c', text)
-    return text
+    return text.translate(ACCENT_TABLE)
 
 # Função para normalizar situação
 def normalize_situacao(situacao):
@@ -50,19 +61,46 @@ def normalize_situacao(situacao):
     situacao_normalizada = normalize_text(situacao)
     
     # Mapeamento de situações equivalentes
-    if situacao_normalizada in ['não atende', 'nao atende', 'não atend', 'n atend']:
-        return "Não atende"
-    elif situacao_normalizada in ['não acatou', 'nao acatou', 'n acatou']:
-        return "Não acatou"
-    elif situacao_normalizada in ['número incorreto', 'numero incorreto', 'tel errado', 'telefone incorreto']:
-        return "Número incorreto"
-    elif situacao_normalizada in ['baixada', 'empresa baixada']:
-        return "Baixada"
+    if situacao_normalizada in SITUACOES_EQUIVALENTES:
+        return SITUACOES_EQUIVALENTES[situacao_normalizada]
     elif 'retornar' in situacao_normalizada:
         return "Retornar em horário"
     
     return situacao
 
+# Função para normalizar uma coluna inteira de situações
+def normalize_situacao_series(series):
+    """
+    Normaliza a coluna de situação de forma vetorizada.
+    Cada valor distinto é mapeado uma única vez (factorize) e o resultado
+    volta para as linhas como dtype category, com as mesmas regras de normalize_situacao.
+    """
+    # Com tipos misturados, o factorize trata 1, 1.0 e True como o mesmo valor;
+    # o rótulo é o texto de cada valor, então essas colunas são agrupadas pelo texto
+    chaves = series
+    if series.dtype == object and pd.api.types.infer_dtype(series, skipna=True) not in ('string', 'empty'):
+        chaves = series.map(str, na_action='ignore')
+    codes, uniques = pd.factorize(chaves, use_na_sentinel=True)
+    
+    # Normalizar apenas os valores distintos
+    valores = pd.Series([str(v) for v in uniques], dtype=object).str.strip()
+    normalizados = valores.str.lower().str.translate(ACCENT_TABLE)
+    rotulos = normalizados.map(SITUACOES_EQUIVALENTES)
+    retornar = rotulos.isna() & normalizados.str.contains('retornar', regex=False)
+    rotulos = rotulos.mask(retornar, "Retornar em horário").fillna(valores)
+    
+    # O código -1 (valor vazio) aponta para o último rótulo: "Não informado"
+    rotulos = list(rotulos) + ["Não informado"]
+    rotulo_codes, categorias = pd.factorize(pd.Index(rotulos, dtype=object))
+    situacoes = pd.Categorical.from_codes(rotulo_codes[codes], categories=categorias)
+    
+    return pd.Series(situacoes, index=series.index, name=series.name).cat.remove_unused_categories()
+
+# Função para contar situações (ignorando categorias sem ocorrências)
+def count_situacoes(series):
+    counts = series.value_counts()
+    return counts[counts > 0]
+
 # Função para parsear data/hora
 def parse_datetime(value):
     if pd.isna(value):
@@ -99,6 +137,7 @@ def parse_datetime(value):
                 day, month, year = date_part.split('/')
                 year_full = f"20{year}" if int(year) < 50 else f"19{year}"
                 value_str = f"{day}/{month}/{year_full} {time_part}"
+                return datetime.strptime(value_str, '%d/%m/%Y %H:%M')
             
             return datetime.strptime(value_str, pattern)
         except:
@@ -120,40 +159,260 @@ def parse_datetime(value):
     
     return None
 
+# Formatos de data/hora aceitos na conversão em lote: (formato, regex de classificação)
+# A ordem segue a prioridade de parse_datetime
+DATETIME_FORMATS = [
+    ('%Y-%m-%d %H:%M:%S', r'\d{4}-\d{1,2}-\d{1,2} \d{1,2}:\d{1,2}:\d{1,2}'),  # 2025-09-03 09:31:55
+    ('%d/%m/%Y %H:%M', r'\d{1,2}/\d{1,2}/\d{4} \d{1,2}:\d{1,2}'),               # 03/09/2025 09:31
+    ('%d/%m - %H:%M', r'\d{1,2}/\d{1,2} - \d{1,2}:\d{1,2}'),                     # 14/10 - 00:00
+    ('%d/%m/%Y - %H:%M', r'\d{1,2}/\d{1,2}/\d{4} - \d{1,2}:\d{1,2}'),           # 02/10/2025 - 15:33
+    ('%d/%m/%y %H:%M', r'\d{1,2}/\d{1,2}/\d{2}(?:(?: -)? \d{1,2}:\d{1,2}(?::\d{1,2})?)?'),  # 03/09/25 09:31, 03/09/25 - 09:31:00
+    ('%Y-%m-%d', r'\d{4}-\d{1,2}-\d{1,2}'),                                      # 2025-09-03
+    ('%d/%m/%Y', r'\d{1,2}/\d{1,2}/\d{4}'),                                      # 03/09/2025
+]
+
+# Função para expandir anos com dois dígitos (dd/mm/aa -> dd/mm/aaaa hh:mm:ss)
+def _expand_two_digit_year(textos):
+    partes = textos.str.extract(
+        r'^(\d{1,2})/(\d{1,2})/(\d{2})(?:(?: -)? (\d{1,2}):(\d{1,2})(?::(\d{1,2}))?)?$'
+    )
+    # Século 20 se ano for menor que 50
+    seculo = pd.Series(np.where(partes[2].astype(int) < 50, '20', '19'), index=textos.index)
+    return (
+        partes[0] + '/' + partes[1] + '/' + seculo + partes[2] + ' '
+        + partes[3].fillna('00') + ':' + partes[4].fillna('00') + ':' + partes[5].fillna('00')
+    )
+
+# Função para parsear uma coluna inteira de data/hora
+def parse_datetime_series(series):
+    """
+    Converte uma coluna de data/hora de uma só vez.
+    Cada valor é classificado pelo formato que segue (regex vetorizada) e cada
+    grupo é convertido com um único pd.to_datetime de formato explícito.
+    Retorna a coluna em datetime64[ns] e a quantidade de valores por formato.
+    """
+    formatos = {}
+    
+    if pd.api.types.is_datetime64_any_dtype(series):
+        formatos['datetime'] = int(series.notna().sum())
+        return series.astype('datetime64[ns]'), formatos
+    
+    resultado = pd.Series(pd.NaT, index=series.index, dtype='datetime64[ns]')
+    valores = series[series.notna()]
+    
+    # Células que o Excel já entregou como data
+    is_datetime = valores.map(type).map(lambda t: issubclass(t, datetime)).astype(bool)
+    if is_datetime.any():
+        resultado[is_datetime[is_datetime].index] = pd.to_datetime(valores[is_datetime])
+        formatos['datetime'] = int(is_datetime.sum())
+    
+    pendentes = (
+        valores[~is_datetime].astype(str).str.strip()
+        .str.replace(r'\s+', ' ', regex=True)
+    )
+    
+    for formato, padrao in DATETIME_FORMATS:
+        grupo = pendentes[pendentes.str.fullmatch(padrao).astype(bool)]
+        if grupo.empty:
+            continue
+        
+        if formato == '%d/%m/%y %H:%M':
+            convertidos = pd.to_datetime(_expand_two_digit_year(grupo), format='%d/%m/%Y %H:%M:%S', errors='coerce')
+        else:
+            convertidos = pd.to_datetime(grupo, format=formato, errors='coerce')
+        
+        convertidos = convertidos.dropna()
+        if not convertidos.empty:
+            resultado[convertidos.index] = convertidos
+            formatos[formato] = len(convertidos)
+            pendentes = pendentes.drop(convertidos.index)
+    
+    # Extrair apenas a hora de formatos "dd/mm - hh:mm" que não viraram data (data fictícia)
+    partes = pendentes.str.split(' - ', regex=False)
+    partes = partes[partes.str.len() == 2]
+    horas = pd.Series(dtype=float)
+    if not partes.empty:
+        horas = partes.str[1].str.strip().str.extract(r'^(\d+)\s*:', expand=False)
+        horas = pd.to_numeric(horas, errors='coerce')
+        horas = horas[horas < 24].dropna()
+    if not horas.empty:
+        resultado[horas.index] = pd.Timestamp(2025, 1, 1) + pd.to_timedelta(horas, unit='h')
+        formatos['dd/mm - hh:mm (somente hora)'] = len(horas)
+        pendentes = pendentes.drop(horas.index)
+    
+    if not pendentes.empty:
+        formatos['não reconhecido'] = len(pendentes)
+    
+    return resultado, formatos
+
+# Leitura das planilhas
+# "auto" usa o calamine (python-calamine) quando instalado e o openpyxl caso contrário
+EXCEL_ENGINE = os.environ.get("RELATORIO_EXCEL_ENGINE", "auto")
+HEADER_SCAN_ROWS = 10
+
+# Função para abrir a origem de uma leitura: caminho, arquivo aberto ou bytes (upload em memória)
+def _open_source(source):
+    # BytesIO sobre bytes não copia o conteúdo, e cada leitura ganha a sua própria posição
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return BytesIO(source)
+    return source
+
+# Função para iterar as linhas das planilhas com openpyxl (modo somente leitura)
+def _iter_sheets_openpyxl(source, sheet_names=None):
+    from openpyxl import load_workbook
+    
+    workbook = load_workbook(_open_source(source), read_only=True, data_only=True)
+    try:
+        for sheet_name in sheet_names or workbook.sheetnames:
+            yield sheet_name, workbook[sheet_name].iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+# Função para iterar as linhas das planilhas com calamine
+def _iter_sheets_calamine(source, sheet_names=None):
+    from python_calamine import CalamineWorkbook
+    
+    if isinstance(source, (str, os.PathLike)):
+        workbook = CalamineWorkbook.from_path(os.fspath(source))
+    else:
+        workbook = CalamineWorkbook.from_filelike(_open_source(source))
+    
+    for sheet_name in sheet_names or workbook.sheet_names:
+        rows = workbook.get_sheet_by_name(sheet_name).to_python(skip_empty_area=False)
+        # O calamine devolve "" para células vazias e float para todo número
+        yield sheet_name, (
+            tuple(
+                None if v == "" else int(v) if isinstance(v, float) and v.is_integer() else v
+                for v in row
+            )
+            for row in rows
+        )
+
+# Função para escolher o leitor de planilhas
+def _get_sheet_reader(engine=None):
+    engine = engine or EXCEL_ENGINE
+    if engine == "auto":
+        try:
+            import python_calamine  # noqa: F401
+            return _iter_sheets_calamine
+        except ImportError:
+            return _iter_sheets_openpyxl
+    if engine == "calamine":
+        return _iter_sheets_calamine
+    return _iter_sheets_openpyxl
+
+# Função para detectar a linha de cabeçalho
+def detect_header_row(rows):
+    """
+    Retorna o índice da primeira linha que parece um cabeçalho:
+    só textos, pelo menos dois, e ocupando ao menos metade da maior linha
+    """
+    larguras = [sum(v is not None for v in row) for row in rows]
+    maior = max(larguras, default=0)
+    
+    for i, row in enumerate(rows):
+        preenchidos = [v for v in row if v is not None]
+        if (
+            len(preenchidos) >= 2
+            and len(preenchidos) * 2 >= maior
+            and all(isinstance(v, str) for v in preenchidos)
+        ):
+            return i
+    return 0
+
+# Função para nomear colunas como o pandas (Unnamed: n, nomes repetidos com .1, .2)
+def _header_names(header):
+    nomes = []
+    vistos = {}
+    for i, valor in enumerate(header):
+        nome = f"Unnamed: {i}" if valor is None else str(valor)
+        if nome in vistos:
+            vistos[nome] += 1
+            nome = f"{nome}.{vistos[nome]}"
+        else:
+            vistos[nome] = 0
+        nomes.append(nome)
+    return nomes
+
+# Função para montar um DataFrame a partir das linhas de uma planilha
+def _rows_to_dataframe(rows):
+    rows = iter(rows)
+    
+    # Procurar o cabeçalho só nas primeiras linhas
+    primeiras = []
+    for row in rows:
+        primeiras.append(row)
+        if len(primeiras) >= HEADER_SCAN_ROWS:
+            break
+    
+    if not primeiras:
+        return pd.DataFrame()
+    
+    header_idx = detect_header_row(primeiras)
+    header = list(primeiras[header_idx])
+    
+    # Dados guardados coluna a coluna, numa única passada
+    colunas = [[] for _ in header]
+    n_linhas = 0
+    
+    def adicionar(row):
+        nonlocal n_linhas
+        if len(row) > len(colunas):
+            for _ in range(len(row) - len(colunas)):
+                colunas.append([None] * n_linhas)
+                header.append(None)
+        for j, coluna in enumerate(colunas):
+            coluna.append(row[j] if j < len(row) else None)
+        n_linhas += 1
+    
+    for row in primeiras[header_idx + 1:]:
+        adicionar(row)
+    for row in rows:
+        adicionar(row)
+    
+    # Descartar colunas vazias e sem nome no final (como o read_excel)
+    while colunas and header[-1] is None and all(v is None for v in colunas[-1]):
+        colunas.pop()
+        header.pop()
+    
+    return pd.DataFrame(
+        {nome: pd.Series(coluna) for nome, coluna in zip(_header_names(header), colunas)},
+        index=pd.RangeIndex(n_linhas),
+    )
+
+# Função para montar o DataFrame de uma planilha, já com colunas e linhas vazias tratadas
+def _sheet_to_dataframe(rows):
+    df = _rows_to_dataframe(rows)
+    
+    # Limpar nomes das colunas
+    df.columns = [str(col).strip() for col in df.columns]
+    
+    # Remover linhas completamente vazias
+    return df.dropna(how='all')
+
+# Função para ler todas as planilhas do arquivo (sem interface; erros são propagados)
+def read_workbook(file_path, engine=None):
+    # Ler todas as planilhas numa única passada
+    read_sheets = _get_sheet_reader(engine)
+    
+    # Carregar cada planilha
+    dfs = {}
+    
+    for sheet_name, rows in read_sheets(file_path):
+        # Armazenar com nome da planilha
+        dfs[sheet_name] = _sheet_to_dataframe(rows)
+    
+    return dfs
+
 # Função para carregar os dados do Excel
 @st.cache_data
-def load_excel_data(file_path):
+def load_excel_data(file_path, file_hash=None, engine=None):
     """
     Carrega os dados do arquivo Excel com múltiplas planilhas
+    (file_hash entra na chave do cache, já que o caminho do upload é sempre o mesmo)
     """
     try:
-        # Ler todas as planilhas
-        excel_file = pd.ExcelFile(file_path)
-        
-        # Carregar cada planilha
-        dfs = {}
-        
-        for sheet_name in excel_file.sheet_names:
-            # Tentar ler com diferentes cabeçalhos
-            try:
-                # Tentar ler com header=1 (segunda linha)
-                df = pd.read_excel(excel_file, sheet_name=sheet_name, header=1)
-            except:
-                # Se falhar, tentar com header=0
-                df = pd.read_excel(excel_file, sheet_name=sheet_name, header=0)
-            
-            # Limpar nomes das colunas
-            df.columns = [str(col).strip() for col in df.columns]
-            
-            # Remover linhas completamente vazias
-            df = df.dropna(how='all')
-            
-            # Armazenar com nome da planilha
-            dfs[sheet_name] = df
-            
-            st.sidebar.success(f"✅ {sheet_name}: {len(df)} registros")
-        
-        return dfs
+        return read_workbook(file_path, engine)
         
     except Exception as e:
         st.error(f"Erro ao carregar arquivo Excel: {e}")
@@ -165,6 +424,10 @@ def clean_data(df, sheet_name):
     """
     Limpa e padroniza os dados
     """
+    inicio = time.perf_counter()
+    # Memória da planilha como foi lida, antes de qualquer limpeza
+    memoria_antes = int(df.memory_usage(deep=True).sum())
+    
     # Fazer uma cópia
     df_clean = df.copy()
     
@@ -191,38 +454,457 @@ def clean_data(df, sheet_name):
                     date_columns.append(name)
     
     # Processar colunas de data/hora
-    for col in date_columns:
+    df_clean.attrs['formatos_data'] = {}
+    for col in dict.fromkeys(date_columns):
         if col in df_clean.columns:
             # Converter para datetime
-            df_clean[col] = df_clean[col].apply(parse_datetime)
+            df_clean[col], df_clean.attrs['formatos_data'][col] = parse_datetime_series(df_clean[col])
     
     # Normalizar situação
     if 'SITUAÇÃO' in df_clean.columns:
-        df_clean['SITUAÇÃO_NORMALIZADA'] = df_clean['SITUAÇÃO'].apply(normalize_situacao)
+        df_clean['SITUAÇÃO_NORMALIZADA'] = normalize_situacao_series(df_clean['SITUAÇÃO'])
     else:
         # Procurar por coluna de situação com nome diferente
         for col in df_clean.columns:
             if 'situação' in normalize_text(col) or 'situacao' in normalize_text(col):
-                df_clean['SITUAÇÃO_NORMALIZADA'] = df_clean[col].apply(normalize_situacao)
+                df_clean['SITUAÇÃO_NORMALIZADA'] = normalize_situacao_series(df_clean[col])
                 break
     
-    # Limpar valores de telefone
+    # Limpar valores de telefone (só dígitos; números do Excel não ganham mais ".0")
     for tel_col in ['TEL 1', 'TEL 2']:
         if tel_col in df_clean.columns:
-            df_clean[tel_col] = df_clean[tel_col].astype(str).str.strip()
-            # Converter valores numéricos para string
-            df_clean[tel_col] = df_clean[tel_col].apply(
-                lambda x: str(int(float(x))) if isinstance(x, (int, float)) and not pd.isna(x) else x
-            )
-            df_clean[tel_col] = df_clean[tel_col].replace(['nan', 'None', 'NaN', 'NaT', 'nat', ''], None)
+            df_clean[tel_col] = normalize_digits(df_clean[tel_col])
     
     # Limpar email
     if 'E-MAIL' in df_clean.columns:
         df_clean['E-MAIL'] = df_clean['E-MAIL'].astype(str).str.strip()
         df_clean['E-MAIL'] = df_clean['E-MAIL'].replace(['nan', 'None', 'NaN', 'NaT', 'nat', ''], None)
     
+    df_clean = apply_schema(df_clean)
+    df_clean.attrs['memoria'] = {
+        'antes': memoria_antes,
+        'depois': int(df_clean.memory_usage(deep=True).sum()),
+    }
+    # Tempo de limpeza, guardado com a planilha (vai junto para o cache em disco)
+    df_clean.attrs['tempo_limpeza'] = round(time.perf_counter() - inicio, 4)
+    
     return df_clean
 
+# Esquema compacto dos dados limpos
+# Colunas de dígitos: coluna -> largura fixa (CNPJ com zeros à esquerda) ou None
+SCHEMA_DIGIT_COLUMNS = {'CNPJ': 14, 'TEL 1': None, 'TEL 2': None}
+SCHEMA_STRING_DTYPE = pd.StringDtype("pyarrow")
+
+# Função para normalizar uma coluna de números (CNPJ, telefone) em texto só com dígitos
+def normalize_digits(series, width=None):
+    """
+    Remove pontuação e espaços, mantendo só os dígitos.
+    Células numéricas do Excel são convertidas sem o ".0" e, com width,
+    recebem os zeros à esquerda perdidos (ex.: CNPJ com 14 dígitos).
+    Valores sem nenhum dígito viram nulos.
+    """
+    if pd.api.types.is_numeric_dtype(series):
+        numerico = pd.Series(True, index=series.index)
+    else:
+        numerico = series.map(type).isin([int, float, np.int64, np.float64]).astype(bool)
+    
+    texto = series.astype(object).where(series.notna() & ~numerico)
+    texto = texto.astype(SCHEMA_STRING_DTYPE)
+    if numerico.any():
+        numeros = pd.to_numeric(series[numerico], errors='coerce').round().astype('Int64').astype(SCHEMA_STRING_DTYPE)
+        if width:
+            numeros = numeros.str.zfill(width)
+        texto[numerico] = numeros
+    
+    # Números que chegaram como texto ("2126195760.0") também perdem o ".0"
+    texto = texto.str.strip().str.replace(r'^(\d+)\.0+$', r'\1', regex=True)
+    digitos = texto.str.replace(r'\D', '', regex=True)
+    return digitos.mask(digitos == '')
+
+# Função para aplicar o esquema compacto a uma planilha limpa
+def apply_schema(df):
+    """
+    CNPJ/telefones como texto de dígitos, situação como category,
+    datas como datetime64[ns] e demais textos como strings do pyarrow.
+    Nenhuma coluna fica como object: todos os tipos voltam iguais do Parquet
+    (cache em disco), então a planilha do cache é igual à recém-limpa.
+    Converte as colunas no próprio DataFrame (clean_data já trabalha numa cópia).
+    """
+    for col in df.columns:
+        if col in SCHEMA_DIGIT_COLUMNS:
+            if col == 'CNPJ':
+                df[col] = normalize_digits(df[col], SCHEMA_DIGIT_COLUMNS[col])
+            else:
+                df[col] = df[col].astype(SCHEMA_STRING_DTYPE)
+        elif isinstance(df[col].dtype, pd.CategoricalDtype):
+            # Rótulos como str, o tipo que o Parquet devolve
+            df[col] = df[col].cat.rename_categories(df[col].cat.categories.astype(str))
+        elif pd.api.types.is_datetime64_any_dtype(df[col]):
+            df[col] = df[col].astype('datetime64[ns]')
+        elif df[col].dtype == object:
+            tipo = pd.api.types.infer_dtype(df[col], skipna=True)
+            if tipo in ('integer', 'floating', 'mixed-integer-float', 'boolean'):
+                df[col] = df[col].convert_dtypes()
+            elif tipo in ('datetime', 'datetime64', 'date'):
+                df[col] = pd.to_datetime(df[col]).astype('datetime64[ns]')
+            else:
+                # Textos e tipos misturados (ex.: números e textos): o texto de cada valor
+                df[col] = df[col].map(str, na_action='ignore').astype(SCHEMA_STRING_DTYPE)
+    return df
+
+# Função para gerar o relatório de memória das planilhas
+def memory_report(dfs_clean):
+    """
+    Uso de memória por planilha como foi lida do Excel e depois da limpeza
+    com o esquema compacto (em MB)
+    """
+    linhas = []
+    for sheet_name, df in dfs_clean.items():
+        memoria = df.attrs.get('memoria', {})
+        linhas.append({
+            'Planilha': sheet_name,
+            'Registros': len(df),
+            'Antes (MB)': round(memoria.get('antes', 0) / 2**20, 2),
+            'Depois (MB)': round(df.memory_usage(deep=True).sum() / 2**20, 2),
+        })
+    return pd.DataFrame(linhas)
+
+# Execução em paralelo da leitura e limpeza das planilhas
+# PARALLEL_MODE: "process", "thread" ou "serial"; PARALLEL_WORKERS=0 usa todos os núcleos
+# O padrão é "thread": "process" usa fork, e fazer fork do servidor do Streamlit (que tem
+# várias threads) pode travar em locks herdados (logging, pyarrow, tornado). A CLI de
+# relatórios em lote continua usando processos, um por arquivo. Onde não há fork
+# (Windows), "process" usa threads, ver make_executor.
+PARALLEL_MODE = os.environ.get("RELATORIO_PARALLEL", "thread")
+PARALLEL_WORKERS = int(os.environ.get("RELATORIO_WORKERS", "0"))
+# Arquivos menores que isso são processados em série (abrir o pool custaria mais)
+PARALLEL_MIN_BYTES = int(os.environ.get("RELATORIO_PARALLEL_MIN_KB", "2048")) * 1024
+
+# Função para criar o pool de workers do modo escolhido
+def make_executor(workers, mode="process"):
+    """
+    "process" usa fork, para que os workers herdem as funções deste script mesmo
+    quando ele é rodado pelo Streamlit. Sem fork (Windows) usa threads.
+    """
+    if mode == "process" and "fork" in multiprocessing.get_all_start_methods():
+        return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("fork"))
+    return ThreadPoolExecutor(max_workers=workers)
+
+# Função para listar as planilhas sem ler o conteúdo delas
+def list_sheet_names(file_path, engine=None):
+    read_sheets = _get_sheet_reader(engine)
+    return [sheet_name for sheet_name, _ in read_sheets(file_path)]
+
+# Função executada em cada worker: lê e limpa uma única planilha
+def _load_and_clean_sheet(file_path, sheet_name, engine=None):
+    read_sheets = _get_sheet_reader(engine)
+    for _, rows in read_sheets(file_path, [sheet_name]):
+        return clean_data(_sheet_to_dataframe(rows), sheet_name)
+
+# Função para decidir quantos workers usar
+def _parallel_workers(file_path, n_sheets, mode=None, workers=None):
+    mode = mode or PARALLEL_MODE
+    workers = workers or PARALLEL_WORKERS or os.cpu_count() or 1
+    
+    if isinstance(file_path, (str, os.PathLike)):
+        tamanho = os.path.getsize(file_path)
+    elif isinstance(file_path, (bytes, bytearray, memoryview)):
+        tamanho = len(file_path)
+    else:
+        tamanho = file_path.getbuffer().nbytes
+    
+    if mode == "serial" or n_sheets < 2 or tamanho < PARALLEL_MIN_BYTES:
+        return 1
+    return min(workers, n_sheets)
+
+# Função para ler e limpar todas as planilhas, em paralelo quando compensar
+def load_and_clean_workbook(file_path, file_hash=None, engine=None, mode=None, workers=None):
+    """
+    Lê e limpa todas as planilhas do arquivo, retornando o mesmo dicionário
+    {planilha: DataFrame limpo} da execução em série e na mesma ordem.
+    Planilhas são independentes, então cada uma vai para um worker.
+    """
+    mode = mode or PARALLEL_MODE
+    sheet_names = list_sheet_names(file_path, engine)
+    n_workers = _parallel_workers(file_path, len(sheet_names), mode, workers)
+    
+    if n_workers <= 1:
+        dfs = read_workbook(file_path, engine)
+        return {sheet_name: clean_data(df, sheet_name) for sheet_name, df in dfs.items()}
+    
+    with make_executor(n_workers, mode) as executor:
+        futures = {
+            sheet_name: executor.submit(_load_and_clean_sheet, file_path, sheet_name, engine)
+            for sheet_name in sheet_names
+        }
+        dfs_clean = {sheet_name: future.result() for sheet_name, future in futures.items()}
+    
+    return dfs_clean
+
+# Cache em disco das planilhas já limpas
+# Aumente CLEANING_PIPELINE_VERSION sempre que clean_data mudar, para invalidar o cache antigo
+CLEANING_PIPELINE_VERSION = "4"
+CACHE_DIR = os.environ.get("RELATORIO_CACHE_DIR", os.path.join(".cache", "planilhas"))
+CACHE_MAX_BYTES = int(os.environ.get("RELATORIO_CACHE_MAX_MB", "512")) * 1024 * 1024
+
+# Função para calcular o hash do arquivo enviado
+def workbook_hash(data):
+    """
+    Retorna o SHA-256 do conteúdo do arquivo junto com a versão da limpeza
+    """
+    return f"{hashlib.sha256(data).hexdigest()}-v{CLEANING_PIPELINE_VERSION}"
+
+# Função para preparar um DataFrame para o formato Parquet
+def _prepare_for_parquet(df):
+    # Colunas com tipos misturados (ex.: números e textos) não são aceitas pelo Arrow.
+    # Planilhas de clean_data já chegam sem elas (ver apply_schema); isto vale para
+    # os demais DataFrames exportados
+    df = df.copy()
+    for col in df.columns:
+        if df[col].dtype == object:
+            tipo = pd.api.types.infer_dtype(df[col], skipna=True)
+            if tipo not in ('string', 'empty', 'floating', 'integer', 'boolean', 'datetime', 'date'):
+                df[col] = df[col].map(lambda v: v if pd.isna(v) else str(v))
+    return df
+
+# Função para ler planilhas limpas do cache em disco
+def load_cached_workbook(file_hash):
+    """
+    Retorna o dicionário de planilhas limpas salvo para este hash, ou None
+    """
+    entry_dir = os.path.join(CACHE_DIR, file_hash)
+    manifest_path = os.path.join(entry_dir, "manifest.json")
+    
+    if not os.path.exists(manifest_path):
+        return None
+    
+    try:
+        with open(manifest_path, encoding="utf-8") as f:
+            manifest = json.load(f)
+        
+        dfs_clean = {}
+        for sheet in manifest["sheets"]:
+            df = pd.read_parquet(os.path.join(entry_dir, sheet["file"]))
+            df.attrs = sheet.get("attrs", {})
+            dfs_clean[sheet["name"]] = df
+        
+        # Marcar como usado recentemente (LRU)
+        os.utime(manifest_path)
+        return dfs_clean
+    except Exception:
+        # Entrada corrompida: descartar e reprocessar o arquivo
+        shutil.rmtree(entry_dir, ignore_errors=True)
+        return None
+
+# Função para listar os arquivos Parquet das planilhas de um arquivo em cache
+def cached_sheet_paths(file_hash):
+    """
+    Retorna {planilha: caminho do Parquet} da entrada do cache em disco, ou {}
+    """
+    entry_dir = os.path.join(CACHE_DIR, file_hash)
+    try:
+        with open(os.path.join(entry_dir, "manifest.json"), encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return {sheet["name"]: os.path.join(entry_dir, sheet["file"]) for sheet in manifest["sheets"]}
+
+# Função para salvar planilhas limpas no cache em disco
+def save_cached_workbook(file_hash, dfs_clean):
+    """
+    Salva cada planilha limpa em Parquet e remove as entradas menos usadas
+    quando o cache passa de CACHE_MAX_BYTES
+    """
+    entry_dir = os.path.join(CACHE_DIR, file_hash)
+    tmp_dir = f"{entry_dir}.tmp-{os.getpid()}"
+    
+    try:
+        os.makedirs(tmp_dir, exist_ok=True)
+        
+        sheets = []
+        for i, (sheet_name, df) in enumerate(dfs_clean.items()):
+            file_name = f"{i:03d}.parquet"
+            _prepare_for_parquet(df).to_parquet(os.path.join(tmp_dir, file_name))
+            sheets.append({"name": sheet_name, "file": file_name, "attrs": df.attrs})
+        
+        with open(os.path.join(tmp_dir, "manifest.json"), "w", encoding="utf-8") as f:
+            json.dump({"version": CLEANING_PIPELINE_VERSION, "sheets": sheets}, f, ensure_ascii=False)
+        
+        # Publicar a entrada de uma vez só
+        shutil.rmtree(entry_dir, ignore_errors=True)
+        os.replace(tmp_dir, entry_dir)
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+    
+    evict_workbook_cache()
+
+# Função para limitar o tamanho do cache em disco
+def evict_workbook_cache(max_bytes=CACHE_MAX_BYTES):
+    """
+    Remove as entradas usadas há mais tempo até o cache caber em max_bytes
+    """
+    if not os.path.isdir(CACHE_DIR):
+        return
+    
+    entradas = []
+    for name in os.listdir(CACHE_DIR):
+        entry_dir = os.path.join(CACHE_DIR, name)
+        manifest_path = os.path.join(entry_dir, "manifest.json")
+        try:
+            tamanho = sum(e.stat().st_size for e in os.scandir(entry_dir) if e.is_file())
+            entradas.append((os.path.getmtime(manifest_path), tamanho, entry_dir))
+        except OSError:
+            # Sem manifesto (ex.: a pasta dos índices incrementais) ou removida no meio do caminho
+            continue
+    
+    total = sum(tamanho for _, tamanho, _ in entradas)
+    for _, tamanho, entry_dir in sorted(entradas):
+        if total <= max_bytes:
+            break
+        shutil.rmtree(entry_dir, ignore_errors=True)
+        total -= tamanho
+
+# Ingestão incremental de arquivos que só ganham linhas no final (registro diário de ligações)
+# Opcional: RELATORIO_INCREMENTAL=1. Não há um armazenamento à parte: para cada nome de upload,
+# um índice aponta a entrada do cache em disco (planilhas limpas em Parquet) da última ingestão.
+# Cada planilha guarda nos attrs a impressão digital das linhas já lidas, calculada sobre os
+# valores como vieram do Excel (CNPJ, Data / Hora N e as demais células, que também mudam quando
+# uma ligação antiga é atualizada). Se a planilha enviada começa com as mesmas linhas, só as
+# linhas novas do final são limpas e juntadas às do cache; senão ela é limpa inteira.
+INCREMENTAL_MODE = os.environ.get("RELATORIO_INCREMENTAL", "0") == "1"
+INCREMENTAL_DIR = os.path.join(CACHE_DIR, "incremental")
+
+# Função para juntar planilhas já limpas numa só, mantendo o esquema compacto
+def concat_clean_frames(frames, ignore_index=False):
+    """
+    Um único concat por coluna (custo linear no total de linhas). Colunas category
+    têm as categorias unidas na ordem em que aparecem, colunas ausentes em alguma
+    parte viram nulas, e os metadados da limpeza (attrs) são somados.
+    """
+    frames = [df for df in frames if df is not None]
+    nomes = list(dict.fromkeys(col for df in frames for col in df.columns))
+    
+    colunas = {}
+    for col in nomes:
+        referencia = next(df[col] for df in frames if col in df.columns)
+        series = [df[col] if col in df.columns else referencia.iloc[:0].reindex(df.index) for df in frames]
+        
+        if all(isinstance(serie.dtype, pd.CategoricalDtype) for serie in series):
+            # Categorias na ordem de aparição, como se a coluna inteira tivesse sido normalizada de uma vez
+            categorias = pd.Index(list(dict.fromkeys(c for serie in series for c in serie.cat.categories)), dtype=str)
+            codes = np.concatenate([serie.array.set_categories(categorias).codes for serie in series])
+            colunas[col] = pd.Series(pd.Categorical.from_codes(codes, categories=categorias), name=col)
+        else:
+            unidas = pd.concat(series, ignore_index=True)
+            if unidas.dtype == object and pd.api.types.infer_dtype(unidas, skipna=True) in ('string', 'empty'):
+                unidas = unidas.astype(SCHEMA_STRING_DTYPE)
+            colunas[col] = unidas
+    
+    resultado = pd.DataFrame(colunas)
+    if not ignore_index and frames:
+        resultado.index = frames[0].index.append([df.index for df in frames[1:]])
+    
+    # Metadados da limpeza: contagens somadas
+    resultado.attrs['formatos_data'] = {}
+    for df in frames:
+        for col, formatos in df.attrs.get('formatos_data', {}).items():
+            contagens = resultado.attrs['formatos_data'].setdefault(col, {})
+            for formato, quantidade in formatos.items():
+                contagens[formato] = contagens.get(formato, 0) + quantidade
+    resultado.attrs['memoria'] = {
+        'antes': sum(df.attrs.get('memoria', {}).get('antes', 0) for df in frames),
+        'depois': int(resultado.memory_usage(deep=True).sum()),
+    }
+    resultado.attrs['tempo_limpeza'] = round(sum(df.attrs.get('tempo_limpeza', 0) for df in frames), 4)
+    return resultado
+
+# Função para juntar as linhas novas, já limpas, às linhas limpas armazenadas
+def _append_clean(df, novas):
+    if novas.empty:
+        return df
+    return concat_clean_frames([df, novas])
+
+# Função para obter o arquivo de índice da ingestão incremental de um upload
+def _incremental_index_path(store_key):
+    return os.path.join(INCREMENTAL_DIR, hashlib.sha256(store_key.encode("utf-8")).hexdigest()[:32] + ".json")
+
+# Função para apontar o índice de um upload para a entrada do cache da última ingestão
+def save_incremental_index(store_key, file_hash):
+    caminho = _incremental_index_path(store_key)
+    os.makedirs(INCREMENTAL_DIR, exist_ok=True)
+    tmp_path = f"{caminho}.tmp-{os.urandom(8).hex()}"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"file_hash": file_hash}, f)
+    # Trocar o arquivo de uma vez: quem lê ao mesmo tempo vê o índice antigo ou o novo
+    os.replace(tmp_path, caminho)
+
+# Função para esquecer a última ingestão de um upload
+def clear_incremental_index(store_key):
+    try:
+        os.remove(_incremental_index_path(store_key))
+    except OSError:
+        pass
+
+# Função para ler as planilhas limpas da última ingestão de um upload
+def _load_incremental_entry(store_key):
+    """
+    Retorna {planilha: DataFrame limpo} da entrada do cache apontada pelo índice,
+    ou {} (primeiro upload, entrada removida pelo LRU ou de outra versão da limpeza)
+    """
+    try:
+        with open(_incremental_index_path(store_key), encoding="utf-8") as f:
+            file_hash = json.load(f)["file_hash"]
+    except (OSError, ValueError, KeyError):
+        return {}
+    if not file_hash.endswith(f"-v{CLEANING_PIPELINE_VERSION}"):
+        return {}
+    return load_cached_workbook(file_hash) or {}
+
+# Função para calcular a impressão digital de cada linha lida de uma planilha
+def _row_fingerprints(df):
+    if df.empty:
+        return np.array([], dtype='uint64')
+    return pd.util.hash_pandas_object(df, index=False).to_numpy()
+
+# Função para resumir a impressão digital de um conjunto de linhas
+def _rows_digest(columns, fingerprints):
+    h = hashlib.sha256("\0".join(map(str, columns)).encode("utf-8"))
+    h.update(np.ascontiguousarray(fingerprints).tobytes())
+    return h.hexdigest()
+
+# Função para ler e limpar um arquivo aproveitando a ingestão anterior do mesmo arquivo
+def ingest_workbook(file_path, store_key, engine=None):
+    """
+    Lê o arquivo e limpa só o que a ingestão anterior com o mesmo store_key (ex.: o
+    nome do upload) ainda não limpou: planilhas que só ganharam linhas no final têm
+    apenas essas linhas limpas, e as demais são limpas inteiras. Retorna o mesmo
+    {planilha: DataFrame limpo} de load_and_clean_workbook, com a impressão digital
+    das linhas lidas em attrs['ingestao'] (vai junto para o cache em disco).
+    """
+    anteriores = _load_incremental_entry(store_key)
+    
+    dfs_clean = {}
+    for sheet_name, df in read_workbook(file_path, engine).items():
+        impressoes = _row_fingerprints(df)
+        armazenado = anteriores.get(sheet_name)
+        ingestao = armazenado.attrs.get('ingestao') if armazenado is not None else None
+        
+        # Mesmas colunas e as mesmas primeiras linhas já limpas: só a cauda é nova
+        n = ingestao['linhas'] if ingestao else None
+        if n is not None and n <= len(df) and _rows_digest(df.columns, impressoes[:n]) == ingestao['impressao']:
+            if n == len(df):
+                df_clean = armazenado
+            else:
+                df_clean = _append_clean(armazenado, clean_data(df.iloc[n:], sheet_name))
+        else:
+            df_clean = clean_data(df, sheet_name)
+        
+        df_clean.attrs['ingestao'] = {'linhas': len(df), 'impressao': _rows_digest(df.columns, impressoes)}
+        dfs_clean[sheet_name] = df_clean
+    
+    return dfs_clean
+
 # Função para gerar gráfico de pizza
 def create_pie_chart(df, title):
     """
@@ -231,7 +913,16 @@ def create_pie_chart(df, title):
     if 'SITUAÇÃO_NORMALIZADA' not in df.columns:
         return None
     
-    situacao_counts = df['SITUAÇÃO_NORMALIZADA'].value_counts().reset_index()
+    return create_pie_chart_from_counts(count_situacoes(df['SITUAÇÃO_NORMALIZADA']), title)
+
+# Função para gerar gráfico de pizza a partir das contagens já agregadas
+def create_pie_chart_from_counts(situacao_counts, title):
+    """
+    Cria gráfico de pizza a partir de uma Series situação -> quantidade
+    """
+    import plotly.express as px
+    
+    situacao_counts = situacao_counts.reset_index()
     situacao_counts.columns = ['SITUAÇÃO', 'QUANTIDADE']
     
     # Ordenar por quantidade (decrescente)
@@ -275,34 +966,81 @@ def create_calls_chart(df, title):
     """
     Cria gráfico de colunas para horários de ligações
     """
-    horas_todas = []
+    horas = call_hour_counts(df).groupby('HORA')['QUANTIDADE'].sum()
+    return create_calls_chart_from_counts(horas, title)
+
+# Colunas de data/hora das ligações: "Data / Hora 1", "Data_Hora_2", "Data Hora 3"...
+# O número no nome é a tentativa de contato (sem número, primeira tentativa)
+_DATE_COLUMN_NAME = re.compile(r'data\s*[/_-]?\s*hora(?:[\s_-]*(\d+))?')
+
+# Dias da semana na ordem de dt.dayofweek (segunda = 0)
+DIAS_SEMANA = ['Segunda', 'Terça', 'Quarta', 'Quinta', 'Sexta', 'Sábado', 'Domingo']
+NS_POR_HORA = 3600 * 10**9
+NS_POR_DIA = 24 * NS_POR_HORA
+
+# Função para obter a tentativa de contato de uma coluna de data/hora (None se não for uma)
+def date_column_attempt(col):
+    match = _DATE_COLUMN_NAME.fullmatch(normalize_text(col) or "")
+    if match is None:
+        return None
+    return int(match.group(1) or 1)
+
+# Função para encontrar as colunas de data/hora de uma planilha
+def find_date_columns(df):
+    # Só colunas no formato Data/Hora N, em ordem de tentativa
+    tentativas = {col: date_column_attempt(col) for col in df.columns}
+    return sorted((col for col, tentativa in tentativas.items() if tentativa), key=tentativas.get)
+
+# Função para contar as ligações por situação x tentativa x dia da semana x hora
+def call_hour_counts(df):
+    """
+    Cada ligação de build_attempt_events (datas sem ano já com o ano resolvido, para o
+    dia da semana ser o real) vira um código inteiro (situação, tentativa, dia da semana,
+    hora) e um único np.bincount soma todas as colunas. Retorna só as combinações com ligações.
+    """
+    date_cols = find_date_columns(df)
     
-    # Verificar todas as colunas que podem ser de data/hora
-    date_cols = []
-    for col in df.columns:
-        col_lower = str(col).lower()
-        if any(term in col_lower for term in ['data', 'hora', 'data_hora', 'data / hora']):
-            date_cols.append(col)
+    if 'SITUAÇÃO_NORMALIZADA' in df.columns:
+        situacao = df['SITUAÇÃO_NORMALIZADA']
+        if isinstance(situacao.dtype, pd.CategoricalDtype):
+            sit_codes, situacoes = situacao.cat.codes.to_numpy(), list(situacao.cat.categories)
+        else:
+            sit_codes, situacoes = pd.factorize(situacao.astype(object))
+            situacoes = list(situacoes)
+    else:
+        sit_codes, situacoes = np.full(len(df), -1), []
     
-    # Se não encontrou automaticamente, procurar colunas específicas
-    if not date_cols:
-        for i in range(1, 4):
-            for pattern in [f'Data / Hora {i}', f'Data_Hora_{i}', f'Data Hora {i}']:
-                if pattern in df.columns:
-                    date_cols.append(pattern)
+    # Linhas sem situação ficam no último código
+    sit_codes = np.where(sit_codes < 0, len(situacoes), sit_codes).astype('int64')
+    n_situacoes = len(situacoes) + 1
+    n_tentativas = max((date_column_attempt(col) for col in date_cols), default=1)
     
-    for col in date_cols:
-        if col in df.columns:
-            col_data = df[col].dropna()
-            
-            for value in col_data:
-                dt = parse_datetime(value)
-                if dt:
-                    horas_todas.append(dt.hour)
-    
-    if horas_todas:
-        horas_df = pd.DataFrame({'HORA': horas_todas})
-        horas_counts = horas_df['HORA'].value_counts().sort_index().reset_index()
+    events = build_attempt_events(df[date_cols])
+    codigos = (
+        (sit_codes[events['LINHA'].to_numpy()] * n_tentativas + events['TENTATIVA'].to_numpy() - 1) * 7
+        + events['DIA_SEMANA'].to_numpy()
+    ) * 24 + events['HORA'].to_numpy()
+    contagem = np.bincount(codigos.astype('int64'), minlength=n_situacoes * n_tentativas * 7 * 24)
+    
+    usados = np.flatnonzero(contagem)
+    sit, tentativa, dia, hora = np.unravel_index(usados, (n_situacoes, n_tentativas, 7, 24))
+    return pd.DataFrame({
+        'SITUAÇÃO': pd.Series(np.array(situacoes + [None], dtype=object)[sit], dtype=object),
+        'TENTATIVA': tentativa.astype('int64') + 1,
+        'DIA_SEMANA': dia.astype('int64'),
+        'HORA': hora.astype('int64'),
+        'QUANTIDADE': contagem[usados],
+    })
+
+# Função para gerar gráfico de colunas a partir das contagens por hora
+def create_calls_chart_from_counts(horas_counts, title):
+    """
+    Cria gráfico de colunas a partir de uma Series hora -> quantidade de ligações
+    """
+    import plotly.express as px
+    
+    if len(horas_counts) > 0 and horas_counts.sum() > 0:
+        horas_counts = horas_counts[horas_counts > 0].sort_index().reset_index()
         horas_counts.columns = ['HORA', 'QUANTIDADE']
         
         fig = px.bar(
@@ -337,10 +1075,508 @@ def create_calls_chart(df, title):
     else:
         return None
 
+# Linha do tempo das tentativas de contato (Data / Hora 1..3)
+# As tentativas viram uma tabela longa (uma linha por ligação) montada uma única vez;
+# intervalos, taxas de atendimento e melhores horários saem dela com operações vetorizadas
+# Datas "dd/mm - hh:mm" chegam sem ano (1900, padrão do strptime)
+ANO_SEM_ANO = 1900
+# Situações em que alguém atendeu (comparadas sem acento e em minúsculas)
+SITUACOES_ATENDIDAS = {
+    'nao acatou', 'retornar em horario', 'contato realizado',
+    'contabilidade repassou o e-mail', 'ligar em outro horario',
+}
+# Faixas do tempo entre tentativas, em horas
+TIMELINE_FAIXAS_HORAS = [0, 1, 4, 24, 72, 168, 336, np.inf]
+TIMELINE_FAIXAS_ROTULOS = ['< 1h', '1h a 4h', '4h a 24h', '1 a 3 dias', '3 a 7 dias', '7 a 14 dias', '> 14 dias']
+# Horários com menos ligações que isso não entram nas recomendações
+TIMELINE_MIN_LIGACOES = 10
+
+# Função para trocar o ano de datas (mantendo mês, dia e hora)
+def _with_year(momentos, anos):
+    return pd.to_datetime(pd.DataFrame({
+        'year': anos,
+        'month': momentos.dt.month.to_numpy(),
+        'day': momentos.dt.day.to_numpy(),
+        'hour': momentos.dt.hour.to_numpy(),
+        'minute': momentos.dt.minute.to_numpy(),
+        'second': momentos.dt.second.to_numpy(),
+    }))
+
+# Função para montar a tabela longa de tentativas de contato
+def build_attempt_events(df):
+    """
+    Uma linha por tentativa (LINHA = posição da empresa na planilha), ordenada por
+    empresa e número da tentativa. Datas sem ano recebem o ano da tentativa anterior
+    (ou o seguinte, na virada do ano); sem tentativa anterior, o ano mais comum da
+    planilha. Horários 00:00:00 são tratados como
+    "só a data" e ficam fora das análises por hora.
+    """
+    linhas, tentativas, momentos = [], [], []
+    for col in find_date_columns(df):
+        col_data = df[col]
+        if not pd.api.types.is_datetime64_any_dtype(col_data):
+            col_data, _ = parse_datetime_series(col_data)
+        
+        valores = col_data.to_numpy(dtype='datetime64[ns]')
+        validos = np.flatnonzero(~np.isnat(valores))
+        linhas.append(validos)
+        tentativas.append(np.full(len(validos), date_column_attempt(col), dtype='int64'))
+        momentos.append(valores[validos])
+    
+    if not linhas:
+        linhas, tentativas, momentos = [np.array([], dtype='int64')], [np.array([], dtype='int64')], [np.array([], dtype='datetime64[ns]')]
+    
+    linha = np.concatenate(linhas)
+    tentativa = np.concatenate(tentativas)
+    ordem = np.lexsort((tentativa, linha))
+    linha, tentativa = linha[ordem], tentativa[ordem]
+    momento = pd.Series(np.concatenate(momentos)[ordem])
+    
+    # Há tentativa anterior da mesma empresa / esta é a última tentativa dela
+    tem_anterior = np.zeros(len(linha), dtype=bool)
+    tem_anterior[1:] = linha[1:] == linha[:-1]
+    ultima = np.ones(len(linha), dtype=bool)
+    ultima[:-1] = ~tem_anterior[1:]
+    
+    # Datas sem ano, resolvidas em ordem de tentativa (uma passada por tentativa)
+    anos = momento.dt.year
+    sem_ano = (anos == ANO_SEM_ANO).to_numpy().copy()
+    
+    # Primeira tentativa sem ano: ano mais comum da planilha
+    primeiras = np.flatnonzero(sem_ano & ~tem_anterior)
+    com_ano = anos[~sem_ano]
+    if len(primeiras) and not com_ano.empty:
+        momento.iloc[primeiras] = _with_year(momento.iloc[primeiras], int(com_ano.mode().iloc[0])).to_numpy()
+        sem_ano[primeiras] = False
+    
+    while True:
+        pendentes = np.flatnonzero(sem_ano & tem_anterior & ~np.r_[True, sem_ano[:-1]])
+        if len(pendentes) == 0:
+            break
+        anterior = momento.iloc[pendentes - 1]
+        atual = momento.iloc[pendentes]
+        anos_anteriores = anterior.dt.year.to_numpy()
+        corrigido = _with_year(atual, anos_anteriores)
+        # Virada de ano (ex.: dezembro -> janeiro); diferenças menores são datas fora de ordem
+        virada = corrigido.to_numpy() < anterior.to_numpy() - np.timedelta64(180, 'D')
+        if virada.any():
+            corrigido = _with_year(atual, anos_anteriores + virada)
+        momento.iloc[pendentes] = corrigido.to_numpy()
+        sem_ano[pendentes] = False
+    
+    ns = momento.to_numpy(dtype='datetime64[ns]').view('int64')
+    intervalo = np.full(len(ns), np.nan)
+    intervalo[tem_anterior] = (ns[tem_anterior] - ns[np.flatnonzero(tem_anterior) - 1]) / NS_POR_HORA
+    
+    if 'SITUAÇÃO_NORMALIZADA' in df.columns:
+        situacao = df['SITUAÇÃO_NORMALIZADA'].iloc[linha].reset_index(drop=True)
+        atendidas = [s for s in pd.unique(situacao.dropna()) if normalize_text(s) in SITUACOES_ATENDIDAS]
+        atendida = situacao.isin(atendidas).to_numpy()
+    else:
+        situacao = pd.Series(None, index=range(len(linha)), dtype=object)
+        atendida = np.zeros(len(linha), dtype=bool)
+    
+    return pd.DataFrame({
+        'LINHA': linha,
+        'TENTATIVA': tentativa,
+        'MOMENTO': momento,
+        'DIA_SEMANA': (ns // NS_POR_DIA + 3) % 7,
+        'HORA': (ns // NS_POR_HORA) % 24,
+        'HORA_CONHECIDA': ns % NS_POR_DIA != 0,
+        'INTERVALO_HORAS': intervalo,
+        'ULTIMA': ultima,
+        'SITUAÇÃO': situacao,
+        # A situação da planilha é o resultado da última tentativa
+        'ATENDIDA': ultima & atendida,
+    })
+
+# Função para calcular a distribuição do tempo entre tentativas
+def attempt_interval_distribution(events):
+    """
+    Retorna (faixas x tentativa, resumo). Intervalos negativos (datas fora de ordem)
+    são contados no resumo e ficam fora da distribuição.
+    """
+    intervalos = events[events['INTERVALO_HORAS'].notna()]
+    fora_de_ordem = int((intervalos['INTERVALO_HORAS'] < 0).sum())
+    intervalos = intervalos[intervalos['INTERVALO_HORAS'] >= 0]
+    
+    faixas = pd.cut(intervalos['INTERVALO_HORAS'], TIMELINE_FAIXAS_HORAS, labels=TIMELINE_FAIXAS_ROTULOS, right=False)
+    distribuicao = pd.crosstab(faixas, intervalos['TENTATIVA'].map(lambda tentativa: f"Até a {tentativa}ª tentativa"), dropna=False)
+    distribuicao = distribuicao.reindex(TIMELINE_FAIXAS_ROTULOS, fill_value=0)
+    distribuicao.index.name = 'Intervalo'
+    distribuicao.columns.name = None
+    
+    resumo = {
+        'Intervalos': len(intervalos),
+        'Mediana (h)': round(float(intervalos['INTERVALO_HORAS'].median()), 1) if len(intervalos) else None,
+        'Média (h)': round(float(intervalos['INTERVALO_HORAS'].mean()), 1) if len(intervalos) else None,
+        'Fora de ordem': fora_de_ordem,
+    }
+    return distribuicao, resumo
+
+# Função para calcular a taxa de atendimento por hora e por dia da semana
+def attempt_success_rates(events):
+    """
+    Retorna (por hora, por dia da semana): ligações, atendidas e taxa (%),
+    só com as tentativas de horário conhecido
+    """
+    conhecidas = events[events['HORA_CONHECIDA']]
+    atendidas = conhecidas['ATENDIDA'].to_numpy(dtype='float64')
+    
+    tabelas = []
+    for coluna, rotulos in (('HORA', [f"{h:02d}h" for h in range(24)]), ('DIA_SEMANA', DIAS_SEMANA)):
+        posicoes = conhecidas[coluna].to_numpy()
+        ligacoes = np.bincount(posicoes, minlength=len(rotulos))
+        sucesso = np.bincount(posicoes, weights=atendidas, minlength=len(rotulos)).astype('int64')
+        tabela = pd.DataFrame({
+            'Ligações': ligacoes,
+            'Atendidas': sucesso,
+            'Taxa (%)': np.round(100 * sucesso / np.maximum(ligacoes, 1), 1),
+        }, index=pd.Index(rotulos, name='Hora' if coluna == 'HORA' else 'Dia'))
+        tabelas.append(tabela[tabela['Ligações'] > 0])
+    return tuple(tabelas)
+
+# Função para recomendar o melhor horário para ligar, por situação
+def best_call_times(events, min_ligacoes=TIMELINE_MIN_LIGACOES):
+    """
+    Para cada situação, o horário (dia da semana x hora) em que a maior parte das
+    ligações terminou nela: empresas que chegaram à situação na última tentativa
+    feita naquele horário / ligações feitas naquele horário. Horários com menos de
+    min_ligacoes só são escolhidos quando a situação não tem nenhum outro.
+    """
+    conhecidas = events[events['HORA_CONHECIDA']]
+    horario = conhecidas['DIA_SEMANA'].to_numpy() * 24 + conhecidas['HORA'].to_numpy()
+    ligacoes = np.bincount(horario, minlength=7 * 24)
+    
+    finais = conhecidas[conhecidas['ULTIMA'].to_numpy()]
+    contagem = (
+        pd.DataFrame({'SITUAÇÃO': finais['SITUAÇÃO'], 'HORARIO': horario[conhecidas['ULTIMA'].to_numpy()]})
+        .groupby(['SITUAÇÃO', 'HORARIO'], observed=True)
+        .size()
+        .reset_index(name='EMPRESAS')
+    )
+    if contagem.empty:
+        return pd.DataFrame(columns=['Situação', 'Empresas', 'Melhor dia', 'Melhor hora', 'Ligações no horário', 'Taxa no horário (%)'])
+    
+    contagem['LIGACOES'] = ligacoes[contagem['HORARIO'].to_numpy()]
+    contagem['TAXA'] = contagem['EMPRESAS'] / contagem['LIGACOES']
+    contagem['ELEGIVEL'] = contagem['LIGACOES'] >= min_ligacoes
+    total = contagem.groupby('SITUAÇÃO', observed=True)['EMPRESAS'].sum()
+    
+    melhores = (
+        contagem.sort_values(['ELEGIVEL', 'TAXA', 'EMPRESAS'], ascending=False, kind='stable')
+        .drop_duplicates('SITUAÇÃO')
+    )
+    return pd.DataFrame({
+        'Situação': melhores['SITUAÇÃO'].astype(object).to_numpy(),
+        'Empresas': total.reindex(melhores['SITUAÇÃO']).to_numpy(),
+        'Melhor dia': np.array(DIAS_SEMANA, dtype=object)[melhores['HORARIO'].to_numpy() // 24],
+        'Melhor hora': [f"{h:02d}h" for h in melhores['HORARIO'].to_numpy() % 24],
+        'Ligações no horário': melhores['LIGACOES'].to_numpy(),
+        'Taxa no horário (%)': np.round(100 * melhores['TAXA'].to_numpy(), 1),
+    }).sort_values('Empresas', ascending=False, kind='stable').reset_index(drop=True)
+
+# Função para gerar o mapa de calor de ligações por dia da semana x hora
+def create_weekday_heatmap_from_counts(matriz, title):
+    """
+    Cria mapa de calor a partir da matriz dia da semana x hora de cube_weekday_hour_counts
+    """
+    import plotly.express as px
+    
+    if matriz.to_numpy().sum() == 0:
+        return None
+    
+    fig = px.imshow(
+        matriz,
+        labels=dict(x='Hora do Dia', y='Dia da Semana', color='Ligações'),
+        title=f"<b>{title}</b>",
+        color_continuous_scale='Blues',
+        aspect='auto'
+    )
+    fig.update_traces(hovertemplate='<b>%{y}, %{x}:00</b><br>Ligações: %{z}<extra></extra>')
+    fig.update_layout(
+        height=400,
+        xaxis=dict(tickmode='linear', dtick=1),
+        title=dict(
+            x=0.5,
+            xanchor='center',
+            font=dict(size=16)
+        )
+    )
+    return fig
+
+# Função para gerar o gráfico de ligações por hora, separado por tentativa
+def create_attempts_chart_from_counts(tentativa_counts, title):
+    """
+    Cria gráfico de colunas empilhadas a partir de uma Series (tentativa, hora) -> quantidade
+    """
+    import plotly.express as px
+    
+    if len(tentativa_counts) == 0 or tentativa_counts.sum() == 0:
+        return None
+    
+    dados = tentativa_counts.reset_index()
+    dados['TENTATIVA'] = dados['TENTATIVA'].map(lambda tentativa: f"{tentativa}ª tentativa")
+    
+    fig = px.bar(
+        dados,
+        x='HORA',
+        y='QUANTIDADE',
+        color='TENTATIVA',
+        title=f"<b>{title}</b>",
+        labels={'HORA': 'Hora do Dia', 'QUANTIDADE': 'Número de Ligações', 'TENTATIVA': 'Tentativa'},
+        color_discrete_sequence=px.colors.qualitative.Set2
+    )
+    fig.update_layout(
+        height=400,
+        barmode='stack',
+        xaxis=dict(tickmode='linear', dtick=1),
+        title=dict(
+            x=0.5,
+            xanchor='center',
+            font=dict(size=16)
+        )
+    )
+    return fig
+
+# Função para gerar o gráfico do tempo entre tentativas
+def create_interval_chart(distribuicao, title):
+    """
+    Cria gráfico de colunas a partir da tabela faixas x tentativa de attempt_interval_distribution
+    """
+    import plotly.express as px
+    
+    if distribuicao.empty or distribuicao.to_numpy().sum() == 0:
+        return None
+    
+    dados = distribuicao.reset_index().melt(id_vars='Intervalo', var_name='Tentativa', value_name='Quantidade')
+    fig = px.bar(
+        dados,
+        x='Intervalo',
+        y='Quantidade',
+        color='Tentativa',
+        barmode='group',
+        title=f"<b>{title}</b>",
+        color_discrete_sequence=px.colors.qualitative.Set2
+    )
+    fig.update_layout(
+        height=400,
+        title=dict(
+            x=0.5,
+            xanchor='center',
+            font=dict(size=16)
+        )
+    )
+    return fig
+
+# Função para gerar o gráfico da taxa de atendimento (por hora ou por dia da semana)
+def create_success_rate_chart(tabela, title):
+    """
+    Cria gráfico de colunas da taxa de atendimento, com as ligações no hover
+    """
+    import plotly.express as px
+    
+    if tabela.empty:
+        return None
+    
+    eixo = tabela.index.name
+    fig = px.bar(
+        tabela.reset_index(),
+        x=eixo,
+        y='Taxa (%)',
+        hover_data=['Ligações', 'Atendidas'],
+        title=f"<b>{title}</b>",
+        color='Taxa (%)',
+        color_continuous_scale='Greens'
+    )
+    fig.update_layout(
+        height=400,
+        title=dict(
+            x=0.5,
+            xanchor='center',
+            font=dict(size=16)
+        )
+    )
+    return fig
+
+# Tamanhos de página da lista de observações
+OBSERVATIONS_PAGE_SIZES = [10, 25, 50, 100]
+
+# Função para montar o índice enxuto das observações
+def build_observations_index(df, obs_col):
+    """
+    Tabela só com o que a lista de observações exibe e filtra,
+    montada de forma vetorizada (sem iterrows)
+    """
+    def coluna(col, padrao):
+        if col and col in df.columns:
+            return df[col].astype(object).where(df[col].notna(), padrao).astype(str)
+        return pd.Series(padrao, index=df.index, dtype=object)
+    
+    obs_index = pd.DataFrame({
+        'EMPRESA': coluna('RAZÃO SOCIAL', 'Não informado'),
+        'CNPJ': coluna('CNPJ', 'Não informado'),
+        'SITUAÇÃO': coluna('SITUAÇÃO_NORMALIZADA', 'Não informado'),
+        'OBSERVAÇÃO': coluna(obs_col, 'Sem observação'),
+    })
+    if 'ORIGEM' in df.columns:
+        obs_index['ORIGEM'] = coluna('ORIGEM', '')
+    
+    # Texto de busca sem acentos e em minúsculas
+    obs_index['BUSCA'] = (
+        obs_index['EMPRESA'] + ' ' + obs_index['CNPJ'] + ' ' + obs_index['OBSERVAÇÃO']
+    ).str.lower().str.translate(ACCENT_TABLE)
+    
+    return obs_index.reset_index(drop=True)
+
+# Função para filtrar o índice das observações
+def filter_observations(obs_index, situacoes=None, origens=None, texto=None):
+    """
+    Retorna as posições (no índice) das observações que passam pelos filtros
+    """
+    mask = np.ones(len(obs_index), dtype=bool)
+    if situacoes:
+        mask &= obs_index['SITUAÇÃO'].isin(situacoes).to_numpy()
+    if origens and 'ORIGEM' in obs_index.columns:
+        mask &= obs_index['ORIGEM'].isin(origens).to_numpy()
+    if texto:
+        mask &= obs_index['BUSCA'].str.contains(normalize_text(texto), regex=False).to_numpy()
+    return np.flatnonzero(mask)
+
+# Função para exibir uma página da lista de observações
+def show_observations_page(obs_index, key):
+    """
+    Filtros por situação/planilha/texto e paginação; só as linhas da página
+    atual são enviadas ao navegador
+    """
+    col1, col2, col3 = st.columns([2, 2, 3])
+    
+    with col1:
+        situacoes = st.multiselect("Situação", sorted(obs_index['SITUAÇÃO'].unique()), key=f"{key}_situacoes")
+    
+    with col2:
+        origens = None
+        if 'ORIGEM' in obs_index.columns:
+            origens = st.multiselect("Planilha", sorted(obs_index['ORIGEM'].unique()), key=f"{key}_origens")
+    
+    with col3:
+        texto = st.text_input("Buscar (empresa, CNPJ ou observação)", key=f"{key}_busca")
+    
+    posicoes = filter_observations(obs_index, situacoes, origens, texto.strip())
+    
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        page_size = st.selectbox("Por página", OBSERVATIONS_PAGE_SIZES, key=f"{key}_tamanho")
+    
+    with col2:
+        n_pages = max(1, -(-len(posicoes) // page_size))
+        page_key = f"{key}_pagina"
+        # Voltar para a primeira página quando o filtro reduz o total
+        if st.session_state.get(page_key, 1) > n_pages:
+            st.session_state[page_key] = 1
+        page = st.number_input("Página", min_value=1, max_value=n_pages, step=1, key=page_key)
+    
+    st.caption(f"{len(posicoes)} observações encontradas — página {page} de {n_pages}")
+    
+    inicio = (page - 1) * page_size
+    pagina = obs_index.iloc[posicoes[inicio:inicio + page_size]]
+    for row in pagina.itertuples(index=False):
+        st.markdown(
+            f"### {row.EMPRESA}\n\n"
+            f"**CNPJ:** {row.CNPJ}\n\n"
+            f"**Situação:** `{row.SITUAÇÃO}`\n\n"
+            f"**Observação:** {row.OBSERVAÇÃO}\n\n"
+            "---"
+        )
+
+# Tamanhos de página da tabela de dados completos
+DATA_GRID_PAGE_SIZES = [50, 100, 500, 1000]
+DATA_GRID_ORIGINAL_ORDER = "(ordem original)"
+
+# Função para calcular as posições filtradas e ordenadas da tabela de dados
+def data_grid_positions(df, sort_col=None, ascending=True, filter_col=None, filter_text=None):
+    """
+    Aplica filtro (texto contido na coluna) e ordenação no servidor e retorna
+    só as posições das linhas, sem copiar o DataFrame
+    """
+    posicoes = np.arange(len(df))
+    
+    if filter_col and filter_text:
+        coluna = df[filter_col].astype(object).where(df[filter_col].notna(), '').astype(str)
+        mask = coluna.str.lower().str.contains(filter_text.lower(), regex=False).to_numpy()
+        posicoes = posicoes[mask]
+    
+    if sort_col:
+        coluna = df[sort_col].iloc[posicoes].reset_index(drop=True)
+        if isinstance(coluna.dtype, pd.CategoricalDtype) or coluna.dtype == object:
+            # Tipos misturados (ex.: números e textos) não se comparam: só números ordenam
+            # como números, o resto como texto; nulos continuam nulos (vão para o fim)
+            valores = coluna.astype(object)
+            numeros = pd.to_numeric(valores, errors='coerce')
+            if numeros.notna().sum() == valores.notna().sum():
+                coluna = numeros
+            else:
+                coluna = valores.map(str, na_action='ignore').astype(SCHEMA_STRING_DTYPE)
+        ordem = coluna.sort_values(ascending=ascending, kind='stable', na_position='last').index.to_numpy()
+        posicoes = posicoes[ordem]
+    
+    return posicoes
+
+# Função para exibir a tabela de dados completos em páginas
+def show_data_grid(df, key, cache_key=None):
+    """
+    Tabela paginada: ordenação e filtro rodam no servidor e só a janela
+    de linhas da página atual é enviada ao navegador
+    """
+    colunas = [str(col) for col in df.columns]
+    
+    col1, col2, col3, col4 = st.columns([2, 1, 2, 2])
+    
+    with col1:
+        sort_col = st.selectbox("Ordenar por", [DATA_GRID_ORIGINAL_ORDER] + colunas, key=f"{key}_ordem")
+    
+    with col2:
+        ascending = st.radio("Ordem", ["Crescente", "Decrescente"], key=f"{key}_sentido") == "Crescente"
+    
+    with col3:
+        filter_col = st.selectbox("Filtrar coluna", colunas, key=f"{key}_filtro_coluna")
+    
+    with col4:
+        filter_text = st.text_input("Contém", key=f"{key}_filtro_texto").strip()
+    
+    sort_col = None if sort_col == DATA_GRID_ORIGINAL_ORDER else sort_col
+    if cache_key is not None:
+        posicoes = cached_data_grid_positions(cache_key, key, sort_col, ascending, filter_col, filter_text, df)
+    else:
+        posicoes = data_grid_positions(df, sort_col, ascending, filter_col, filter_text)
+    
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        page_size = st.selectbox("Linhas por página", DATA_GRID_PAGE_SIZES, key=f"{key}_tamanho")
+    
+    with col2:
+        n_pages = max(1, -(-len(posicoes) // page_size))
+        page_key = f"{key}_pagina"
+        # Voltar para a primeira página quando o filtro reduz o total
+        if st.session_state.get(page_key, 1) > n_pages:
+            st.session_state[page_key] = 1
+        page = st.number_input("Página", min_value=1, max_value=n_pages, step=1, key=page_key)
+    
+    inicio = (page - 1) * page_size
+    st.caption(
+        f"Linhas {min(inicio + 1, len(posicoes))}–{min(inicio + page_size, len(posicoes))} "
+        f"de {len(posicoes)} (página {page} de {n_pages})"
+    )
+    st.dataframe(df.iloc[posicoes[inicio:inicio + page_size]], use_container_width=True)
+
 # Função para exibir observações importantes
-def show_important_observations(df, title):
+def show_important_observations(df, title, situacao_counts=None, cache_key=None):
     """
     Exibe observações importantes (excluindo "Não atende")
+    situacao_counts (opcional) traz as contagens por situação já agregadas no cubo
+    cache_key (opcional, ex.: hash do arquivo) memoriza o índice das observações entre reruns
     """
     if 'SITUAÇÃO_NORMALIZADA' not in df.columns:
         # Procurar coluna de observação
@@ -361,7 +1597,14 @@ def show_important_observations(df, title):
     # Filtrar observações onde a situação NÃO é "Não atende"
     mask = df[situacao_col] != "Não atende"
     
-    df_filtrado = df[mask].copy()
+    df_filtrado = df[mask]
+    
+    if situacao_counts is None:
+        situacao_counts = count_situacoes(df[situacao_col])
+    situacoes_counts = situacao_counts.drop("Não atende", errors='ignore')
+    
+    # Com as contagens do cubo, df pode vir já filtrado: o total sai das contagens
+    total = int(situacao_counts.sum()) if len(situacao_counts) else len(df)
     
     if len(df_filtrado) > 0:
         st.subheader(f"📝 {title}")
@@ -373,280 +1616,1143 @@ def show_important_observations(df, title):
             st.metric("Observações Importantes", len(df_filtrado))
         
         with col2:
-            st.metric("Porcentagem do Total", f"{(len(df_filtrado)/len(df)*100):.1f}%")
+            st.metric("Porcentagem do Total", f"{(len(df_filtrado)/total*100):.1f}%")
         
         with col3:
-            situacoes_unicas = df_filtrado[situacao_col].nunique()
-            st.metric("Situações Diferentes", situacoes_unicas)
+            st.metric("Situações Diferentes", len(situacoes_counts))
         
         # Resumo das situações
         st.markdown("**Situações encontradas:**")
-        situacoes_counts = df_filtrado[situacao_col].value_counts()
         for situacao, count in situacoes_counts.items():
             st.markdown(f"- **{situacao}**: {count} ocorrências")
         
-        # Tabela expandível
+        # Tabela expandível (paginada: só a página visível é renderizada)
         with st.expander("🔍 Ver detalhes das observações"):
-            for idx, row in df_filtrado.iterrows():
-                # Obter nome da empresa
-                empresa = 'Não informado'
-                for col in ['RAZÃO SOCIAL', 'RAZÃO SOCIAL']:
-                    if col in row and not pd.isna(row[col]):
-                        empresa = row[col]
-                        break
-                
-                # Obter CNPJ
-                cnpj = 'Não informado'
-                for col in ['CNPJ']:
-                    if col in row and not pd.isna(row[col]):
-                        cnpj = row[col]
-                        break
-                
-                # Obter observação
-                observacao = 'Sem observação'
-                if obs_col in row and not pd.isna(row[obs_col]):
-                    observacao = row[obs_col]
-                
-                st.markdown(f"### {empresa}")
-                st.markdown(f"**CNPJ:** {cnpj}")
-                st.markdown(f"**Situação:** `{row[situacao_col]}`")
-                st.markdown(f"**Observação:** {observacao}")
-                st.markdown("---")
+            if cache_key is not None:
+                obs_index = cached_observations_index(cache_key, title, obs_col, df_filtrado)
+            else:
+                obs_index = build_observations_index(df_filtrado, obs_col)
+            show_observations_page(obs_index, key=f"obs_{title}")
     else:
         st.info(f"Não há observações importantes em {title} (todas são 'Não atende')")
 
+# Função para exibir a linha do tempo das tentativas de contato
+def show_attempt_timeline(df, sheet_name, cache_key=None):
+    """
+    Tempo entre tentativas, taxa de atendimento por hora e dia da semana e
+    melhor horário por situação, todos lidos da mesma tabela de tentativas
+    """
+    st.subheader("⏱️ Linha do Tempo das Tentativas")
+    
+    if cache_key is not None:
+        events = cached_attempt_events(cache_key, sheet_name, df)
+    else:
+        events = build_attempt_events(df)
+    
+    if events.empty:
+        st.info("Não há tentativas com data para analisar")
+        return
+    
+    distribuicao, resumo = attempt_interval_distribution(events)
+    por_hora, por_dia = attempt_success_rates(events)
+    
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("Tentativas", len(events))
+    with col2:
+        st.metric("Empresas com 2+ tentativas", int(events.loc[events['INTERVALO_HORAS'].notna(), 'LINHA'].nunique()))
+    with col3:
+        mediana = resumo['Mediana (h)']
+        st.metric("Mediana entre tentativas", f"{mediana / 24:.1f} dias" if mediana is not None else "-")
+    with col4:
+        finais = int(events['ULTIMA'].sum())
+        st.metric("Taxa de atendimento", f"{100 * events['ATENDIDA'].sum() / max(finais, 1):.1f}%")
+    
+    if resumo['Fora de ordem']:
+        st.caption(f"{resumo['Fora de ordem']} tentativas com data anterior à tentativa anterior ficaram fora da distribuição")
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        fig_intervalos = create_interval_chart(distribuicao, f"Tempo entre Tentativas - {sheet_name}")
+        if fig_intervalos:
+            st.plotly_chart(fig_intervalos, use_container_width=True)
+    with col2:
+        fig_taxa = create_success_rate_chart(por_hora, f"Taxa de Atendimento por Hora - {sheet_name}")
+        if fig_taxa:
+            st.plotly_chart(fig_taxa, use_container_width=True)
+    
+    # Recomendação geral: hora com a maior taxa entre as que têm ligações suficientes
+    elegiveis = por_hora[por_hora['Ligações'] >= TIMELINE_MIN_LIGACOES]
+    if not elegiveis.empty and elegiveis['Atendidas'].sum() > 0:
+        melhor = elegiveis['Taxa (%)'].idxmax()
+        st.success(
+            f"📞 Melhor horário para ligar: **{melhor}** "
+            f"({elegiveis.loc[melhor, 'Taxa (%)']}% de atendimento em {elegiveis.loc[melhor, 'Ligações']} ligações)"
+        )
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        st.markdown("**Atendimento por dia da semana**")
+        st.dataframe(por_dia, use_container_width=True)
+    with col2:
+        st.markdown("**Melhor horário por situação**")
+        st.dataframe(best_call_times(events), use_container_width=True, hide_index=True)
+
+# Índice de empresas por CNPJ
+# Cada CNPJ (14 dígitos, já normalizado em apply_schema) vira um código inteiro e as
+# ocorrências ficam agrupadas por código: achar uma empresa em todas as planilhas
+# custa uma consulta no dicionário mais o tamanho do grupo
+
+# Função para normalizar um CNPJ digitado (pontuação removida, zeros à esquerda)
+def normalize_cnpj(valor):
+    digitos = re.sub(r'\D', '', str(valor or ''))
+    return digitos.zfill(SCHEMA_DIGIT_COLUMNS['CNPJ']) if digitos else None
+
+# Função para montar o índice de CNPJs das planilhas
+def build_cnpj_index(dfs_clean):
+    """
+    Retorna um dicionário com:
+      planilhas: planilhas com coluna CNPJ; codigos: {cnpj: código}; cnpjs: CNPJ de cada código
+      codigo, planilha, linha: uma entrada por ocorrência, agrupadas por código
+      (linha = posição na planilha); inicio: onde começa o grupo de cada código
+      sem_cnpj: linhas sem CNPJ por planilha
+    """
+    planilhas = [sheet_name for sheet_name, df in dfs_clean.items() if 'CNPJ' in df.columns]
+    partes_cnpj, partes_planilha, partes_linha = [], [], []
+    sem_cnpj = {}
+    
+    for i, sheet_name in enumerate(planilhas):
+        cnpj = dfs_clean[sheet_name]['CNPJ']
+        validos = cnpj.notna().to_numpy()
+        partes_cnpj.append(cnpj.to_numpy(dtype=object)[validos])
+        partes_planilha.append(np.full(int(validos.sum()), i, dtype='int64'))
+        partes_linha.append(np.flatnonzero(validos))
+        sem_cnpj[sheet_name] = int((~validos).sum())
+    
+    cnpj = np.concatenate(partes_cnpj) if partes_cnpj else np.array([], dtype=object)
+    codigos, cnpjs = pd.factorize(cnpj)
+    ordem = np.argsort(codigos, kind='stable')
+    
+    return {
+        'planilhas': planilhas,
+        'codigos': dict(zip(cnpjs, range(len(cnpjs)))),
+        'cnpjs': np.asarray(cnpjs, dtype=object),
+        'codigo': codigos[ordem],
+        'planilha': np.concatenate(partes_planilha)[ordem] if partes_planilha else np.array([], dtype='int64'),
+        'linha': np.concatenate(partes_linha)[ordem] if partes_linha else np.array([], dtype='int64'),
+        'inicio': np.r_[0, np.cumsum(np.bincount(codigos, minlength=len(cnpjs)))],
+        'sem_cnpj': sem_cnpj,
+    }
+
+# Função para encontrar uma empresa em todas as planilhas
+def lookup_cnpj(index, dfs_clean, cnpj):
+    """
+    Retorna as linhas do CNPJ em todas as planilhas (coluna PLANILHA na frente),
+    ou um DataFrame vazio se ele não existir
+    """
+    # Células de texto com menos de 14 dígitos ficam como digitadas, sem os zeros à esquerda
+    digitos = re.sub(r'\D', '', str(cnpj or ''))
+    codigo = index['codigos'].get(normalize_cnpj(cnpj), index['codigos'].get(digitos))
+    if codigo is None:
+        return pd.DataFrame()
+    
+    inicio, fim = index['inicio'][codigo], index['inicio'][codigo + 1]
+    planilhas, linhas = index['planilha'][inicio:fim], index['linha'][inicio:fim]
+    
+    partes = []
+    for i in dict.fromkeys(planilhas):
+        sheet_name = index['planilhas'][i]
+        linhas_planilha = dfs_clean[sheet_name].iloc[linhas[planilhas == i]]
+        partes.append(linhas_planilha.assign(PLANILHA=sheet_name)[['PLANILHA', *linhas_planilha.columns]])
+    return pd.concat(partes, ignore_index=True)
+
+# Função para calcular as métricas sem contar a mesma empresa duas vezes
+def cnpj_summary(index, resolucao=None):
+    """
+    Com resolucao (resolve_company_names), linhas sem CNPJ válido vinculadas pelo nome
+    deixam de contar como empresas separadas
+    """
+    n_planilhas = max(len(index['planilhas']), 1)
+    pares = np.unique(index['codigo'] * n_planilhas + index['planilha'])
+    planilhas_por_cnpj = np.bincount(pares // n_planilhas, minlength=len(index['cnpjs']))
+    sem_cnpj = sum(index['sem_cnpj'].values())
+    
+    resumo = {
+        # Sem a vinculação pelo nome, cada linha sem CNPJ conta como uma empresa
+        'Empresas únicas': len(index['cnpjs']) + sem_cnpj,
+        'CNPJs distintos': len(index['cnpjs']),
+        'CNPJs em mais de uma planilha': int((planilhas_por_cnpj > 1).sum()),
+        'Linhas repetidas': len(index['codigo']) - len(index['cnpjs']),
+        'Linhas sem CNPJ': sem_cnpj,
+    }
+    if resolucao is not None:
+        resumo['Empresas únicas'] = resolucao['empresas']
+        resumo['Vinculadas pelo nome'] = resolucao['vinculados']
+    return resumo
+
+# Função para obter a situação mais recente de cada CNPJ
+def latest_situation_by_cnpj(index, dfs_clean):
+    """
+    Uma linha por CNPJ, com a ocorrência mais recente: maior PERÍODO (vários arquivos),
+    depois a última tentativa de contato, depois a ordem das planilhas e das linhas.
+    Uma única ordenação (lexsort) sobre todas as ocorrências.
+    """
+    n = len(index['codigo'])
+    periodo = np.full(n, -1, dtype='int64')
+    momento = np.full(n, np.iinfo('int64').min, dtype='int64')
+    situacao = np.full(n, None, dtype=object)
+    razao = np.full(n, None, dtype=object)
+    arquivo = np.full(n, None, dtype=object)
+    
+    for i, sheet_name in enumerate(index['planilhas']):
+        df = dfs_clean[sheet_name]
+        mask = index['planilha'] == i
+        linhas = index['linha'][mask]
+        
+        if 'PERÍODO' in df.columns:
+            # "AAAA-MM" vira AAAAMM; "Sem período" fica como o mais antigo
+            ordem_periodos = np.array([
+                int(p.replace('-', '')) if p != SEM_PERIODO else -1 for p in df['PERÍODO'].cat.categories
+            ], dtype='int64')
+            periodo[mask] = ordem_periodos[df['PERÍODO'].cat.codes.to_numpy()[linhas]]
+        if 'ARQUIVO' in df.columns:
+            arquivo[mask] = df['ARQUIVO'].to_numpy(dtype=object)[linhas]
+        
+        # Última tentativa de cada linha (datas sem ano já resolvidas)
+        events = build_attempt_events(df)
+        if not events.empty:
+            ultima = np.full(len(df), np.iinfo('int64').min, dtype='int64')
+            np.maximum.at(ultima, events['LINHA'].to_numpy(), events['MOMENTO'].to_numpy(dtype='datetime64[ns]').view('int64'))
+            momento[mask] = ultima[linhas]
+        
+        if 'SITUAÇÃO_NORMALIZADA' in df.columns:
+            situacao[mask] = df['SITUAÇÃO_NORMALIZADA'].to_numpy(dtype=object)[linhas]
+        if 'RAZÃO SOCIAL' in df.columns:
+            razao[mask] = df['RAZÃO SOCIAL'].to_numpy(dtype=object, na_value=None)[linhas]
+    
+    ordem = np.lexsort((index['linha'], index['planilha'], momento, periodo, index['codigo']))
+    codigo = index['codigo'][ordem]
+    fim_do_grupo = np.ones(n, dtype=bool)
+    fim_do_grupo[:-1] = codigo[1:] != codigo[:-1]
+    ultimas = ordem[fim_do_grupo]
+    
+    resultado = pd.DataFrame({
+        'CNPJ': index['cnpjs'][index['codigo'][ultimas]],
+        'RAZÃO SOCIAL': razao[ultimas],
+        'SITUAÇÃO': situacao[ultimas],
+        'PLANILHA': np.array(index['planilhas'] + [None], dtype=object)[index['planilha'][ultimas]],
+        # O menor int64 é o NaT do datetime64
+        'ÚLTIMA TENTATIVA': momento[ultimas].view('datetime64[ns]'),
+        'OCORRÊNCIAS': np.diff(index['inicio'])[index['codigo'][ultimas]],
+    })
+    if (periodo >= 0).any() or any('ARQUIVO' in dfs_clean[s].columns for s in index['planilhas']):
+        resultado.insert(4, 'ARQUIVO', arquivo[ultimas])
+    return resultado
+
+# Vinculação de empresas pela RAZÃO SOCIAL (linhas sem CNPJ ou com CNPJ inválido)
+# Os nomes são normalizados, agrupados em blocos por palavra rara (e pelas 4 primeiras
+# letras dela, para pegar erros de digitação) e só os pares dentro de um mesmo bloco são
+# comparados, pela similaridade de Jaccard dos trigramas de caracteres
+FUZZY_THRESHOLD = float(os.environ.get("RELATORIO_FUZZY_THRESHOLD", "0.7"))
+# Blocos maiores que isso são palavras comuns demais ("transportes") e não formam pares
+FUZZY_MAX_BLOCK = 50
+FUZZY_MAX_NAME_LENGTH = 64
+# Formas jurídicas e conectivos ignorados na comparação
+NOMES_IGNORADOS = {
+    'ltda', 'me', 'epp', 'eireli', 'sa', 'cia', 'mei', 'limitada', 'companhia',
+    'de', 'da', 'do', 'das', 'dos', 'em', 'e',
+}
+_NOMES_IGNORADOS_PATTERN = r'\b(?:' + '|'.join(sorted(NOMES_IGNORADOS)) + r'|[a-z0-9])\b'
+_CNPJ_PESOS_1 = np.array([5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2])
+_CNPJ_PESOS_2 = np.array([6, 5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2])
+
+# Função para validar os dígitos verificadores de vários CNPJs de uma vez
+def valid_cnpj_mask(cnpjs):
+    cnpjs = pd.Series(cnpjs, dtype=object)
+    validos = (
+        cnpjs.str.fullmatch(r'\d{14}').fillna(False).astype(bool)
+        & ~cnpjs.str.fullmatch(r'(\d)\1{13}').fillna(False).astype(bool)
+    ).to_numpy().copy()
+    
+    if validos.any():
+        digitos = np.frombuffer("".join(cnpjs[validos]).encode("ascii"), dtype=np.uint8).reshape(-1, 14) - ord('0')
+        resto_1 = digitos[:, :12] @ _CNPJ_PESOS_1 % 11
+        resto_2 = digitos[:, :13] @ _CNPJ_PESOS_2 % 11
+        dv_1 = np.where(resto_1 < 2, 0, 11 - resto_1)
+        dv_2 = np.where(resto_2 < 2, 0, 11 - resto_2)
+        validos[validos] = (digitos[:, 12] == dv_1) & (digitos[:, 13] == dv_2)
+    return validos
+
+# Função para obter os valores distintos de um vetor de inteiros, em ordem
+def _sorted_unique(valores):
+    # Ordenar e descartar repetidos vizinhos é mais rápido que np.unique para vetores grandes
+    valores = np.sort(valores)
+    return valores[np.r_[True, valores[1:] != valores[:-1]]] if len(valores) else valores
+
+# Função para normalizar nomes de empresas para comparação
+def normalize_company_names(nomes):
+    """
+    Cada nome distinto é normalizado uma única vez (normalize_text), sem pontuação,
+    formas jurídicas e conectivos. Retorna (código do nome normalizado por valor, nomes normalizados).
+    """
+    codes, uniques = pd.factorize(pd.Series(nomes, dtype=object), use_na_sentinel=True)
+    
+    # Pontuação, palavras ignoradas e letras soltas saem com substituições vetorizadas
+    normalizados = (
+        pd.Series([normalize_text(nome) for nome in uniques] + [""], dtype=SCHEMA_STRING_DTYPE)
+        .str.replace(r'[^a-z0-9]+', ' ', regex=True)
+        .str.replace(_NOMES_IGNORADOS_PATTERN, ' ', regex=True)
+        .str.replace(r'\s+', ' ', regex=True)
+        .str.strip()
+    )
+    
+    # Valores vazios (código -1) viram o último nome: o vazio
+    nome_codes, nomes_normalizados = pd.factorize(normalizados.to_numpy(dtype=object))
+    return nome_codes[codes], np.asarray(nomes_normalizados, dtype=object)
+
+# Função para listar os trigramas de cada nome
+def _name_trigrams(nomes):
+    """
+    Retorna (chaves ordenadas nome << 24 | trigrama, início de cada nome nas chaves).
+    Os nomes viram uma matriz de bytes e os trigramas saem por deslocamento das colunas.
+    """
+    largura = FUZZY_MAX_NAME_LENGTH + 2
+    texto = [f" {nome} ".encode("ascii", "ignore")[:largura] for nome in nomes]
+    tamanhos = np.array([len(t) for t in texto], dtype='int64')
+    matriz = np.frombuffer(b"".join(t.ljust(largura, b"\0") for t in texto), dtype=np.uint8)
+    matriz = matriz.reshape(len(nomes), largura).astype('int64')
+    
+    trigramas = (matriz[:, :-2] << 16) | (matriz[:, 1:-1] << 8) | matriz[:, 2:]
+    presentes = np.arange(largura - 2) < (tamanhos - 2)[:, None]
+    linhas = np.nonzero(presentes)[0]
+    chaves = _sorted_unique((linhas << 24) | trigramas[presentes])
+    inicio = np.searchsorted(chaves >> 24, np.arange(len(nomes) + 1))
+    return chaves, inicio
+
+# Função para gerar os pares de nomes candidatos (mesmo bloco)
+def _candidate_pairs(nomes, pendentes):
+    """
+    Blocos: palavras dos nomes e os 4 primeiros caracteres das palavras longas.
+    Só blocos com até FUZZY_MAX_BLOCK nomes, e só pares com ao menos um nome pendente.
+    """
+    palavras = pd.Series(nomes, dtype=object).str.split().explode().dropna()
+    palavras = palavras[palavras.str.len() > 1]
+    prefixos = palavras[palavras.str.len() > 4].str[:4] + "*"
+    blocos = pd.concat([palavras, prefixos])
+    
+    postagens = pd.DataFrame({'NOME': blocos.index.to_numpy(), 'BLOCO': blocos.to_numpy()}).drop_duplicates()
+    postagens['BLOCO'] = pd.factorize(postagens['BLOCO'])[0]
+    tamanho = postagens.groupby('BLOCO')['NOME'].transform('size')
+    com_pendente = pd.Series(pendentes[postagens['NOME'].to_numpy()], index=postagens.index).groupby(postagens['BLOCO']).transform('any')
+    postagens = postagens[(tamanho > 1) & (tamanho <= FUZZY_MAX_BLOCK) & com_pendente].sort_values(['BLOCO', 'NOME'])
+    
+    membros = postagens['NOME'].to_numpy()
+    blocos_id = postagens['BLOCO'].to_numpy()
+    inicios = np.flatnonzero(np.r_[True, blocos_id[1:] != blocos_id[:-1]]) if len(blocos_id) else np.array([], dtype='int64')
+    tamanhos = np.diff(np.r_[inicios, len(blocos_id)])
+    
+    # Blocos do mesmo tamanho geram os pares juntos (índices do triângulo superior)
+    pares_a, pares_b = [], []
+    for tamanho_bloco in np.unique(tamanhos):
+        grupo = membros[inicios[tamanhos == tamanho_bloco][:, None] + np.arange(tamanho_bloco)]
+        i, j = np.triu_indices(tamanho_bloco, 1)
+        pares_a.append(grupo[:, i].ravel())
+        pares_b.append(grupo[:, j].ravel())
+    
+    if not pares_a:
+        return np.array([], dtype='int64'), np.array([], dtype='int64')
+    a, b = np.concatenate(pares_a), np.concatenate(pares_b)
+    manter = pendentes[a] | pendentes[b]
+    pares = _sorted_unique(a[manter] * len(nomes) + b[manter])
+    return pares // len(nomes), pares % len(nomes)
+
+# Função para calcular a similaridade de Jaccard dos trigramas de cada par
+def _trigram_jaccard(chaves, inicio, a, b, minimo=None, lote=200_000):
+    quantidades = np.diff(inicio)
+    similaridade = np.zeros(len(a))
+    
+    # Jaccard nunca passa de menor/maior: pares com tamanhos muito diferentes não são comparados
+    if minimo:
+        comparar = np.flatnonzero(np.minimum(quantidades[a], quantidades[b]) >= minimo * np.maximum(quantidades[a], quantidades[b]))
+        similaridade[comparar] = _trigram_jaccard(chaves, inicio, a[comparar], b[comparar], lote=lote)
+        return similaridade
+    
+    for ini in range(0, len(a), lote):
+        pa, pb = a[ini:ini + lote], b[ini:ini + lote]
+        # Trigramas de cada nome "a", procurados entre os trigramas do nome "b"
+        repeticoes = quantidades[pa]
+        par = np.repeat(np.arange(len(pa)), repeticoes)
+        deslocamento = np.arange(repeticoes.sum()) - np.repeat(np.cumsum(repeticoes) - repeticoes, repeticoes)
+        trigramas = chaves[np.repeat(inicio[pa], repeticoes) + deslocamento] & 0xFFFFFF
+        procurados = (pb[par] << 24) | trigramas
+        posicoes = np.minimum(np.searchsorted(chaves, procurados), len(chaves) - 1)
+        comuns = np.bincount(par, weights=chaves[posicoes] == procurados, minlength=len(pa))
+        uniao = quantidades[pa] + quantidades[pb] - comuns
+        similaridade[ini:ini + lote] = comuns / np.maximum(uniao, 1)
+    return similaridade
+
+# Função para achar os grupos (componentes conexos) de um grafo de pares
+def _connected_components(n, a, b):
+    rotulo = np.arange(n)
+    while len(a):
+        menor = np.minimum(rotulo[a], rotulo[b])
+        novo = rotulo.copy()
+        np.minimum.at(novo, a, menor)
+        np.minimum.at(novo, b, menor)
+        novo = novo[novo]
+        if np.array_equal(novo, rotulo):
+            break
+        rotulo = novo
+    return rotulo
+
+# Função para vincular as empresas sem CNPJ válido às demais pela RAZÃO SOCIAL
+def resolve_company_names(dfs_clean, index, threshold=None):
+    """
+    Cada CNPJ do índice e cada linha sem CNPJ é um registro. Nomes parecidos
+    (similaridade >= threshold) formam grupos; um grupo só junta registros quando
+    algum deles não tem CNPJ válido, e dois CNPJs válidos nunca viram a mesma empresa.
+    Retorna o total de empresas, quantos registros foram vinculados e a tabela dos grupos.
+    """
+    threshold = FUZZY_THRESHOLD if threshold is None else threshold
+    
+    # Registros: CNPJs do índice (nome da primeira ocorrência) e linhas sem CNPJ
+    n_cnpjs = len(index['cnpjs'])
+    primeiras_planilha = index['planilha'][index['inicio'][:-1]]
+    primeiras_linha = index['linha'][index['inicio'][:-1]]
+    nomes = np.full(n_cnpjs, None, dtype=object)
+    planilhas = np.array(index['planilhas'] + [None], dtype=object)[primeiras_planilha] if n_cnpjs else np.array([], dtype=object)
+    sem_cnpj_nomes, sem_cnpj_planilhas = [], []
+    
+    for sheet_name, df in dfs_clean.items():
+        razao = df['RAZÃO SOCIAL'].to_numpy(dtype=object, na_value=None) if 'RAZÃO SOCIAL' in df.columns else np.full(len(df), None, dtype=object)
+        if sheet_name in index['planilhas']:
+            i = index['planilhas'].index(sheet_name)
+            nomes[primeiras_planilha == i] = razao[primeiras_linha[primeiras_planilha == i]]
+            sem_cnpj = df['CNPJ'].isna().to_numpy()
+        else:
+            sem_cnpj = np.ones(len(df), dtype=bool)
+        sem_cnpj_nomes.append(razao[sem_cnpj])
+        sem_cnpj_planilhas.append(np.full(int(sem_cnpj.sum()), sheet_name, dtype=object))
+    
+    registros_nome = np.concatenate([nomes, *sem_cnpj_nomes])
+    registros_planilha = np.concatenate([planilhas, *sem_cnpj_planilhas])
+    registros_cnpj = np.concatenate([index['cnpjs'], np.full(len(registros_nome) - n_cnpjs, None, dtype=object)])
+    valido = np.zeros(len(registros_nome), dtype=bool)
+    valido[:n_cnpjs] = valid_cnpj_mask(index['cnpjs'])
+    
+    # Comparação no nível dos nomes normalizados distintos
+    nome_codes, nomes_normalizados = normalize_company_names(registros_nome)
+    pendentes = np.zeros(len(nomes_normalizados), dtype=bool)
+    pendentes[nome_codes[~valido]] = True
+    
+    a, b = _candidate_pairs(nomes_normalizados, pendentes)
+    if len(a):
+        # Trigramas só dos nomes que aparecem em algum par
+        usados, locais = np.unique(np.r_[a, b], return_inverse=True)
+        chaves, inicio = _name_trigrams(nomes_normalizados[usados])
+        aceitos = _trigram_jaccard(chaves, inicio, locais[:len(a)], locais[len(a):], minimo=threshold) >= threshold
+        a, b = a[aceitos], b[aceitos]
+    grupo_nome = _connected_components(len(nomes_normalizados), a, b)
+    
+    # Registros sem nome não se juntam a nada
+    grupo = grupo_nome[nome_codes]
+    sem_nome = nomes_normalizados[nome_codes] == ""
+    grupo[sem_nome] = len(nomes_normalizados) + np.arange(int(sem_nome.sum()))
+    
+    # Empresas: cada CNPJ válido, mais cada grupo que não tem nenhum CNPJ válido
+    grupos, grupo = np.unique(grupo, return_inverse=True)
+    com_valido = np.bincount(grupo, weights=valido, minlength=len(grupos)) > 0
+    tamanho = np.bincount(grupo, minlength=len(grupos))
+    empresas = int(valido.sum() + (~com_valido).sum())
+    
+    # Grupos com mais de um registro e algum sem CNPJ válido
+    pendentes_por_grupo = np.bincount(grupo, weights=~valido, minlength=len(grupos))
+    mostrar = (tamanho[grupo] > 1) & (pendentes_por_grupo[grupo] > 0)
+    vinculados = int((mostrar & ~valido).sum())
+    
+    tabela = pd.DataFrame({
+        'GRUPO': grupo[mostrar],
+        'CNPJ': registros_cnpj[mostrar],
+        'CNPJ VÁLIDO': valido[mostrar],
+        'RAZÃO SOCIAL': registros_nome[mostrar],
+        'PLANILHA': registros_planilha[mostrar],
+    }).sort_values(['GRUPO', 'CNPJ VÁLIDO'], ascending=[True, False], kind='stable')
+    tabela['GRUPO'] = pd.factorize(tabela['GRUPO'])[0] + 1
+    
+    return {'empresas': empresas, 'vinculados': vinculados, 'grupos': tabela.reset_index(drop=True)}
+
+# Função para exibir a busca por CNPJ e a situação mais recente de cada empresa
+def show_cnpj_section(dfs_clean, cnpj_index, resumo_cnpj, cache_key=None):
+    st.subheader("🔗 Empresas por CNPJ")
+    
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("CNPJs distintos", resumo_cnpj['CNPJs distintos'])
+    with col2:
+        st.metric("Em mais de uma planilha", resumo_cnpj['CNPJs em mais de uma planilha'])
+    with col3:
+        st.metric("Registros repetidos", resumo_cnpj['Linhas repetidas'])
+    with col4:
+        st.metric("Vinculadas pelo nome", resumo_cnpj.get('Vinculadas pelo nome', 0),
+                  help="Linhas sem CNPJ (ou com CNPJ inválido) ligadas a outra empresa pela razão social")
+    
+    cnpj = st.text_input("🔎 Buscar empresa pelo CNPJ", key="busca_cnpj", placeholder="00.000.000/0000-00")
+    if cnpj.strip():
+        encontradas = lookup_cnpj(cnpj_index, dfs_clean, cnpj)
+        if encontradas.empty:
+            st.info("CNPJ não encontrado nas planilhas")
+        else:
+            st.dataframe(encontradas, use_container_width=True, hide_index=True)
+    
+    if cache_key is not None:
+        grupos = cached_company_resolution(cache_key, dfs_clean)['grupos']
+        if not grupos.empty:
+            with st.expander(f"🧩 Empresas vinculadas pela razão social ({grupos['GRUPO'].nunique()} grupos)"):
+                show_data_grid(grupos, key="grid_grupos_nome", cache_key=cache_key)
+    
+    with st.expander("🏷️ Situação mais recente por CNPJ"):
+        if cache_key is not None:
+            recentes = cached_latest_situation(cache_key, dfs_clean)
+        else:
+            recentes = latest_situation_by_cnpj(cnpj_index, dfs_clean)
+        show_data_grid(recentes, key="grid_cnpj", cache_key=cache_key)
+
+# Cubo de métricas: uma única agregação por planilha que alimenta o painel,
+# a tabela resumo e o relatório HTML
+CUBE_CONTACT_COLUMNS = {'TEL 1': 'COM TEL 1', 'TEL 2': 'COM TEL 2', 'E-MAIL': 'COM E-MAIL'}
+
+# Função para agregar uma planilha no cubo de métricas
+def build_metrics_cube(df, sheet_name):
+    """
+    Conta as linhas por situação x presença de TEL 1/TEL 2/E-MAIL e as
+    ligações por situação x tentativa x dia da semana x hora, em uma única passada pela planilha
+    """
+    situacao = (
+        df['SITUAÇÃO_NORMALIZADA'].astype(object)
+        if 'SITUAÇÃO_NORMALIZADA' in df.columns
+        else pd.Series(None, index=df.index, dtype=object)
+    )
+    
+    dimensoes = {'SITUAÇÃO': situacao}
+    for col, dim in CUBE_CONTACT_COLUMNS.items():
+        dimensoes[dim] = df[col].notna() if col in df.columns else pd.Series(False, index=df.index)
+    
+    contatos = (
+        pd.DataFrame(dimensoes)
+        .groupby(list(dimensoes), dropna=False, sort=False)
+        .size()
+        .reset_index(name='QUANTIDADE')
+    )
+    contatos.insert(0, 'PLANILHA', sheet_name)
+    
+    horas = call_hour_counts(df)
+    horas.insert(0, 'PLANILHA', sheet_name)
+    
+    return {
+        'planilhas': [sheet_name],
+        'colunas': [col for col in [*CUBE_CONTACT_COLUMNS, 'SITUAÇÃO_NORMALIZADA'] if col in df.columns],
+        'contatos': contatos,
+        'horas': horas,
+    }
+
+# Função para somar cubos de várias planilhas (consolidado)
+def combine_cubes(cubes):
+    cubes = list(cubes)
+    colunas = []
+    for cube in cubes:
+        colunas += [col for col in cube['colunas'] if col not in colunas]
+    
+    return {
+        'planilhas': [planilha for cube in cubes for planilha in cube['planilhas']],
+        'colunas': colunas,
+        'contatos': pd.concat([cube['contatos'] for cube in cubes], ignore_index=True),
+        'horas': pd.concat([cube['horas'] for cube in cubes], ignore_index=True),
+    }
+
+# Função para obter a contagem por situação a partir do cubo
+def cube_situacao_counts(cube, excluir=None):
+    contatos = cube['contatos']
+    if excluir is not None:
+        contatos = contatos[contatos['SITUAÇÃO'] != excluir]
+    counts = contatos.groupby('SITUAÇÃO')['QUANTIDADE'].sum()
+    counts = counts[counts > 0].sort_values(ascending=False, kind='stable')
+    counts.index.name = 'SITUAÇÃO_NORMALIZADA'
+    return counts.rename('count')
+
+# Função para obter as ligações por hora a partir do cubo
+def cube_hour_counts(cube, sheet_name=None):
+    horas = cube['horas']
+    if sheet_name is not None:
+        horas = horas[horas['PLANILHA'] == sheet_name]
+    return horas.groupby('HORA')['QUANTIDADE'].sum().sort_index()
+
+# Função para obter as ligações por dia da semana x hora a partir do cubo
+def cube_weekday_hour_counts(cube):
+    """
+    Matriz 7 x 24 (segunda a domingo x 0h a 23h)
+    """
+    horas = cube['horas']
+    matriz = np.zeros((7, 24), dtype='int64')
+    np.add.at(matriz, (horas['DIA_SEMANA'].to_numpy(), horas['HORA'].to_numpy()), horas['QUANTIDADE'].to_numpy())
+    return pd.DataFrame(matriz, index=DIAS_SEMANA, columns=range(24))
+
+# Função para obter as ligações por tentativa x hora a partir do cubo
+def cube_attempt_hour_counts(cube):
+    return cube['horas'].groupby(['TENTATIVA', 'HORA'])['QUANTIDADE'].sum()
+
+# Função para contar linhas do cubo que satisfazem uma condição de presença
+def cube_count(cube, **presenca):
+    """
+    Ex.: cube_count(cube, **{'COM TEL 1': True, 'COM TEL 2': False})
+    """
+    contatos = cube['contatos']
+    mask = pd.Series(True, index=contatos.index)
+    for dim, valor in presenca.items():
+        mask &= contatos[dim] == valor
+    return int(contatos.loc[mask, 'QUANTIDADE'].sum())
+
+# Função para calcular métricas a partir do cubo
+def metrics_from_cube(cube, sheet_name):
+    """
+    Mesmas métricas de calculate_metrics, lidas do cubo
+    """
+    metrics = {
+        'Planilha': sheet_name,
+        'Total Empresas': cube_count(cube),
+    }
+    
+    # Telefones
+    tel1_count = 0
+    tel2_count = 0
+    if 'TEL 1' in cube['colunas']:
+        tel1_count = cube_count(cube, **{'COM TEL 1': True})
+        metrics['Com Telefone 1'] = tel1_count
+    
+    if 'TEL 2' in cube['colunas']:
+        tel2_count = cube_count(cube, **{'COM TEL 2': True})
+        metrics['Com Telefone 2'] = tel2_count
+    
+    metrics['Total Telefones'] = tel1_count + tel2_count
+    
+    # Emails
+    if 'E-MAIL' in cube['colunas']:
+        metrics['Com Email'] = cube_count(cube, **{'COM E-MAIL': True})
+    
+    # Situações
+    if 'SITUAÇÃO_NORMALIZADA' in cube['colunas']:
+        situacao_counts = cube_situacao_counts(cube)
+        metrics['Situações Únicas'] = len(situacao_counts)
+        # Adicionar contagem das principais situações
+        for situacao, count in situacao_counts.head(3).items():
+            metrics[f"{situacao[:15]}..."] = int(count)
+    
+    return metrics
+
 # Função para calcular métricas
-def calculate_metrics(df, sheet_name):
+def calculate_metrics(df, sheet_name, file_hash=None):
+    """
+    Calcula métricas para uma planilha
+    """
+    return metrics_from_cube(sheet_metrics_cube(file_hash, sheet_name, df), sheet_name)
+
+# Backend analítico
+# "pandas" agrega as planilhas em memória; "duckdb" agrega com SQL direto dos arquivos
+# Parquet do cache em disco, sem carregar as colunas; "auto" usa o DuckDB quando instalado
+ANALYTICS_BACKEND = os.environ.get("RELATORIO_BACKEND", "pandas")
+
+# Função para decidir se as agregações vão para o DuckDB
+def _use_duckdb(backend=None):
+    backend = backend or ANALYTICS_BACKEND
+    if backend == "auto":
+        try:
+            import duckdb  # noqa: F401
+            return True
+        except ImportError:
+            return False
+    return backend == "duckdb"
+
+# Função para escrever um nome de coluna como identificador SQL
+def _sql_name(col):
+    return '"' + str(col).replace('"', '""') + '"'
+
+# Função para montar o SQL das ligações por situação x tentativa x dia da semana x hora
+def _hour_counts_sql(parquet_path, date_cols, situacao):
+    """
+    Mesmas contagens de call_hour_counts: as colunas Data/Hora N viram uma linha por
+    ligação (UNPIVOT), as datas sem ano (ANO_SEM_ANO) recebem o ano mais comum da planilha
+    na primeira tentativa e o da tentativa anterior nas seguintes (+1 na virada do ano)
+    """
+    fonte = "read_parquet('" + str(parquet_path).replace("'", "''") + "', file_row_number = true)"
+    
+    def com_ano(momento, ano):
+        return (
+            f"make_timestamp({ano}, month({momento}), day({momento}), "
+            f"hour({momento}), minute({momento}), CAST(floor(second({momento})) AS BIGINT))"
+        )
+    
+    ligacoes = " UNION ALL ".join(
+        f"SELECT file_row_number AS linha, {ordem} AS ordem, {date_column_attempt(col)} AS tentativa, "
+        f"CAST({_sql_name(col)} AS TIMESTAMP) AS momento, {situacao} AS situacao "
+        f"FROM {fonte} WHERE {_sql_name(col)} IS NOT NULL"
+        for ordem, col in enumerate(date_cols)
+    ) or "SELECT NULL::BIGINT AS linha, 0 AS ordem, 1 AS tentativa, NULL::TIMESTAMP AS momento, NULL::VARCHAR AS situacao WHERE FALSE"
+    
+    return f"""
+        WITH RECURSIVE ligacoes AS (
+            SELECT *, row_number() OVER (PARTITION BY linha ORDER BY tentativa, ordem) AS k
+            FROM ({ligacoes})
+        ),
+        moda AS (
+            SELECT year(momento) AS ano FROM ligacoes WHERE year(momento) <> {ANO_SEM_ANO}
+            GROUP BY ano ORDER BY count(*) DESC, ano LIMIT 1
+        ),
+        resolvidas AS (
+            SELECT l.linha, l.k, l.tentativa, l.situacao,
+                CASE WHEN year(l.momento) = {ANO_SEM_ANO} AND m.ano IS NOT NULL
+                    THEN {com_ano('l.momento', 'm.ano')} ELSE l.momento END AS momento
+            FROM ligacoes l LEFT JOIN moda m ON TRUE
+            WHERE l.k = 1
+            UNION ALL
+            SELECT l.linha, l.k, l.tentativa, l.situacao,
+                CASE
+                    WHEN year(l.momento) <> {ANO_SEM_ANO} OR year(r.momento) = {ANO_SEM_ANO} THEN l.momento
+                    WHEN {com_ano('l.momento', 'year(r.momento)')} < r.momento - INTERVAL 180 DAY
+                        THEN {com_ano('l.momento', 'year(r.momento) + 1')}
+                    ELSE {com_ano('l.momento', 'year(r.momento)')}
+                END
+            FROM ligacoes l JOIN resolvidas r ON l.linha = r.linha AND l.k = r.k + 1
+        )
+        SELECT
+            situacao AS {_sql_name('SITUAÇÃO')},
+            tentativa AS {_sql_name('TENTATIVA')},
+            isodow(momento) - 1 AS {_sql_name('DIA_SEMANA')},
+            hour(momento) AS {_sql_name('HORA')},
+            COUNT(*) AS {_sql_name('QUANTIDADE')}
+        FROM resolvidas
+        GROUP BY ALL
+    """
+
+# Função para agregar uma planilha salva em Parquet no cubo de métricas, com DuckDB
+def build_metrics_cube_duckdb(parquet_path, sheet_name):
     """
-    Calcula métricas para uma planilha
+    Mesmo cubo de build_metrics_cube, calculado pelo DuckDB direto do arquivo Parquet:
+    só as colunas usadas são lidas, e só as contagens voltam para o pandas
     """
-    metrics = {
-        'Planilha': sheet_name,
-        'Total Empresas': len(df),
-    }
+    import duckdb
+    import pyarrow as pa
+    import pyarrow.parquet as pq
     
-    # Telefones
-    tel1_count = 0
-    tel2_count = 0
-    if 'TEL 1' in df.columns:
-        tel1_count = df['TEL 1'].notna().sum()
-        metrics['Com Telefone 1'] = tel1_count
+    schema = pq.read_schema(parquet_path)
+    colunas = [col for col in schema.names if not col.startswith('__index_level_')]
+    fonte = "read_parquet('" + str(parquet_path).replace("'", "''") + "')"
     
-    if 'TEL 2' in df.columns:
-        tel2_count = df['TEL 2'].notna().sum()
-        metrics['Com Telefone 2'] = tel2_count
+    situacao = (
+        f"CAST({_sql_name('SITUAÇÃO_NORMALIZADA')} AS VARCHAR)"
+        if 'SITUAÇÃO_NORMALIZADA' in colunas
+        else "CAST(NULL AS VARCHAR)"
+    )
+    dimensoes = [f"{situacao} AS {_sql_name('SITUAÇÃO')}"]
+    for col, dim in CUBE_CONTACT_COLUMNS.items():
+        presenca = f"{_sql_name(col)} IS NOT NULL" if col in colunas else "FALSE"
+        dimensoes.append(f"{presenca} AS {_sql_name(dim)}")
     
-    metrics['Total Telefones'] = tel1_count + tel2_count
+    with duckdb.connect() as con:
+        contatos = con.execute(
+            f"SELECT {', '.join(dimensoes)}, COUNT(*) AS {_sql_name('QUANTIDADE')} "
+            f"FROM {fonte} GROUP BY ALL"
+        ).df()
+        
+        # Ligações: as datas sem ano recebem o ano como em build_attempt_events (no SQL,
+        # uma CTE recursiva percorre as tentativas de cada empresa); colunas de data que
+        # não foram convertidas na limpeza são lidas e contadas no pandas
+        date_cols = find_date_columns(pd.DataFrame(columns=colunas))
+        if all(pa.types.is_timestamp(schema.field(col).type) for col in date_cols):
+            horas = con.execute(_hour_counts_sql(parquet_path, date_cols, situacao)).df()
+        else:
+            logger.warning("duckdb: colunas de data sem tipo timestamp em %s, ligações contadas no pandas", sheet_name)
+            leitura = date_cols + (['SITUAÇÃO_NORMALIZADA'] if 'SITUAÇÃO_NORMALIZADA' in colunas else [])
+            horas = call_hour_counts(pd.read_parquet(parquet_path, columns=leitura))
     
-    # Emails
-    if 'E-MAIL' in df.columns:
-        email_count = df['E-MAIL'].notna().sum()
-        metrics['Com Email'] = email_count
+    contatos['QUANTIDADE'] = contatos['QUANTIDADE'].astype('int64')
+    contatos.insert(0, 'PLANILHA', sheet_name)
+    horas = horas.astype({'TENTATIVA': 'int64', 'DIA_SEMANA': 'int64', 'HORA': 'int64', 'QUANTIDADE': 'int64'})
+    horas.insert(0, 'PLANILHA', sheet_name)
     
-    # Situações
-    if 'SITUAÇÃO_NORMALIZADA' in df.columns:
-        metrics['Situações Únicas'] = df['SITUAÇÃO_NORMALIZADA'].nunique()
-        # Adicionar contagem das principais situações
-        situacao_counts = df['SITUAÇÃO_NORMALIZADA'].value_counts()
-        for situacao, count in situacao_counts.head(3).items():
-            metrics[f"{situacao[:15]}..."] = count
+    return {
+        'planilhas': [sheet_name],
+        'colunas': [col for col in [*CUBE_CONTACT_COLUMNS, 'SITUAÇÃO_NORMALIZADA'] if col in colunas],
+        'contatos': contatos,
+        'horas': horas,
+    }
+
+# Função para obter o cubo de uma planilha pelo backend configurado
+def sheet_metrics_cube(file_hash, sheet_name, df, backend=None):
+    """
+    Com o DuckDB, a planilha é agregada a partir do Parquet do cache em disco;
+    sem o arquivo em cache (ou com o backend pandas), a partir do DataFrame
+    """
+    if _use_duckdb(backend):
+        parquet_path = cached_sheet_paths(file_hash).get(sheet_name) if file_hash else None
+        if parquet_path is not None:
+            return build_metrics_cube_duckdb(parquet_path, sheet_name)
+        logger.warning("duckdb: %s sem Parquet no cache em disco, cubo calculado no pandas", sheet_name)
+    return build_metrics_cube(df, sheet_name)
+
+# Formatos de exportação: formato -> (rótulo, nome do arquivo, mime)
+EXPORT_FORMATS = {
+    "xlsx": ("Excel (.xlsx)", "dados_processados.xlsx",
+             "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+    "csv": ("CSV por planilha (.zip)", "dados_processados_csv.zip", "application/zip"),
+    "parquet": ("Parquet por planilha (.zip)", "dados_processados_parquet.zip", "application/zip"),
+}
+# "auto" usa o xlsxwriter (modo constant_memory) quando instalado e o openpyxl caso contrário
+EXCEL_WRITER_ENGINE = os.environ.get("RELATORIO_EXCEL_WRITER", "auto")
+EXPORT_CHUNK_ROWS = 50_000
+
+# Função para escrever o Excel com xlsxwriter, linha a linha (constant_memory)
+def _write_excel_xlsxwriter(df_dict, output):
+    import xlsxwriter
     
-    return metrics
+    # constant_memory exige escrita em ordem de linha, por isso não usamos df.to_excel aqui
+    workbook = xlsxwriter.Workbook(output, {
+        'constant_memory': True,
+        'default_date_format': 'yyyy-mm-dd hh:mm:ss',
+    })
+    try:
+        for sheet_name, df in df_dict.items():
+            worksheet = workbook.add_worksheet(str(sheet_name)[:31])
+            worksheet.write_row(0, 0, [str(col) for col in df.columns])
+            
+            row_idx = 1
+            for start in range(0, len(df), EXPORT_CHUNK_ROWS):
+                chunk = df.iloc[start:start + EXPORT_CHUNK_ROWS]
+                # Valores vazios viram células em branco
+                chunk = chunk.astype(object).where(chunk.notna(), None)
+                for row in chunk.itertuples(index=False, name=None):
+                    worksheet.write_row(row_idx, 0, row)
+                    row_idx += 1
+    finally:
+        workbook.close()
 
 # Função para download do Excel
-def get_excel_download_link(df_dict, filename):
+def get_excel_download_link(df_dict, filename, engine=None):
     """
     Cria link para download do Excel
     """
+    engine = engine or EXCEL_WRITER_ENGINE
+    if engine == "auto":
+        try:
+            import xlsxwriter  # noqa: F401
+            engine = "xlsxwriter"
+        except ImportError:
+            engine = "openpyxl"
+    
+    output = BytesIO()
+    if engine == "xlsxwriter":
+        _write_excel_xlsxwriter(df_dict, output)
+    else:
+        with pd.ExcelWriter(output, engine='openpyxl') as writer:
+            for sheet_name, df in df_dict.items():
+                df.to_excel(writer, sheet_name=sheet_name, index=False)
+    output.seek(0)
+    
+    return output
+
+# Função para exportar cada planilha em CSV/Parquet dentro de um .zip
+def get_zip_export(df_dict, fmt="csv"):
+    """
+    Gera um .zip com um arquivo por planilha, escrito direto no zip
+    (CSV em blocos de EXPORT_CHUNK_ROWS linhas)
+    """
     output = BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
+    with zipfile.ZipFile(output, "w", compression=zipfile.ZIP_DEFLATED) as zf:
         for sheet_name, df in df_dict.items():
-            df.to_excel(writer, sheet_name=sheet_name, index=False)
+            if fmt == "parquet":
+                with zf.open(f"{sheet_name}.parquet", "w") as f:
+                    _prepare_for_parquet(df).to_parquet(f)
+                continue
+            
+            with zf.open(f"{sheet_name}.csv", "w") as raw:
+                with TextIOWrapper(raw, encoding="utf-8-sig", newline="") as f:
+                    for start in range(0, len(df), EXPORT_CHUNK_ROWS):
+                        df.iloc[start:start + EXPORT_CHUNK_ROWS].to_csv(f, index=False, header=(start == 0))
+                    if df.empty:
+                        df.to_csv(f, index=False)
     output.seek(0)
     
     return output
 
-# Função para gerar relatório HTML
-def generate_html_report(dfs_clean, filename="relatorio_cargas_niteroi.html"):
+# Função para gerar o arquivo de exportação no formato escolhido
+def export_workbook(df_dict, fmt="xlsx"):
+    if fmt == "xlsx":
+        return get_excel_download_link(df_dict, EXPORT_FORMATS[fmt][1]).getvalue()
+    return get_zip_export(df_dict, fmt).getvalue()
+
+# Colunas comuns usadas na visão consolidada
+CONSOLIDATED_COLUMNS = ['CNPJ', 'RAZÃO SOCIAL', 'TEL 1', 'TEL 2', 'E-MAIL', 'SITUAÇÃO_NORMALIZADA', 'OBSERVAÇÃO']
+
+# Função para montar a visão consolidada das planilhas
+def consolidate_sheets(dfs_clean):
     """
-    Gera um relatório HTML interativo para compartilhar
+    Visão consolidada sem cópia: guarda, para cada planilha, a referência ao
+    DataFrame limpo e as colunas comuns que ele tem.
+    As linhas só são copiadas em consolidated_frame, e apenas as selecionadas.
     """
-    # Criar DataFrame consolidado
-    dfs_consolidado = []
+    view = {}
     for sheet_name, df in dfs_clean.items():
-        df_copy = df.copy()
         # Manter apenas colunas comuns
-        common_cols = []
-        for col in ['CNPJ', 'RAZÃO SOCIAL', 'TEL 1', 'TEL 2', 'E-MAIL', 'SITUAÇÃO_NORMALIZADA', 'OBSERVAÇÃO']:
-            if col in df_copy.columns:
-                common_cols.append(col)
+        common_cols = [col for col in CONSOLIDATED_COLUMNS if col in df.columns]
+        view[sheet_name] = (df, common_cols)
+    
+    return view
+
+# Função para materializar (parte da) visão consolidada em um DataFrame
+def consolidated_frame(view, excluir_situacao=None):
+    """
+    Junta as linhas das planilhas da visão, com a planilha de origem em ORIGEM (category).
+    Com excluir_situacao, as linhas dessa situação são descartadas antes de copiar.
+    """
+    if not view:
+        return None
+    
+    partes = []
+    for sheet_name, (df, common_cols) in view.items():
+        if excluir_situacao is not None and 'SITUAÇÃO_NORMALIZADA' in df.columns:
+            partes.append(df.loc[df['SITUAÇÃO_NORMALIZADA'] != excluir_situacao, common_cols])
+        else:
+            partes.append(df[common_cols])
+    
+    df_consolidado = pd.concat(partes, ignore_index=True)
+    origem_codes = np.repeat(np.arange(len(partes)), [len(parte) for parte in partes])
+    df_consolidado['ORIGEM'] = pd.Categorical.from_codes(origem_codes, categories=list(view))
+    
+    return df_consolidado
+
+# Relatório HTML
+# Como o plotly.js entra no relatório: "inline" (uma única cópia embutida, funciona offline),
+# "cdn" (link para a versão correspondente no cdn.plot.ly) ou "file" (plotly.min.js gravado
+# ao lado do relatório e compartilhado por todos os relatórios da mesma pasta)
+HTML_PLOTLYJS = os.environ.get("RELATORIO_HTML_PLOTLYJS", "inline")
+HTML_PLOTLYJS_MODES = ("inline", "cdn", "file")
+HTML_PLOTLYJS_FILE = "plotly.min.js"
+
+# Template HTML (compilado uma única vez por processo em _html_report_template)
+HTML_REPORT_TEMPLATE = """
+<!DOCTYPE html>
+<html lang="pt-BR">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>Relatório CARGAS NITERÓI</title>
+    {{plotlyjs_tag}}
+    <style>
+        body {
+            font-family: Arial, sans-serif;
+            margin: 20px;
+            background-color: #f5f5f5;
+        }
+        .header {
+            background-color: #2c3e50;
+            color: white;
+            padding: 20px;
+            border-radius: 10px;
+            margin-bottom: 20px;
+        }
+        .metrics {
+            display: grid;
+            grid-template-columns: repeat(auto-fit, minmax(200px, 1fr));
+            gap: 15px;
+            margin-bottom: 30px;
+        }
+        .metric-card {
+            background: white;
+            padding: 20px;
+            border-radius: 8px;
+            box-shadow: 0 2px 4px rgba(0,0,0,0.1);
+            text-align: center;
+        }
+        .metric-value {
+            font-size: 2em;
+            font-weight: bold;
+            color: #2c3e50;
+        }
+        .metric-label {
+            color: #7f8c8d;
+            margin-top: 5px;
+        }
+        .chart-container {
+            background: white;
+            padding: 20px;
+            border-radius: 8px;
+            box-shadow: 0 2px 4px rgba(0,0,0,0.1);
+            margin-bottom: 20px;
+        }
+        .observations {
+            background: white;
+            padding: 20px;
+            border-radius: 8px;
+            box-shadow: 0 2px 4px rgba(0,0,0,0.1);
+        }
+        .footer {
+            text-align: center;
+            margin-top: 30px;
+            color: #7f8c8d;
+            font-size: 0.9em;
+        }
+        h1, h2, h3 {
+            color: #2c3e50;
+        }
+    </style>
+</head>
+<body>
+    <div class="header">
+        <h1>📊 Relatório de Contatos - CARGAS NITERÓI</h1>
+        <p>Análise feita por Kaynan Monteiro e David Florencio</p>
+        <p>Gerado em: {{data_geracao}}</p>
+    </div>
+    
+    <div class="metrics">
+        <div class="metric-card">
+            <div class="metric-value">{{total_empresas}}</div>
+            <div class="metric-label">Total de Empresas</div>
+        </div>
+        <div class="metric-card">
+            <div class="metric-value">{{total_telefones}}</div>
+            <div class="metric-label">Total de Telefones</div>
+        </div>
+        <div class="metric-card">
+            <div class="metric-value">{{total_emails}}</div>
+            <div class="metric-label">Total de Emails</div>
+        </div>
+        <div class="metric-card">
+            <div class="metric-value">{{situacoes_unicas}}</div>
+            <div class="metric-label">Situações Únicas</div>
+        </div>
+    </div>
+    
+    {% if pie_html %}
+    <div class="chart-container">
+        <h2>Distribuição de Situações</h2>
+        {{pie_html}}
+    </div>
+    {% endif %}
+    
+    {% if calls_html %}
+    <div class="chart-container">
+        <h2>Horários de Ligações</h2>
+        {{calls_html}}
+    </div>
+    {% endif %}
+    
+    <div class="observations">
+        <h2>📝 Observações Importantes</h2>
+        <p>Total de observações importantes: <strong>{{obs_importantes}}</strong></p>
+        <p>Percentual do total: <strong>{{percentual_obs}}%</strong></p>
         
-        df_copy = df_copy[common_cols]
-        dfs_consolidado.append(df_copy)
+        <h3>Resumo por Situação:</h3>
+        <ul>
+            {% for situacao, quantidade in situacoes_contagem.items() %}
+            <li><strong>{{situacao}}:</strong> {{quantidade}} ocorrências</li>
+            {% endfor %}
+        </ul>
+    </div>
+    
+    <div class="footer">
+        <p>Relatório gerado automaticamente - Sistema de Análise de CARGAS NITERÓI</p>
+        <p>Para atualizar os dados, execute o sistema Python com o arquivo Excel atualizado</p>
+    </div>
+</body>
+</html>
+"""
+
+_HTML_TEMPLATE_CACHE = {}
+
+# Função para obter o template do relatório já compilado
+def _html_report_template():
+    if "relatorio" not in _HTML_TEMPLATE_CACHE:
+        from jinja2 import Template
+        _HTML_TEMPLATE_CACHE["relatorio"] = Template(HTML_REPORT_TEMPLATE)
+    return _HTML_TEMPLATE_CACHE["relatorio"]
+
+# Função para montar a tag <script> do plotly.js (uma só por relatório)
+def _plotlyjs_tag(mode, out_dir):
+    from plotly.offline import get_plotlyjs
+    from plotly.offline.offline import get_plotlyjs_version
+    
+    if mode == "cdn":
+        return f'<script src="https://cdn.plot.ly/plotly-{get_plotlyjs_version()}.min.js" charset="utf-8"></script>'
+    if mode == "file":
+        bundle = os.path.join(out_dir, HTML_PLOTLYJS_FILE)
+        if not os.path.exists(bundle):
+            # Grava num temporário e renomeia: vários relatórios podem ser gerados em paralelo
+            tmp_bundle = f"{bundle}.{os.getpid()}.tmp"
+            with open(tmp_bundle, "w", encoding="utf-8") as f:
+                f.write(get_plotlyjs())
+            os.replace(tmp_bundle, bundle)
+        return f'<script src="{HTML_PLOTLYJS_FILE}" charset="utf-8"></script>'
+    return f'<script type="text/javascript">{get_plotlyjs()}</script>'
+
+# Função para gerar relatório HTML
+def generate_html_report(dfs_clean, filename="relatorio_cargas_niteroi.html", cubes=None, plotlyjs=None, resumo_cnpj=None):
+    """
+    Gera um relatório HTML interativo para compartilhar
+    (cubes: cubos de métricas por planilha já calculados, se houver;
+    plotlyjs: "inline", "cdn" ou "file", ver HTML_PLOTLYJS;
+    resumo_cnpj: cnpj_summary já calculado, se houver)
+    """
+    plotlyjs = plotlyjs or HTML_PLOTLYJS
+    if plotlyjs not in HTML_PLOTLYJS_MODES:
+        raise ValueError(f"Modo de plotly.js desconhecido: {plotlyjs}")
     
-    if not dfs_consolidado:
+    if not dfs_clean:
         return None
     
-    df_consolidado = pd.concat(dfs_consolidado, ignore_index=True)
+    # Consolidado = soma dos cubos das planilhas
+    if cubes is None:
+        cubes = {sheet_name: build_metrics_cube(df, sheet_name) for sheet_name, df in dfs_clean.items()}
+    cube_consolidado = combine_cubes(cubes.values())
     
     # Gerar gráficos
-    fig_pie = create_pie_chart(df_consolidado, "Distribuição de Situações - Consolidado")
-    fig_calls = create_calls_chart(dfs_clean.get('CARGAS_NITEROI', pd.DataFrame()), 
-                                   "Horários de Ligações")
+    fig_pie = None
+    if 'SITUAÇÃO_NORMALIZADA' in cube_consolidado['colunas']:
+        fig_pie = create_pie_chart_from_counts(cube_situacao_counts(cube_consolidado), "Distribuição de Situações - Consolidado")
+    fig_calls = None
+    if 'CARGAS_NITEROI' in cubes:
+        fig_calls = create_calls_chart_from_counts(cube_hour_counts(cubes['CARGAS_NITEROI']), "Horários de Ligações")
     
-    # Converter gráficos para HTML
-    pie_html = pio.to_html(fig_pie, full_html=False) if fig_pie else ""
-    calls_html = pio.to_html(fig_calls, full_html=False) if fig_calls else ""
+    # Converter gráficos para HTML (sem o plotly.js, que vai uma única vez no <head>)
+    import plotly.io as pio
+    
+    pie_html = pio.to_html(fig_pie, full_html=False, include_plotlyjs=False) if fig_pie else ""
+    calls_html = pio.to_html(fig_calls, full_html=False, include_plotlyjs=False) if fig_calls else ""
     
     # Calcular métricas
-    metrics = calculate_metrics(df_consolidado, "Consolidado")
+    metrics = metrics_from_cube(cube_consolidado, "Consolidado")
+    total_empresas = metrics['Total Empresas']
+    
+    # Empresas repetidas entre planilhas/arquivos contam uma vez, como na Visão Geral
+    if resumo_cnpj is None:
+        cnpj_index = build_cnpj_index(dfs_clean)
+        resumo_cnpj = cnpj_summary(cnpj_index, resolve_company_names(dfs_clean, cnpj_index))
     
     # Contar observações importantes
-    if 'SITUAÇÃO_NORMALIZADA' in df_consolidado.columns:
-        obs_importantes = len(df_consolidado[df_consolidado['SITUAÇÃO_NORMALIZADA'] != "Não atende"])
-        percentual_obs = round((obs_importantes / len(df_consolidado) * 100), 1)
+    if 'SITUAÇÃO_NORMALIZADA' in cube_consolidado['colunas'] and total_empresas:
+        obs_importantes = total_empresas - cube_count(cube_consolidado, **{'SITUAÇÃO': "Não atende"})
+        percentual_obs = round((obs_importantes / total_empresas * 100), 1)
         
         # Contagem de situações
-        situacoes_contagem = df_consolidado[df_consolidado['SITUAÇÃO_NORMALIZADA'] != "Não atende"]['SITUAÇÃO_NORMALIZADA'].value_counts().to_dict()
+        situacoes_contagem = cube_situacao_counts(cube_consolidado, excluir="Não atende").to_dict()
     else:
         obs_importantes = 0
         percentual_obs = 0
         situacoes_contagem = {}
     
-    # Template HTML
-    html_template = """
-    <!DOCTYPE html>
-    <html lang="pt-BR">
-    <head>
-        <meta charset="UTF-8">
-        <meta name="viewport" content="width=device-width, initial-scale=1.0">
-        <title>Relatório CARGAS NITERÓI</title>
-        <script src="https://cdn.plot.ly/plotly-latest.min.js"></script>
-        <style>
-            body {
-                font-family: Arial, sans-serif;
-                margin: 20px;
-                background-color: #f5f5f5;
-            }
-            .header {
-                background-color: #2c3e50;
-                color: white;
-                padding: 20px;
-                border-radius: 10px;
-                margin-bottom: 20px;
-            }
-            .metrics {
-                display: grid;
-                grid-template-columns: repeat(auto-fit, minmax(200px, 1fr));
-                gap: 15px;
-                margin-bottom: 30px;
-            }
-            .metric-card {
-                background: white;
-                padding: 20px;
-                border-radius: 8px;
-                box-shadow: 0 2px 4px rgba(0,0,0,0.1);
-                text-align: center;
-            }
-            .metric-value {
-                font-size: 2em;
-                font-weight: bold;
-                color: #2c3e50;
-            }
-            .metric-label {
-                color: #7f8c8d;
-                margin-top: 5px;
-            }
-            .chart-container {
-                background: white;
-                padding: 20px;
-                border-radius: 8px;
-                box-shadow: 0 2px 4px rgba(0,0,0,0.1);
-                margin-bottom: 20px;
-            }
-            .observations {
-                background: white;
-                padding: 20px;
-                border-radius: 8px;
-                box-shadow: 0 2px 4px rgba(0,0,0,0.1);
-            }
-            .footer {
-                text-align: center;
-                margin-top: 30px;
-                color: #7f8c8d;
-                font-size: 0.9em;
-            }
-            h1, h2, h3 {
-                color: #2c3e50;
-            }
-        </style>
-    </head>
-    <body>
-        <div class="header">
-            <h1>📊 Relatório de Contatos - CARGAS NITERÓI</h1>
-            <p>Análise feita por Kaynan Monteiro e David Florencio</p>
-            <p>Gerado em: {{data_geracao}}</p>
-        </div>
-        
-        <div class="metrics">
-            <div class="metric-card">
-                <div class="metric-value">{{total_empresas}}</div>
-                <div class="metric-label">Total de Empresas</div>
-            </div>
-            <div class="metric-card">
-                <div class="metric-value">{{total_telefones}}</div>
-                <div class="metric-label">Total de Telefones</div>
-            </div>
-            <div class="metric-card">
-                <div class="metric-value">{{total_emails}}</div>
-                <div class="metric-label">Total de Emails</div>
-            </div>
-            <div class="metric-card">
-                <div class="metric-value">{{situacoes_unicas}}</div>
-                <div class="metric-label">Situações Únicas</div>
-            </div>
-        </div>
-        
-        {% if pie_html %}
-        <div class="chart-container">
-            <h2>Distribuição de Situações</h2>
-            {{pie_html}}
-        </div>
-        {% endif %}
-        
-        {% if calls_html %}
-        <div class="chart-container">
-            <h2>Horários de Ligações</h2>
-            {{calls_html}}
-        </div>
-        {% endif %}
-        
-        <div class="observations">
-            <h2>📝 Observações Importantes</h2>
-            <p>Total de observações importantes: <strong>{{obs_importantes}}</strong></p>
-            <p>Percentual do total: <strong>{{percentual_obs}}%</strong></p>
-            
-            <h3>Resumo por Situação:</h3>
-            <ul>
-                {% for situacao, quantidade in situacoes_contagem.items() %}
-                <li><strong>{{situacao}}:</strong> {{quantidade}} ocorrências</li>
-                {% endfor %}
-            </ul>
-        </div>
-        
-        <div class="footer">
-            <p>Relatório gerado automaticamente - Sistema de Análise de CARGAS NITERÓI</p>
-            <p>Para atualizar os dados, execute o sistema Python com o arquivo Excel atualizado</p>
-        </div>
-    </body>
-    </html>
-    """
-    
-    # Renderizar template
-    template = Template(html_template)
-    html_content = template.render(
+    # Renderizar template direto no arquivo, pedaço a pedaço
+    template = _html_report_template()
+    chunks = template.generate(
+        plotlyjs_tag=_plotlyjs_tag(plotlyjs, os.path.dirname(os.path.abspath(filename))),
         data_geracao=datetime.now().strftime("%d/%m/%Y %H:%M"),
-        total_empresas=len(df_consolidado),
+        total_empresas=resumo_cnpj['Empresas únicas'],
         total_telefones=metrics.get('Total Telefones', 0),
         total_emails=metrics.get('Com Email', 0),
         situacoes_unicas=metrics.get('Situações Únicas', 0),
@@ -659,34 +2765,535 @@ def generate_html_report(dfs_clean, filename="relatorio_cargas_niteroi.html"):
     
     # Salvar arquivo HTML
     with open(filename, 'w', encoding='utf-8') as f:
-        f.write(html_content)
+        for chunk in chunks:
+            f.write(chunk)
     
     return filename
 
+# Vários arquivos (um por mês, região ou operador) analisados juntos
+# O período vem do nome do arquivo: 2025-09, 09-2025, 09_25 ou setembro_2025
+MESES = {
+    'janeiro': 1, 'fevereiro': 2, 'marco': 3, 'março': 3, 'abril': 4, 'maio': 5, 'junho': 6,
+    'julho': 7, 'agosto': 8, 'setembro': 9, 'outubro': 10, 'novembro': 11, 'dezembro': 12,
+}
+# Ano e mês só contam entre separadores (início/fim do nome, "-", "_", ".", espaço):
+# "v2_10_25" é 2025-10, não 2010-02
+# (o segundo número fica num lookahead: "15_09_2025" ainda testa "09_2025")
+_PERIODO_ANO_MES = re.compile(r'(?<![^\W_])(20\d{2})(?=[-_. ]?(\d{2})(?![^\W_]))')
+_PERIODO_MES_ANO = re.compile(r'(?<![^\W_])(\d{1,2})(?=[-_. ](20\d{2}|\d{2})(?![^\W_]))')
+_PERIODO_NOME_MES = re.compile(r'(?<![^\W\d_])([^\W\d_]{3,})[-_. ]*(20\d{2}|\d{2})(?![^\W_])')
+SEM_PERIODO = "Sem período"
+
+# Função para montar o período AAAA-MM, ou None se o mês não existir
+def _period_label(ano, mes):
+    if not 1 <= mes <= 12:
+        return None
+    return f"{ano if len(ano) == 4 else '20' + ano}-{mes:02d}"
+
+# Função para extrair o período (AAAA-MM) do nome do arquivo
+def workbook_period(file_name):
+    nome = os.path.splitext(os.path.basename(file_name))[0].lower()
+    
+    for match in _PERIODO_ANO_MES.finditer(nome):
+        periodo = _period_label(match.group(1), int(match.group(2)))
+        if periodo:
+            return periodo
+    
+    for match in _PERIODO_MES_ANO.finditer(nome):
+        periodo = _period_label(match.group(2), int(match.group(1)))
+        if periodo:
+            return periodo
+    
+    # Nome do mês, por extenso ou abreviado (set_25, dez-2024)
+    for match in _PERIODO_NOME_MES.finditer(nome):
+        mes = next((numero for mes, numero in MESES.items() if mes.startswith(match.group(1))), None)
+        if mes:
+            return _period_label(match.group(2), mes)
+    return None
+
+# Função para juntar as planilhas de vários arquivos, marcando a origem de cada linha
+def merge_workbooks(workbooks):
+    """
+    workbooks: [(nome do arquivo, dfs_clean)], na ordem do upload.
+    Planilhas de mesmo nome viram uma só (um concat por planilha), com as colunas
+    ARQUIVO e PERÍODO em category; planilhas que só existem em um arquivo também são marcadas.
+    """
+    nomes = []
+    for nome, _ in workbooks:
+        # Nomes repetidos no upload ganham um sufixo para continuar distinguíveis
+        rotulo, n = nome, 2
+        while rotulo in nomes:
+            rotulo, n = f"{nome} ({n})", n + 1
+        nomes.append(rotulo)
+    
+    periodos = [workbook_period(nome) or SEM_PERIODO for nome, _ in workbooks]
+    categorias_periodo = sorted(set(periodos), key=lambda p: (p == SEM_PERIODO, p))
+    codigo_periodo = np.array([categorias_periodo.index(p) for p in periodos])
+    
+    por_planilha = {}
+    for i, (_, dfs_clean) in enumerate(workbooks):
+        for sheet_name, df in dfs_clean.items():
+            por_planilha.setdefault(sheet_name, []).append((i, df))
+    
+    merged = {}
+    for sheet_name, partes in por_planilha.items():
+        df = concat_clean_frames([df for _, df in partes], ignore_index=True)
+        origem = np.repeat([i for i, _ in partes], [len(df_parte) for _, df_parte in partes])
+        df['ARQUIVO'] = pd.Categorical.from_codes(origem, categories=pd.Index(nomes, dtype=object))
+        df['PERÍODO'] = pd.Categorical.from_codes(codigo_periodo[origem], categories=pd.Index(categorias_periodo, dtype=object))
+        merged[sheet_name] = df
+    return merged
+
+# Função para identificar um conjunto de arquivos (chave dos caches da visão consolidada)
+def workbooks_hash(file_hashes):
+    if len(file_hashes) == 1:
+        return file_hashes[0]
+    return "multi-" + hashlib.sha256("\n".join(file_hashes).encode("utf-8")).hexdigest()
+
+# Memoização entre reruns do Streamlit
+# Tudo é indexado pelo hash do arquivo + nome da planilha; os DataFrames (parâmetros com "_")
+# não entram no hash, então cada rerun só paga a renderização da página
+SESSION_WORKBOOK_KEY = "workbook"
+SESSION_EXPORTS_KEY = "exports"
+SESSION_CACHE_GENERATION_KEY = "geracao_cache"
+
+# Função para obter a chave dos resultados memorizados de um arquivo nesta sessão
+def session_cache_key(file_hash):
+    """
+    Depois de "Reprocessar", a sessão passa a usar chaves novas (hash + geração):
+    só ela recalcula, e os resultados memorizados das outras sessões continuam valendo
+    """
+    geracao = st.session_state.get(SESSION_CACHE_GENERATION_KEY, 0)
+    return f"{file_hash}#g{geracao}" if geracao else file_hash
+
+# Compartilhado entre reruns e sessões sem cópia (cache_resource não serializa o resultado)
+@st.cache_resource(max_entries=16, show_spinner=False)
+def cached_consolidated(file_hash, excluir_situacao, _dfs_clean):
+    return consolidated_frame(consolidate_sheets(_dfs_clean), excluir_situacao)
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def cached_cube(cache_key, file_hash, sheet_name, _df):
+    return sheet_metrics_cube(file_hash, sheet_name, _df)
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def cached_pie_chart(file_hash, sheet_name, title, _situacao_counts):
+    return create_pie_chart_from_counts(_situacao_counts, title)
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def cached_calls_chart(file_hash, sheet_name, title, _horas_counts):
+    return create_calls_chart_from_counts(_horas_counts, title)
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def cached_weekday_heatmap(file_hash, sheet_name, title, _matriz):
+    return create_weekday_heatmap_from_counts(_matriz, title)
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def cached_attempts_chart(file_hash, sheet_name, title, _tentativa_counts):
+    return create_attempts_chart_from_counts(_tentativa_counts, title)
+
+# Índice de CNPJs e situação mais recente, montados uma vez por arquivo (ou conjunto de arquivos)
+@st.cache_resource(max_entries=8, show_spinner=False)
+def cached_cnpj_index(file_hash, _dfs_clean):
+    return build_cnpj_index(_dfs_clean)
+
+@st.cache_resource(max_entries=8, show_spinner=False)
+def cached_company_resolution(file_hash, _dfs_clean):
+    return resolve_company_names(_dfs_clean, cached_cnpj_index(file_hash, _dfs_clean))
+
+@st.cache_resource(max_entries=8, show_spinner=False)
+def cached_latest_situation(file_hash, _dfs_clean):
+    return latest_situation_by_cnpj(cached_cnpj_index(file_hash, _dfs_clean), _dfs_clean)
+
+# Tabela longa de tentativas, montada uma vez por planilha
+@st.cache_resource(max_entries=16, show_spinner=False)
+def cached_attempt_events(cache_key, sheet_name, _df):
+    return build_attempt_events(_df)
+
+@st.cache_resource(max_entries=64, show_spinner=False)
+def cached_observations_index(cache_key, title, obs_col, _df):
+    return build_observations_index(_df, obs_col)
+
+@st.cache_resource(max_entries=32, show_spinner=False)
+def cached_data_grid_positions(cache_key, key, sort_col, ascending, filter_col, filter_text, _df):
+    return data_grid_positions(_df, sort_col, ascending, filter_col, filter_text)
+
+# Planilhas de vários arquivos juntas, indexadas pelo conjunto de arquivos
+@st.cache_resource(max_entries=4, show_spinner=False)
+def cached_merged_workbooks(cache_key, _workbooks):
+    return merge_workbooks(_workbooks)
+
+# Exportações são grandes: poucas entradas, geradas só quando pedidas
+@st.cache_data(max_entries=8, show_spinner=False)
+def cached_export(file_hash, fmt, _dfs_clean):
+    return export_workbook(_dfs_clean, fmt)
+
+# Função executada para cada arquivo enviado: ingere e salva no cache em disco
+def _ingest_upload(file_path, store_key, file_hash, mode=None):
+    """
+    Retorna (dfs_clean, aviso). Com vários arquivos cada um roda em um worker
+    (mode="serial" dentro dele); com um só, as planilhas é que vão para os workers.
+    """
+    if INCREMENTAL_MODE:
+        # Só as linhas novas, se o arquivo já foi enviado antes
+        dfs_clean = ingest_workbook(file_path, store_key)
+    else:
+        dfs_clean = load_and_clean_workbook(file_path, file_hash, mode=mode)
+    
+    aviso = None
+    if dfs_clean:
+        try:
+            save_cached_workbook(file_hash, dfs_clean)
+            if INCREMENTAL_MODE:
+                save_incremental_index(store_key, file_hash)
+        except Exception as e:
+            aviso = f"Não foi possível salvar o cache: {e}"
+    return dfs_clean, aviso
+
+# Uploads são lidos direto da memória; acima deste tamanho vão para um arquivo
+# temporário exclusivo (os workers de processo recebem o caminho, não uma cópia dos bytes)
+UPLOAD_SPILL_BYTES = int(os.environ.get("RELATORIO_UPLOAD_SPILL_MB", "64")) * 1024 * 1024
+
+# Função para obter a origem da leitura de um upload
+@contextmanager
+def upload_source(file_name, data):
+    """
+    Retorna os próprios bytes do upload ou, para arquivos grandes, o caminho de um
+    arquivo temporário só desta leitura (apagado ao sair do with)
+    """
+    if len(data) < UPLOAD_SPILL_BYTES:
+        yield data
+        return
+    
+    fd, temp_path = tempfile.mkstemp(prefix="relatorio_upload_", suffix=os.path.splitext(file_name)[1] or ".xlsx")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        yield temp_path
+    finally:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+
+# Função para identificar um upload entre reruns
+def _upload_id(uploaded_file):
+    return getattr(uploaded_file, "file_id", None) or f"{uploaded_file.name}-{uploaded_file.size}"
+
+# Função para obter as planilhas limpas dos arquivos enviados
+def get_session_workbooks(uploaded_files):
+    """
+    Retorna [(nome, file_hash, dfs_clean)] dos arquivos enviados, na ordem do upload.
+    Enquanto o mesmo upload estiver ativo, o resultado vem de st.session_state,
+    sem recalcular o hash nem reler o cache em disco. Arquivos novos são processados
+    juntos, um por worker.
+    """
+    sessao = st.session_state.setdefault(SESSION_WORKBOOK_KEY, {})
+    ids = [_upload_id(uploaded_file) for uploaded_file in uploaded_files]
+    
+    # Arquivos removidos do upload saem da sessão
+    for file_id in set(sessao) - set(ids):
+        del sessao[file_id]
+    
+    # Planilhas já processadas são lidas direto do cache em disco
+    pendentes = []
+    for uploaded_file, file_id in zip(uploaded_files, ids):
+        if file_id in sessao:
+            continue
+        # getvalue devolve os bytes do upload sem copiá-los
+        data = uploaded_file.getvalue()
+        file_hash = workbook_hash(data)
+        dfs_clean = load_cached_workbook(file_hash)
+        if dfs_clean is None:
+            pendentes.append((uploaded_file, file_id, file_hash, data))
+        else:
+            sessao[file_id] = {"file_hash": file_hash, "dfs_clean": dfs_clean}
+    
+    if pendentes:
+        workers = min(PARALLEL_WORKERS or os.cpu_count() or 1, len(pendentes))
+        if PARALLEL_MODE == "serial":
+            workers = 1
+        
+        # Carregar e limpar dados
+        with st.spinner("Carregando e processando dados..."), ExitStack() as temporarios:
+            fontes = [
+                temporarios.enter_context(upload_source(uploaded_file.name, data))
+                for uploaded_file, _, _, data in pendentes
+            ]
+            
+            if workers <= 1:
+                resultados = []
+                for (uploaded_file, _, file_hash, _), fonte in zip(pendentes, fontes):
+                    try:
+                        resultados.append(_ingest_upload(fonte, uploaded_file.name, file_hash))
+                    except Exception as e:
+                        resultados.append(e)
+            else:
+                with make_executor(workers, PARALLEL_MODE) as executor:
+                    futures = [
+                        executor.submit(_ingest_upload, fonte, uploaded_file.name, file_hash, "serial")
+                        for (uploaded_file, _, file_hash, _), fonte in zip(pendentes, fontes)
+                    ]
+                    resultados = [future.exception() or future.result() for future in futures]
+        
+        for (uploaded_file, file_id, file_hash, _), resultado in zip(pendentes, resultados):
+            if isinstance(resultado, Exception):
+                st.error(f"Erro ao carregar arquivo Excel {uploaded_file.name}: {resultado}")
+                continue
+            dfs_clean, aviso = resultado
+            if aviso:
+                st.sidebar.warning(aviso)
+            for sheet_name, df in dfs_clean.items():
+                record_stage("limpeza", df.attrs.get('tempo_limpeza', 0), arquivo=uploaded_file.name, planilha=sheet_name)
+            if dfs_clean:
+                sessao[file_id] = {"file_hash": file_hash, "dfs_clean": dfs_clean}
+    
+    return [
+        (uploaded_file.name, sessao[file_id]["file_hash"], sessao[file_id]["dfs_clean"])
+        for uploaded_file, file_id in zip(uploaded_files, ids)
+        if file_id in sessao
+    ]
+
+# Função para descartar tudo que foi memorizado para um arquivo
+def clear_workbook_caches(file_hash, store_key=None):
+    """
+    Invalida a sessão, o cache em disco e o índice da ingestão incremental do arquivo.
+    Os resultados memorizados (compartilhados entre as sessões) não são apagados:
+    a sessão passa para a próxima geração de chaves (session_cache_key)
+    """
+    st.session_state.pop(SESSION_WORKBOOK_KEY, None)
+    st.session_state.pop(SESSION_EXPORTS_KEY, None)
+    shutil.rmtree(os.path.join(CACHE_DIR, file_hash), ignore_errors=True)
+    if store_key is not None:
+        clear_incremental_index(store_key)
+
+# Perfil de execução
+# Cada rerun mede as etapas de main (carregamento, consolidação, gráficos, exportação);
+# as medições vão para o log "relatorio" e para o painel de diagnóstico da barra lateral,
+# que só aparece com RELATORIO_PROFILE=1 ou com ?debug=1 na URL.
+# RELATORIO_PROFILE=memory (ou a opção do painel) mede também o pico de memória com tracemalloc,
+# que deixa a execução bem mais lenta e não enxerga os workers de processo.
+# O tracemalloc é um só para o processo, e o Streamlit roda todas as sessões nele: só uma
+# sessão mede por vez, e o pico inclui o que as outras sessões alocaram no mesmo período.
+PROFILE_MODE = os.environ.get("RELATORIO_PROFILE", "0")
+SESSION_PROFILE_MEMORY_KEY = "perfil_memoria"
+SESSION_PROFILE_ID_KEY = "perfil_sessao"
+
+logger = logging.getLogger("relatorio")
+if PROFILE_MODE != "0" and not logger.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s %(message)s"))
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
+
+# Medições da execução atual (o Streamlit roda cada sessão na sua própria thread)
+_perfil = threading.local()
+
+# Sessão dona do tracemalloc (None quando livre); start/stop só com o lock
+_TRACEMALLOC_LOCK = threading.Lock()
+_tracemalloc_dono = None
+
+# Função para registrar uma linha estruturada no log
+def _log_event(evento, **campos):
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(json.dumps({"evento": evento, **campos}, ensure_ascii=False, default=str))
+
+# Função para liberar o tracemalloc, se esta sessão for a dona
+def _release_tracemalloc(sessao):
+    global _tracemalloc_dono
+    with _TRACEMALLOC_LOCK:
+        if _tracemalloc_dono is not None and _tracemalloc_dono == sessao:
+            tracemalloc.stop()
+            _tracemalloc_dono = None
+
+# Função para iniciar as medições de um rerun
+def start_profile(memoria=False, sessao=None):
+    """
+    sessao identifica quem mede a memória: um rerun interrompido (st.rerun, exceção)
+    antes de finish_profile deixa o tracemalloc com a sessão, que o retoma no próximo
+    rerun. Se outra sessão já está medindo, este rerun mede só o tempo.
+    """
+    global _tracemalloc_dono
+    sessao = sessao or object()
+    _release_tracemalloc(sessao)
+    
+    _perfil.etapas = []
+    _perfil.picos = []
+    _perfil.inicio = time.perf_counter()
+    _perfil.sessao = sessao
+    _perfil.tracemalloc = False
+    _perfil.memoria_ocupada = False
+    if memoria:
+        with _TRACEMALLOC_LOCK:
+            if _tracemalloc_dono is None and not tracemalloc.is_tracing():
+                tracemalloc.start()
+                _tracemalloc_dono = sessao
+                _perfil.tracemalloc = True
+            else:
+                _perfil.memoria_ocupada = True
+
+# Função para encerrar as medições de um rerun
+def finish_profile(**campos):
+    """
+    Retorna as etapas medidas e o tempo total do rerun
+    """
+    etapas = getattr(_perfil, "etapas", None)
+    if etapas is None:
+        return [], 0.0
+    
+    total = round(time.perf_counter() - _perfil.inicio, 4)
+    if _perfil.tracemalloc:
+        _release_tracemalloc(_perfil.sessao)
+    _perfil.etapas = None
+    
+    _log_event("execucao", segundos=total, etapas=len(etapas), **campos)
+    return etapas, total
+
+# Função para adicionar uma medição feita fora de profile_stage
+def record_stage(etapa, segundos, **detalhes):
+    registro = {"etapa": etapa, **detalhes, "segundos": round(segundos, 4)}
+    etapas = getattr(_perfil, "etapas", None)
+    if etapas is not None:
+        etapas.append(registro)
+    _log_event("etapa", **registro)
+
+# Função para medir uma etapa (tempo e, se ativo, pico de memória)
+@contextmanager
+def profile_stage(etapa, **detalhes):
+    """
+    Mede o bloco do with. Etapas podem ser aninhadas: o pico de memória
+    de uma etapa inclui o das etapas internas.
+    """
+    if getattr(_perfil, "etapas", None) is None:
+        yield
+        return
+    
+    # Só a sessão dona do tracemalloc lê e zera o pico
+    memoria = _perfil.tracemalloc and tracemalloc.is_tracing()
+    if memoria:
+        atual, pico = tracemalloc.get_traced_memory()
+        if _perfil.picos:
+            _perfil.picos[-1] = max(_perfil.picos[-1], pico)
+        tracemalloc.reset_peak()
+        _perfil.picos.append(atual)
+    
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        segundos = time.perf_counter() - inicio
+        if memoria and tracemalloc.is_tracing():
+            pico = max(_perfil.picos.pop(), tracemalloc.get_traced_memory()[1])
+            if _perfil.picos:
+                _perfil.picos[-1] = max(_perfil.picos[-1], pico)
+            detalhes['pico_mb'] = round((pico - atual) / 2**20, 2)
+        record_stage(etapa, segundos, **detalhes)
+
+# Função para saber se o painel de diagnóstico deve aparecer
+def profile_panel_enabled():
+    return PROFILE_MODE != "0" or st.query_params.get("debug") == "1"
+
+# Função para exibir o painel de diagnóstico na barra lateral
+def show_profile_panel(etapas, total, dfs_clean=None):
+    with st.sidebar.expander("🐞 Diagnóstico de desempenho"):
+        st.caption(f"Última execução: {total:.3f}s")
+        
+        if etapas:
+            tabela = pd.DataFrame([
+                {
+                    'Etapa': registro['etapa'],
+                    'Detalhe': ", ".join(
+                        f"{campo}={valor}" for campo, valor in registro.items()
+                        if campo not in ('etapa', 'segundos', 'pico_mb')
+                    ),
+                    'Segundos': registro['segundos'],
+                    'Pico (MB, processo)': registro.get('pico_mb'),
+                }
+                for registro in etapas
+            ])
+            st.dataframe(tabela.dropna(axis=1, how='all'), hide_index=True)
+            if tabela['Pico (MB, processo)'].notna().any():
+                st.caption("O pico é do processo inteiro: inclui o que outras sessões alocaram ao mesmo tempo.")
+        
+        if getattr(_perfil, "memoria_ocupada", False):
+            st.caption("Outra sessão já está medindo a memória; nesta execução só o tempo foi medido.")
+        
+        if dfs_clean:
+            st.caption("Limpeza por planilha (medida quando o arquivo foi processado)")
+            st.dataframe(pd.DataFrame([
+                {'Planilha': sheet_name, 'Registros': len(df), 'Segundos': df.attrs.get('tempo_limpeza')}
+                for sheet_name, df in dfs_clean.items()
+            ]), hide_index=True)
+        
+        st.checkbox(
+            "Medir pico de memória (tracemalloc)",
+            key=SESSION_PROFILE_MEMORY_KEY,
+            disabled=PROFILE_MODE == "memory",
+            help="Vale a partir da próxima execução; deixa o processamento mais lento"
+        )
+
 # Interface principal
 def main():
+    # Configuração da página
+    st.set_page_config(
+        page_title="Relatório de Contatos - CARGAS NITERÓI",
+        page_icon="📊",
+        layout="wide"
+    )
+    
+    # Medições deste rerun (painel de diagnóstico e log)
+    start_profile(
+        PROFILE_MODE == "memory" or st.session_state.get(SESSION_PROFILE_MEMORY_KEY, False),
+        st.session_state.setdefault(SESSION_PROFILE_ID_KEY, os.urandom(8).hex()),
+    )
+    dfs_clean = {}
+    selected_sheet = None
+    
+    # Cabeçalho
+    st.title("📊 Relatório de Contatos - CARGAS NITERÓI")
+    st.markdown("**Análise feita por Kaynan Monteiro e David Florencio**")
+    st.markdown("---")
+    
     # Upload do arquivo
     st.sidebar.title("📂 Upload de Arquivo")
     
-    uploaded_file = st.sidebar.file_uploader(
-        "Carregue o arquivo Excel (NITEROI_BIRA.xlsx)",
-        type=['xlsx', 'xls']
+    uploaded_files = st.sidebar.file_uploader(
+        "Carregue os arquivos Excel (NITEROI_BIRA.xlsx; um por mês, região ou operador)",
+        type=['xlsx', 'xls'],
+        accept_multiple_files=True
     )
     
-    if uploaded_file is not None:
-        # Salvar arquivo temporariamente
-        with open("temp_uploaded.xlsx", "wb") as f:
-            f.write(uploaded_file.getbuffer())
+    if uploaded_files:
+        # Carregar dados (reaproveitados da sessão a cada rerun)
+        with profile_stage("carregamento", arquivos=len(uploaded_files)):
+            workbooks = get_session_workbooks(uploaded_files)
+        # Chave dos resultados memorizados (muda nesta sessão a cada "Reprocessar")
+        file_hash = session_cache_key(workbooks_hash([h for _, h, _ in workbooks])) if workbooks else None
         
-        # Carregar dados
-        with st.spinner("Carregando e processando dados..."):
-            dfs = load_excel_data("temp_uploaded.xlsx")
-        
-        if dfs:
-            # Limpar dados
+        if len(workbooks) > 1:
+            # Uma planilha consolidada por nome, com ARQUIVO e PERÍODO em cada linha
+            with profile_stage("consolidação", arquivos=len(workbooks)):
+                dfs_clean = cached_merged_workbooks(file_hash, [(nome, dfs) for nome, _, dfs in workbooks])
+        elif workbooks:
+            dfs_clean = workbooks[0][2]
+        else:
             dfs_clean = {}
-            for sheet_name, df in dfs.items():
-                dfs_clean[sheet_name] = clean_data(df, sheet_name)
+        
+        if dfs_clean:
+            if len(workbooks) > 1:
+                for nome, _, dfs in workbooks:
+                    periodo = workbook_period(nome) or SEM_PERIODO
+                    st.sidebar.success(f"✅ {nome} ({periodo}): {sum(len(df) for df in dfs.values())} registros")
+            for sheet_name, df in dfs_clean.items():
+                st.sidebar.success(f"✅ {sheet_name}: {len(df)} registros")
+            
+            with st.sidebar.expander("💾 Memória por planilha"):
+                st.dataframe(memory_report(dfs_clean), hide_index=True)
+            
+            if st.sidebar.button("♻️ Reprocessar arquivos" if len(workbooks) > 1 else "♻️ Reprocessar arquivo"):
+                for nome, h, _ in workbooks:
+                    clear_workbook_caches(h, nome)
+                st.session_state[SESSION_CACHE_GENERATION_KEY] = st.session_state.get(SESSION_CACHE_GENERATION_KEY, 0) + 1
+                st.rerun()
             
             # Sidebar navigation
             st.sidebar.title("Navegação")
@@ -696,18 +3303,49 @@ def main():
                 ["VISÃO GERAL"] + sheet_names
             )
             
+            # Cubos de métricas (uma agregação por planilha, reaproveitada por todas as telas)
+            # Com vários arquivos, os cubos de cada um são somados (nenhuma agregação sobre o conjunto)
+            with profile_stage("cubos", planilhas=len(dfs_clean)):
+                cubes_por_arquivo = [
+                    {sheet_name: cached_cube(session_cache_key(h), h, sheet_name, df) for sheet_name, df in dfs.items()}
+                    for _, h, dfs in workbooks
+                ]
+                if len(workbooks) > 1:
+                    cubes = {
+                        sheet_name: combine_cubes(c[sheet_name] for c in cubes_por_arquivo if sheet_name in c)
+                        for sheet_name in dfs_clean
+                    }
+                else:
+                    cubes = cubes_por_arquivo[0]
+                cube_consolidado = combine_cubes(cubes.values())
+            
             # Botão de download Excel
             st.sidebar.markdown("---")
             st.sidebar.subheader("📤 Exportar Dados")
             
-            download_data = get_excel_download_link(dfs_clean, "dados_processados.xlsx")
-            st.sidebar.download_button(
-                label="📥 Baixar dados em Excel",
-                data=download_data,
-                file_name="dados_processados.xlsx",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+            export_fmt = st.sidebar.selectbox(
+                "Formato:",
+                list(EXPORT_FORMATS),
+                format_func=lambda fmt: EXPORT_FORMATS[fmt][0]
             )
             
+            # O arquivo só é gerado quando pedido, e fica em cache por arquivo + formato
+            exports = st.session_state.setdefault(SESSION_EXPORTS_KEY, set())
+            if (file_hash, export_fmt) not in exports:
+                if st.sidebar.button("⚙️ Preparar arquivo para download"):
+                    exports.add((file_hash, export_fmt))
+            
+            if (file_hash, export_fmt) in exports:
+                with st.spinner("Gerando arquivo de exportação..."), profile_stage("exportação", formato=export_fmt):
+                    download_data = cached_export(file_hash, export_fmt, dfs_clean)
+                label, file_name, mime = EXPORT_FORMATS[export_fmt]
+                st.sidebar.download_button(
+                    label=f"📥 Baixar dados em {label}",
+                    data=download_data,
+                    file_name=file_name,
+                    mime=mime
+                )
+            
             # Botão para gerar relatório HTML
             st.sidebar.markdown("---")
             st.sidebar.subheader("📄 Relatório para Compartilhar")
@@ -715,7 +3353,10 @@ def main():
             if st.sidebar.button("🔄 Gerar Relatório HTML"):
                 with st.spinner("Gerando relatório HTML..."):
                     try:
-                        html_file = generate_html_report(dfs_clean)
+                        with profile_stage("exportação", formato="html"):
+                            cnpj_index = cached_cnpj_index(file_hash, dfs_clean)
+                            resumo_cnpj = cnpj_summary(cnpj_index, cached_company_resolution(file_hash, dfs_clean))
+                            html_file = generate_html_report(dfs_clean, cubes=cubes, resumo_cnpj=resumo_cnpj)
                         with open(html_file, "rb") as f:
                             st.sidebar.download_button(
                                 label="⬇️ Baixar Relatório HTML",
@@ -728,40 +3369,38 @@ def main():
                         st.sidebar.error(f"Erro ao gerar HTML: {e}")
             
             # Página: Visão Geral
+            # Gráficos das páginas (import adiado até haver dados para exibir)
+            import plotly.express as px
+            
             if selected_sheet == "VISÃO GERAL":
                 st.header("📈 Visão Geral Consolidada")
                 
                 # Criar DataFrame consolidado
-                dfs_consolidado = []
-                for sheet_name, df in dfs_clean.items():
-                    df_copy = df.copy()
-                    # Manter apenas colunas comuns
-                    common_cols = []
-                    for col in ['CNPJ', 'RAZÃO SOCIAL', 'TEL 1', 'TEL 2', 'E-MAIL', 'SITUAÇÃO_NORMALIZADA', 'OBSERVAÇÃO']:
-                        if col in df_copy.columns:
-                            common_cols.append(col)
-                    
-                    df_copy = df_copy[common_cols]
-                    df_copy['ORIGEM'] = sheet_name
-                    dfs_consolidado.append(df_copy)
+                # Só as linhas exibidas nas observações (situação diferente de "Não atende")
+                with profile_stage("consolidação", pagina="visão geral"):
+                    df_consolidado = cached_consolidated(file_hash, "Não atende", dfs_clean)
                 
-                if dfs_consolidado:
-                    df_consolidado = pd.concat(dfs_consolidado, ignore_index=True)
-                    
+                if df_consolidado is not None:
                     # Métricas gerais
+                    metrics_geral = metrics_from_cube(cube_consolidado, "Consolidado")
+                    with profile_stage("cnpj"):
+                        cnpj_index = cached_cnpj_index(file_hash, dfs_clean)
+                        resumo_cnpj = cnpj_summary(cnpj_index, cached_company_resolution(file_hash, dfs_clean))
                     col1, col2, col3, col4 = st.columns(4)
                     
                     with col1:
-                        st.metric("Total de Empresas", len(df_consolidado))
+                        # Empresas repetidas entre planilhas/arquivos contam uma vez
+                        st.metric(
+                            "Total de Empresas",
+                            resumo_cnpj['Empresas únicas'],
+                            help=f"CNPJs distintos e empresas sem CNPJ vinculadas pelo nome ({metrics_geral['Total Empresas']} registros nas planilhas)"
+                        )
                     
                     with col2:
-                        tel1_count = df_consolidado['TEL 1'].notna().sum() if 'TEL 1' in df_consolidado.columns else 0
-                        tel2_count = df_consolidado['TEL 2'].notna().sum() if 'TEL 2' in df_consolidado.columns else 0
-                        st.metric("Total de Telefones", tel1_count + tel2_count)
+                        st.metric("Total de Telefones", metrics_geral['Total Telefones'])
                     
                     with col3:
-                        email_count = df_consolidado['E-MAIL'].notna().sum() if 'E-MAIL' in df_consolidado.columns else 0
-                        st.metric("Total de Emails", email_count)
+                        st.metric("Total de Emails", metrics_geral.get('Com Email', 0))
                     
                     with col4:
                         st.metric("Planilhas", len(dfs_clean))
@@ -772,7 +3411,10 @@ def main():
                     col1, col2 = st.columns(2)
                     
                     with col1:
-                        fig_pie = create_pie_chart(df_consolidado, "Distribuição de Situações - Consolidado")
+                        fig_pie = None
+                        if 'SITUAÇÃO_NORMALIZADA' in cube_consolidado['colunas']:
+                            with profile_stage("gráfico", nome="situações"):
+                                fig_pie = cached_pie_chart(file_hash, "VISÃO GERAL", "Distribuição de Situações - Consolidado", cube_situacao_counts(cube_consolidado))
                         if fig_pie:
                             st.plotly_chart(fig_pie, use_container_width=True)
                         else:
@@ -781,22 +3423,23 @@ def main():
                     with col2:
                         # Usar primeira planilha para horários (se tiver dados de data/hora)
                         first_sheet_name = sheet_names[0]
-                        first_df = dfs_clean[first_sheet_name]
-                        fig_calls = create_calls_chart(first_df, f"Horários de Ligações - {first_sheet_name}")
+                        with profile_stage("gráfico", nome="horários"):
+                            fig_calls = cached_calls_chart(file_hash, first_sheet_name, f"Horários de Ligações - {first_sheet_name}", cube_hour_counts(cubes[first_sheet_name]))
                         if fig_calls:
                             st.plotly_chart(fig_calls, use_container_width=True)
                         else:
                             st.info("Não foram encontrados dados de horários nas colunas de data")
                     
                     # Observações importantes
-                    show_important_observations(df_consolidado, "Observações Importantes - Consolidado")
+                    with profile_stage("seção", nome="observações"):
+                        show_important_observations(df_consolidado, "Observações Importantes - Consolidado", cube_situacao_counts(cube_consolidado), file_hash)
                     
                     # Tabela resumo por planilha
                     st.subheader("📋 Resumo por Planilha")
                     
                     metrics_data = []
-                    for sheet_name, df in dfs_clean.items():
-                        metrics = calculate_metrics(df, sheet_name)
+                    for sheet_name in dfs_clean:
+                        metrics = metrics_from_cube(cubes[sheet_name], sheet_name)
                         metrics_data.append(metrics)
                     
                     if metrics_data:
@@ -818,6 +3461,39 @@ def main():
                             title=dict(x=0.5, xanchor='center')
                         )
                         st.plotly_chart(fig_comparativo, use_container_width=True)
+                    
+                    # Empresas por CNPJ, entre planilhas e arquivos
+                    with profile_stage("seção", nome="empresas por cnpj"):
+                        show_cnpj_section(dfs_clean, cnpj_index, resumo_cnpj, file_hash)
+                    
+                    # Tabela resumo por arquivo (vários arquivos enviados)
+                    if len(workbooks) > 1:
+                        st.subheader("🗂️ Resumo por Arquivo")
+                        
+                        arquivos_data = []
+                        for (nome, _, _), cubes_arquivo in zip(workbooks, cubes_por_arquivo):
+                            metrics = metrics_from_cube(combine_cubes(cubes_arquivo.values()), nome)
+                            metrics.pop('Planilha')
+                            arquivos_data.append({'Arquivo': nome, 'Período': workbook_period(nome) or SEM_PERIODO, **metrics})
+                        
+                        arquivos_df = pd.DataFrame(arquivos_data).sort_values(['Período', 'Arquivo'], kind='stable')
+                        st.dataframe(arquivos_df, use_container_width=True, hide_index=True)
+                        
+                        fig_arquivos = px.bar(
+                            arquivos_df,
+                            x='Arquivo',
+                            y=['Total Empresas', 'Total Telefones'],
+                            title='<b>Comparativo entre Arquivos</b>',
+                            barmode='group',
+                            hover_data=['Período'],
+                            color_discrete_sequence=px.colors.qualitative.Pastel,
+                            labels={'value': 'Quantidade', 'variable': 'Métrica'}
+                        )
+                        fig_arquivos.update_layout(
+                            height=400,
+                            title=dict(x=0.5, xanchor='center')
+                        )
+                        st.plotly_chart(fig_arquivos, use_container_width=True)
                 else:
                     st.warning("Não foi possível consolidar os dados")
             
@@ -835,7 +3511,8 @@ def main():
                 # Métricas da planilha
                 col1, col2, col3, col4 = st.columns(4)
                 
-                metrics = calculate_metrics(df, selected_sheet)
+                cube = cubes[selected_sheet]
+                metrics = metrics_from_cube(cube, selected_sheet)
                 
                 with col1:
                     st.metric("Empresas", metrics['Total Empresas'])
@@ -856,7 +3533,10 @@ def main():
                 col1, col2 = st.columns(2)
                 
                 with col1:
-                                    fig_pie = create_pie_chart(df, f"Distribuição de Situações - {selected_sheet}")
+                                    fig_pie = None
+                                    if 'SITUAÇÃO_NORMALIZADA' in cube['colunas']:
+                                        with profile_stage("gráfico", nome="situações"):
+                                            fig_pie = cached_pie_chart(file_hash, selected_sheet, f"Distribuição de Situações - {selected_sheet}", cube_situacao_counts(cube))
                 if fig_pie:
                         st.plotly_chart(fig_pie, use_container_width=True)
                 
@@ -864,17 +3544,24 @@ def main():
                     if selected_sheet == 'CARGAS_NITEROI':
                         # Verificar colunas de data disponíveis
                         date_cols_info = []
-                        for col in df.columns:
-                            if any(term in str(col).lower() for term in ['data', 'hora']):
-                                non_null = df[col].notna().sum()
-                                date_cols_info.append(f"{col}: {non_null} valores")
+                        for col in find_date_columns(df):
+                            non_null = df[col].notna().sum()
+                            date_cols_info.append(f"{col}: {non_null} valores")
                         
                         if date_cols_info:
                             st.sidebar.info("Colunas de data encontradas:")
                             for info in date_cols_info:
                                 st.sidebar.write(f"  • {info}")
                         
-                        fig_calls = create_calls_chart(df, f"Horários de Ligações - {selected_sheet}")
+                        # Formatos de data reconhecidos na limpeza
+                        for col, formatos in df.attrs.get('formatos_data', {}).items():
+                            if formatos:
+                                st.sidebar.caption(
+                                    f"{col}: " + ", ".join(f"{fmt} ({qtd})" for fmt, qtd in formatos.items())
+                                )
+                        
+                        with profile_stage("gráfico", nome="horários"):
+                            fig_calls = cached_calls_chart(file_hash, selected_sheet, f"Horários de Ligações - {selected_sheet}", cube_hour_counts(cube))
                         if fig_calls:
                             st.plotly_chart(fig_calls, use_container_width=True)
                         else:
@@ -883,8 +3570,8 @@ def main():
                                 tel_counts = pd.DataFrame({
                                     'Status': ['Com Telefone 1', 'Sem Telefone 1'],
                                     'Quantidade': [
-                                        df['TEL 1'].notna().sum(),
-                                        df['TEL 1'].isna().sum()
+                                        cube_count(cube, **{'COM TEL 1': True}),
+                                        cube_count(cube, **{'COM TEL 1': False})
                                     ]
                                 })
                                 
@@ -909,10 +3596,10 @@ def main():
                             tel_data = pd.DataFrame({
                                 'Tipo': ['Com TEL 1', 'Com TEL 2', 'Com ambos', 'Sem telefone'],
                                 'Quantidade': [
-                                    (df['TEL 1'].notna() & df['TEL 2'].isna()).sum(),
-                                    (df['TEL 2'].notna() & df['TEL 1'].isna()).sum(),
-                                    (df['TEL 1'].notna() & df['TEL 2'].notna()).sum(),
-                                    (df['TEL 1'].isna() & df['TEL 2'].isna()).sum()
+                                    cube_count(cube, **{'COM TEL 1': True, 'COM TEL 2': False}),
+                                    cube_count(cube, **{'COM TEL 1': False, 'COM TEL 2': True}),
+                                    cube_count(cube, **{'COM TEL 1': True, 'COM TEL 2': True}),
+                                    cube_count(cube, **{'COM TEL 1': False, 'COM TEL 2': False})
                                 ]
                             })
                             
@@ -937,8 +3624,8 @@ def main():
                             tel_counts = pd.DataFrame({
                                 'Status': ['Com Telefone', 'Sem Telefone'],
                                 'Quantidade': [
-                                    df['TEL 1'].notna().sum(),
-                                    df['TEL 1'].isna().sum()
+                                    cube_count(cube, **{'COM TEL 1': True}),
+                                    cube_count(cube, **{'COM TEL 1': False})
                                 ]
                             })
                             
@@ -958,21 +3645,38 @@ def main():
                             )
                             st.plotly_chart(fig_tel, use_container_width=True)
                 
+                # Ligações por dia da semana e por tentativa (mesma agregação do gráfico de horários)
+                if not cube['horas'].empty:
+                    col1, col2 = st.columns(2)
+                    
+                    with col1:
+                        with profile_stage("gráfico", nome="dia da semana"):
+                            fig_semana = cached_weekday_heatmap(file_hash, selected_sheet, f"Ligações por Dia da Semana e Hora - {selected_sheet}", cube_weekday_hour_counts(cube))
+                        if fig_semana:
+                            st.plotly_chart(fig_semana, use_container_width=True)
+                    
+                    with col2:
+                        with profile_stage("gráfico", nome="tentativas"):
+                            fig_tentativas = cached_attempts_chart(file_hash, selected_sheet, f"Ligações por Tentativa - {selected_sheet}", cube_attempt_hour_counts(cube))
+                        if fig_tentativas:
+                            st.plotly_chart(fig_tentativas, use_container_width=True)
+                
+                # Linha do tempo das tentativas de contato
+                if find_date_columns(df):
+                    with profile_stage("seção", nome="linha do tempo"):
+                        show_attempt_timeline(df, selected_sheet, file_hash)
+                
                 # Observações importantes
-                show_important_observations(df, f"Observações Importantes - {selected_sheet}")
+                with profile_stage("seção", nome="observações"):
+                    show_important_observations(df, f"Observações Importantes - {selected_sheet}", cube_situacao_counts(cube), file_hash)
                 
                 # Tabela com dados brutos (opcional)
                 with st.expander("📄 Ver dados completos da planilha"):
-                    st.dataframe(df, use_container_width=True)
+                    with profile_stage("seção", nome="dados completos"):
+                        show_data_grid(df, key=f"grid_{selected_sheet}", cache_key=file_hash)
         
         else:
             st.error("Não foi possível carregar os dados do arquivo.")
-        
-        # Limpar arquivo temporário
-        try:
-            os.remove("temp_uploaded.xlsx")
-        except:
-            pass
     
     else:
         # Tela inicial sem arquivo
@@ -1057,7 +3761,139 @@ def main():
                - 📄 Relatório HTML para compartilhar
             4. **Para compartilhar:** Gere o HTML e envie por email
             """)
+    
+    # Painel de diagnóstico (oculto por padrão)
+    etapas, total = finish_profile(pagina=selected_sheet, arquivos=len(uploaded_files or []))
+    if profile_panel_enabled():
+        show_profile_panel(etapas, total, dfs_clean)
+
+# Geração de relatórios em lote, sem Streamlit
+# Uso: python python.py report ARQUIVO_OU_PASTA [...] --out PASTA [--workers N] [--formats html,xlsx]
+CLI_EXCEL_SUFFIXES = ('.xlsx', '.xlsm')
+
+# Função para processar um arquivo: carregar -> limpar -> agregar -> exportar
+def process_workbook(file_path, out_dir, formats=("html", "xlsx"), use_cache=True, plotlyjs=None):
+    """
+    Gera os arquivos de saída de uma planilha e retorna um resumo do processamento
+    """
+    inicio = time.perf_counter()
+    stem = os.path.splitext(os.path.basename(file_path))[0]
+    
+    dfs_clean = None
+    if use_cache:
+        with open(file_path, "rb") as f:
+            file_hash = workbook_hash(f.read())
+        dfs_clean = load_cached_workbook(file_hash)
+    
+    if dfs_clean is None:
+        # Cada arquivo já roda em um worker próprio, então as planilhas vão em série
+        if use_cache and INCREMENTAL_MODE:
+            dfs_clean = ingest_workbook(file_path, os.path.abspath(file_path))
+        else:
+            dfs_clean = load_and_clean_workbook(file_path, mode="serial")
+        if use_cache and dfs_clean:
+            save_cached_workbook(file_hash, dfs_clean)
+            if INCREMENTAL_MODE:
+                save_incremental_index(os.path.abspath(file_path), file_hash)
+    
+    cubes = {
+        sheet_name: sheet_metrics_cube(file_hash if use_cache else None, sheet_name, df)
+        for sheet_name, df in dfs_clean.items()
+    }
+    
+    outputs = []
+    if "html" in formats:
+        html_file = generate_html_report(dfs_clean, os.path.join(out_dir, f"{stem}.html"), cubes=cubes, plotlyjs=plotlyjs)
+        if html_file:
+            outputs.append(html_file)
+    
+    for fmt in formats:
+        if fmt in EXPORT_FORMATS:
+            extensao = os.path.splitext(EXPORT_FORMATS[fmt][1])[1]
+            # CSV e Parquet saem ambos em .zip: o formato entra no nome para um não sobrescrever o outro
+            sufixo = f"_{fmt}" if extensao == ".zip" else ""
+            export_file = os.path.join(out_dir, f"{stem}_dados{sufixo}{extensao}")
+            with open(export_file, "wb") as f:
+                f.write(export_workbook(dfs_clean, fmt))
+            outputs.append(export_file)
+    
+    return {
+        'arquivo': file_path,
+        'planilhas': len(dfs_clean),
+        'registros': int(sum(len(df) for df in dfs_clean.values())),
+        'saidas': outputs,
+        'segundos': round(time.perf_counter() - inicio, 2),
+    }
+
+# Função para listar os arquivos Excel das entradas (arquivos ou pastas)
+def _collect_workbooks(inputs):
+    arquivos = []
+    for entrada in inputs:
+        if os.path.isdir(entrada):
+            arquivos += sorted(
+                os.path.join(entrada, nome) for nome in os.listdir(entrada)
+                if nome.lower().endswith(CLI_EXCEL_SUFFIXES) and not nome.startswith('~$')
+            )
+        else:
+            arquivos.append(entrada)
+    return arquivos
+
+# Função de entrada da linha de comando
+def cli(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python python.py",
+        description="Gera relatórios HTML/Excel das planilhas sem abrir o Streamlit"
+    )
+    subparsers = parser.add_subparsers(dest="comando", required=True)
+    
+    report = subparsers.add_parser("report", help="gera os relatórios de um ou mais arquivos")
+    report.add_argument("entradas", nargs="+", help="arquivos .xlsx ou pastas com arquivos .xlsx")
+    report.add_argument("--out", required=True, help="pasta de saída")
+    report.add_argument("--workers", type=int, default=PARALLEL_WORKERS or os.cpu_count() or 1,
+                        help="arquivos processados em paralelo")
+    report.add_argument("--formats", default="html,xlsx",
+                        help="saídas separadas por vírgula: html, xlsx, csv, parquet")
+    report.add_argument("--plotlyjs", choices=HTML_PLOTLYJS_MODES, default=HTML_PLOTLYJS,
+                        help="plotly.js embutido, via CDN ou num plotly.min.js compartilhado na pasta de saída")
+    report.add_argument("--no-cache", action="store_true", help="ignora o cache em disco")
+    
+    args = parser.parse_args(argv)
+    
+    arquivos = _collect_workbooks(args.entradas)
+    if not arquivos:
+        parser.error("nenhum arquivo Excel encontrado nas entradas")
+    
+    formats = tuple(dict.fromkeys(fmt.strip().lower() for fmt in args.formats.split(",") if fmt.strip()))
+    desconhecidos = [fmt for fmt in formats if fmt not in {"html"} | EXPORT_FORMATS.keys()]
+    if desconhecidos:
+        parser.error(f"formato desconhecido: {', '.join(desconhecidos)} (use {', '.join(['html', *EXPORT_FORMATS])})")
+    if not formats:
+        parser.error("informe ao menos um formato em --formats")
+    os.makedirs(args.out, exist_ok=True)
+    
+    workers = max(1, min(args.workers, len(arquivos)))
+    
+    falhas = 0
+    with make_executor(workers, "process" if workers > 1 else "thread") as executor:
+        futures = {
+            arquivo: executor.submit(process_workbook, arquivo, args.out, formats, not args.no_cache, args.plotlyjs)
+            for arquivo in arquivos
+        }
+        for arquivo, future in futures.items():
+            try:
+                resumo = future.result()
+                print(
+                    f"OK   {arquivo}: {resumo['planilhas']} planilhas, {resumo['registros']} registros, "
+                    f"{resumo['segundos']}s -> {', '.join(resumo['saidas'])}"
+                )
+            except Exception as e:
+                falhas += 1
+                print(f"ERRO {arquivo}: {e}", file=sys.stderr)
+    
+    return 1 if falhas else 0
 
 # Executar aplicação
 if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "report" and not st.runtime.exists():
+        sys.exit(cli(sys.argv[1:]))
     main()
\ No newline at end of file
@@ -0,0 +1,54 @@
+"""
+Cache em disco das planilhas limpas: uma leitura do cache deve devolver
+exatamente o que clean_data devolve para o mesmo arquivo
+"""
+
+import os
+from datetime import datetime
+
+import pandas as pd
+import pytest
+
+import python
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(python, "CACHE_DIR", str(tmp_path / "planilhas"))
+    monkeypatch.setattr(python, "INCREMENTAL_DIR", str(tmp_path / "incremental"))
+    return tmp_path
+
+
+# Função para conferir que o cache devolve as mesmas planilhas, com os mesmos tipos
+def _assert_cache_igual(dfs_clean):
+    python.save_cached_workbook("teste", dfs_clean)
+    do_cache = python.load_cached_workbook("teste")
+    
+    assert list(do_cache) == list(dfs_clean)
+    for sheet_name, df in dfs_clean.items():
+        pd.testing.assert_frame_equal(do_cache[sheet_name], df)
+        assert do_cache[sheet_name].attrs == df.attrs
+
+
+def test_cache_igual_a_limpeza_da_planilha_de_exemplo(cache_dir):
+    dfs = python.read_workbook(os.path.join(RAIZ, "NITEROI_BIRA.xlsx"))
+    _assert_cache_igual({sheet_name: python.clean_data(df, sheet_name) for sheet_name, df in dfs.items()})
+
+
+def test_cache_igual_a_limpeza_com_tipos_misturados(cache_dir):
+    bruto = pd.DataFrame({
+        'CNPJ': [12345678000199, '12.345.678/0001-99', None, 191],
+        'RAZÃO SOCIAL': ['ALFA LTDA', 2024, None, 'BETA'],
+        'SITUAÇÃO': [1, 1.0, True, 'Não atende'],
+        'OBSERVAÇÃO': [10, 'ligar depois', None, 3.5],
+        'QTD': [1, 2, None, 4],
+        'Data / Hora 1': [datetime(2024, 5, 6, 9, 30), '07/05/2024 10:15', None, 45420.5],
+    }, dtype=object)
+    dfs_clean = {'CARGAS_NITEROI': python.clean_data(bruto, 'CARGAS_NITEROI')}
+    
+    limpo = dfs_clean['CARGAS_NITEROI']
+    assert not (limpo.dtypes == object).any()
+    assert limpo['OBSERVAÇÃO'].tolist()[:2] == ['10', 'ligar depois']
+    _assert_cache_igual(dfs_clean)
@@ -0,0 +1,114 @@
+"""
+Índice de CNPJs: as consultas, o resumo e a situação mais recente calculados
+pelo índice devem ser os mesmos de uma varredura linha a linha das planilhas
+"""
+
+import pandas as pd
+import pytest
+
+import python
+
+
+@pytest.fixture
+def dfs_clean():
+    # CNPJ repetido na mesma planilha e entre planilhas, pontuado, sem CNPJ e inválido
+    a = pd.DataFrame({
+        'CNPJ': ['11.222.333/0001-81', '11222333000181', None, '123', '45.997.418/0001-53', ''],
+        'RAZÃO SOCIAL': ['Padaria Pão Bom LTDA', 'Padaria Pao Bom', 'Padaria Pão Bomm', 'Oficina X', 'Mercado Azul', 'Bar do Zé'],
+        'SITUAÇÃO': ['Sem interesse', 'Retornar', None, 'Enviado e-mail', 'Atendeu', 'Caixa postal'],
+        'Data / Hora 1': ['03/09/2025 09:31', '04/09/2025 10:00', None, 'ligar amanhã', '01/09/2025 08:00', None],
+        'Data / Hora 2': [None, '05/09/2025 10:00', None, None, None, None],
+    })
+    b = pd.DataFrame({
+        'CNPJ': ['45997418000153', '11222333000181', '45997418000153', None],
+        'RAZÃO SOCIAL': ['Mercado Azul ME', 'Padaria Pão Bom', 'Mercado Azul', None],
+        'SITUAÇÃO': ['Enviado e-mail', 'Não atende', 'Sem interesse', 'Retornar'],
+        'Data / Hora 1': ['02/09/2025 08:00', '05/09/2025 09:00', None, '06/09/2025 11:00'],
+        'Data / Hora 2': ['03/09/2025 08:00', None, None, None],
+    })
+    # Planilha sem coluna CNPJ: fica fora do índice e todas as linhas contam como sem CNPJ
+    c = pd.DataFrame({'RAZÃO SOCIAL': ['Oficina Y'], 'SITUAÇÃO': ['Atendeu']})
+    return {sheet_name: python.clean_data(df, sheet_name) for sheet_name, df in {'A': a, 'B': b, 'C': c}.items()}
+
+
+# Função para listar as ocorrências de cada CNPJ linha a linha: {cnpj: [(planilha, linha)]}
+def _ocorrencias(dfs_clean):
+    ocorrencias = {}
+    for sheet_name, df in dfs_clean.items():
+        if 'CNPJ' not in df.columns:
+            continue
+        for linha, cnpj in enumerate(df['CNPJ']):
+            if not pd.isna(cnpj):
+                ocorrencias.setdefault(cnpj, []).append((sheet_name, linha))
+    return ocorrencias
+
+
+def test_indice_igual_a_varredura_linha_a_linha(dfs_clean):
+    index = python.build_cnpj_index(dfs_clean)
+    ocorrencias = _ocorrencias(dfs_clean)
+    
+    assert index['planilhas'] == ['A', 'B']
+    assert set(index['codigos']) == set(ocorrencias)
+    for cnpj, codigo in index['codigos'].items():
+        inicio, fim = index['inicio'][codigo], index['inicio'][codigo + 1]
+        do_indice = [(index['planilhas'][p], int(l)) for p, l in zip(index['planilha'][inicio:fim], index['linha'][inicio:fim])]
+        assert sorted(do_indice) == sorted(ocorrencias[cnpj])
+    assert index['sem_cnpj'] == {'A': 2, 'B': 1}
+
+
+def test_lookup_igual_a_filtro_das_planilhas(dfs_clean):
+    index = python.build_cnpj_index(dfs_clean)
+    
+    for cnpj in _ocorrencias(dfs_clean):
+        partes = [
+            df[df['CNPJ'] == cnpj].assign(PLANILHA=sheet_name)[['PLANILHA', *df.columns]]
+            for sheet_name, df in dfs_clean.items() if 'CNPJ' in df.columns and (df['CNPJ'] == cnpj).any()
+        ]
+        esperado = pd.concat(partes, ignore_index=True)
+        pd.testing.assert_frame_equal(python.lookup_cnpj(index, dfs_clean, cnpj), esperado)
+    
+    # Busca com pontuação e sem os zeros à esquerda
+    assert len(python.lookup_cnpj(index, dfs_clean, '11.222.333/0001-81')) == 3
+    assert python.lookup_cnpj(index, dfs_clean, '99999999999999').empty
+
+
+def test_resumo_igual_a_contagem_linha_a_linha(dfs_clean):
+    index = python.build_cnpj_index(dfs_clean)
+    ocorrencias = _ocorrencias(dfs_clean)
+    sem_cnpj = sum(df['CNPJ'].isna().sum() if 'CNPJ' in df.columns else len(df) for df in dfs_clean.values())
+    
+    resumo = python.cnpj_summary(index)
+    
+    assert resumo['CNPJs distintos'] == len(ocorrencias)
+    assert resumo['CNPJs em mais de uma planilha'] == sum(len({p for p, _ in o}) > 1 for o in ocorrencias.values())
+    assert resumo['Linhas repetidas'] == sum(len(o) - 1 for o in ocorrencias.values())
+    # A planilha sem coluna CNPJ fica fora do índice (e do resumo sem a vinculação pelo nome)
+    assert resumo['Linhas sem CNPJ'] == sem_cnpj - len(dfs_clean['C'])
+    assert resumo['Empresas únicas'] == len(ocorrencias) + resumo['Linhas sem CNPJ']
+
+
+def test_situacao_mais_recente_igual_a_varredura_linha_a_linha(dfs_clean):
+    index = python.build_cnpj_index(dfs_clean)
+    planilhas = list(dfs_clean)
+    
+    # Maior (última tentativa, planilha, linha) de cada CNPJ; as datas de teste têm ano
+    esperado = {}
+    for cnpj, ocorrencias in _ocorrencias(dfs_clean).items():
+        def chave(ocorrencia):
+            sheet_name, linha = ocorrencia
+            df = dfs_clean[sheet_name]
+            datas = [python.parse_datetime(df[col].iloc[linha]) for col in ('Data / Hora 1', 'Data / Hora 2')]
+            datas = [data for data in datas if data is not None]
+            return (max(datas) if datas else pd.Timestamp.min, planilhas.index(sheet_name), linha)
+        sheet_name, linha = max(ocorrencias, key=chave)
+        df = dfs_clean[sheet_name]
+        esperado[cnpj] = (sheet_name, df['SITUAÇÃO_NORMALIZADA'].iloc[linha], df['RAZÃO SOCIAL'].iloc[linha], len(ocorrencias))
+    
+    resultado = python.latest_situation_by_cnpj(index, dfs_clean)
+    
+    assert len(resultado) == len(esperado)
+    obtido = {
+        linha['CNPJ']: (linha['PLANILHA'], linha['SITUAÇÃO'], linha['RAZÃO SOCIAL'], linha['OCORRÊNCIAS'])
+        for _, linha in resultado.iterrows()
+    }
+    assert obtido == esperado
@@ -0,0 +1,71 @@
+"""
+Conversão em lote das colunas Data / Hora: mesmo resultado que parse_datetime
+aplicada valor a valor, com todos os formatos misturados na mesma coluna
+"""
+
+from datetime import datetime
+
+import pandas as pd
+
+import python
+
+# Valor -> resultado esperado (o mesmo de parse_datetime)
+VALORES = [
+    (datetime(2025, 9, 3, 9, 31, 55), "2025-09-03 09:31:55"),
+    (pd.Timestamp("2025-09-04 10:00"), "2025-09-04 10:00:00"),
+    ("2025-09-03 09:31:55", "2025-09-03 09:31:55"),
+    ("03/09/2025 09:31", "2025-09-03 09:31:00"),
+    ("14/10 - 00:00", "1900-10-14 00:00:00"),
+    ("7/10 - 15:00", "1900-10-07 15:00:00"),
+    ("10/10 -  09:15", "1900-10-10 09:15:00"),
+    ("02/10/2025 - 15:33", "2025-10-02 15:33:00"),
+    # Ano com dois dígitos: século 20 abaixo de 50, 19 a partir dele
+    ("03/09/25 09:31", "2025-09-03 09:31:00"),
+    ("03/09/49 09:31", "2049-09-03 09:31:00"),
+    ("03/09/50 09:31", "1950-09-03 09:31:00"),
+    ("  03/09/99 23:59 ", "1999-09-03 23:59:00"),
+    ("03/09/25", "2025-09-03 00:00:00"),
+    ("2025-09-03", "2025-09-03 00:00:00"),
+    ("03/09/2025", "2025-09-03 00:00:00"),
+    # Só a hora aproveitável: data fictícia
+    ("xx - 14:30", "2025-01-01 14:00:00"),
+    (None, None),
+    (float("nan"), None),
+    ("", None),
+    ("ligar amanhã", None),
+    ("31/02/2025", None),
+    ("abc - 25:00", None),
+    (45420.5, None),
+]
+
+
+def test_parse_datetime_series_igual_a_parse_datetime():
+    series = pd.Series([valor for valor, _ in VALORES], dtype=object, index=range(10, 10 + len(VALORES)))
+    
+    resultado, formatos = python.parse_datetime_series(series)
+    por_valor = pd.to_datetime(series.map(python.parse_datetime)).astype('datetime64[ns]')
+    esperado = pd.to_datetime(pd.Series([data for _, data in VALORES], index=series.index)).astype('datetime64[ns]')
+    
+    pd.testing.assert_series_equal(resultado, esperado)
+    pd.testing.assert_series_equal(resultado, por_valor)
+    assert sum(formatos.values()) == series.notna().sum()
+    assert formatos['%d/%m/%y %H:%M'] == 5
+
+
+def test_parse_datetime_series_ano_com_dois_digitos_com_traco_e_segundos():
+    # parse_datetime não reconhecia estes (retornava None); a conversão em lote lê a data inteira
+    series = pd.Series(["03/09/25 - 09:31", "03/09/25 09:31:20"], dtype=object)
+    
+    resultado, _ = python.parse_datetime_series(series)
+    
+    assert series.map(python.parse_datetime).isna().all()
+    assert resultado.tolist() == [pd.Timestamp("2025-09-03 09:31"), pd.Timestamp("2025-09-03 09:31:20")]
+
+
+def test_parse_datetime_series_coluna_ja_convertida():
+    series = pd.Series(pd.to_datetime(["2025-09-03 09:31", None]))
+    
+    resultado, formatos = python.parse_datetime_series(series)
+    
+    pd.testing.assert_series_equal(resultado, series.astype('datetime64[ns]'))
+    assert formatos == {'datetime': 1}
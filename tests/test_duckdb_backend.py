@@ -0,0 +1,62 @@
+"""
+Backend DuckDB: o cubo calculado em SQL direto do Parquet deve ser igual ao do pandas
+"""
+
+from datetime import datetime
+
+import pandas as pd
+import pytest
+
+import python
+
+pytest.importorskip("duckdb")
+
+
+# Função para comparar duas tabelas do cubo sem depender da ordem das linhas
+def _ordenado(df):
+    df = df.astype({'SITUAÇÃO': object}).fillna({'SITUAÇÃO': ''})
+    return df.sort_values(list(df.columns[:-1])).reset_index(drop=True)
+
+
+@pytest.fixture
+def planilha():
+    # Datas sem ano ("dd/mm - hh:mm"), inclusive na virada do ano e sem nenhuma tentativa com ano
+    bruto = pd.DataFrame({
+        'CNPJ': ['11111111000111', '22222222000122', '33333333000133', '44444444000144', '55555555000155'],
+        'TEL 1': ['2126195760', None, '2126195761', None, '2126195762'],
+        'E-MAIL': ['a@b.com', None, None, 'c@d.com', None],
+        'SITUAÇÃO': ['Não atende', 'Não acatou', None, 'Baixada', 'Não atende'],
+        'Data / Hora 1': [datetime(2024, 12, 20, 9, 30), '28/12 - 16:10', '03/03 - 10:00', None, datetime(2025, 2, 3, 8, 0)],
+        'Data / Hora 2': ['05/01 - 11:45', '02/01 - 09:00', '04/03 - 10:30', '10/10 - 14:00', '04/02 - 17:20'],
+        'Data / Hora 3': ['20/01 - 15:00', None, None, None, '03/02/2025 - 13:05'],
+    }, dtype=object)
+    return python.clean_data(bruto, 'CARGAS_NITEROI')
+
+
+def test_cubo_duckdb_igual_ao_pandas(planilha, tmp_path):
+    parquet_path = tmp_path / "planilha.parquet"
+    planilha.to_parquet(parquet_path)
+    
+    esperado = python.build_metrics_cube(planilha, 'CARGAS_NITEROI')
+    cubo = python.build_metrics_cube_duckdb(parquet_path, 'CARGAS_NITEROI')
+    
+    assert cubo['colunas'] == esperado['colunas']
+    for parte in ('contatos', 'horas'):
+        pd.testing.assert_frame_equal(_ordenado(cubo[parte]), _ordenado(esperado[parte]), check_dtype=False)
+    assert python.metrics_from_cube(cubo, 'CARGAS_NITEROI') == python.metrics_from_cube(esperado, 'CARGAS_NITEROI')
+
+
+def test_horas_duckdb_sem_nenhuma_data_com_ano(tmp_path):
+    bruto = pd.DataFrame({
+        'CNPJ': ['11111111000111', '22222222000122'],
+        'SITUAÇÃO': ['Não atende', 'Baixada'],
+        'Data / Hora 1': ['28/12 - 16:10', '03/03 - 10:00'],
+        'Data / Hora 2': ['02/01 - 09:00', None],
+    }, dtype=object)
+    planilha = python.clean_data(bruto, 'CARGAS_NITEROI')
+    parquet_path = tmp_path / "planilha.parquet"
+    planilha.to_parquet(parquet_path)
+    
+    esperado = python.build_metrics_cube(planilha, 'CARGAS_NITEROI')['horas']
+    horas = python.build_metrics_cube_duckdb(parquet_path, 'CARGAS_NITEROI')['horas']
+    pd.testing.assert_frame_equal(_ordenado(horas), _ordenado(esperado), check_dtype=False)
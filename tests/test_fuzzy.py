@@ -0,0 +1,116 @@
+"""
+Vinculação pela RAZÃO SOCIAL: os blocos, a similaridade em numpy e os grupos
+devem dar o mesmo resultado da comparação de todos os pares, nome a nome
+"""
+
+import itertools
+import re
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import python
+
+NOMES = [
+    'Padaria Pão Bom LTDA', 'Padaria Pao Bom', 'PADARIA PÃO BOMM ME', 'Padaria Pão Doce',
+    'Mercado Azul', 'Mercado Azul Eireli', 'Mercadinho Azul', 'Mercado Verde',
+    'Oficina do Zé', 'Oficina Ze', 'Transportes Rápidos S.A.', 'Transportes Rapidos',
+    'Cia. de Transportes Lentos', 'Bar do Zé', 'Bar e Restaurante do Zé', 'A', '', None,
+]
+
+
+# Função de referência: normaliza um nome por vez, sem as substituições vetorizadas
+def _normalizar(nome):
+    texto = re.sub(r'[^a-z0-9]+', ' ', python.normalize_text(nome) if not pd.isna(nome) else '')
+    palavras = [p for p in texto.split() if p not in python.NOMES_IGNORADOS and len(p) > 1]
+    return ' '.join(palavras)
+
+
+# Função de referência: Jaccard dos conjuntos de trigramas de " nome "
+def _jaccard(a, b):
+    largura = python.FUZZY_MAX_NAME_LENGTH + 2
+    trigramas = [{t[i:i + 3] for i in range(len(t) - 2)} for t in (f" {a} "[:largura], f" {b} "[:largura])]
+    return len(trigramas[0] & trigramas[1]) / max(len(trigramas[0] | trigramas[1]), 1)
+
+
+def test_normalizacao_igual_a_nome_a_nome():
+    codes, normalizados = python.normalize_company_names(NOMES)
+    
+    assert [normalizados[c] for c in codes] == [_normalizar(nome) for nome in NOMES]
+
+
+def test_jaccard_igual_a_conjuntos_de_trigramas():
+    _, normalizados = python.normalize_company_names(NOMES)
+    a, b = (np.array(x) for x in zip(*itertools.combinations(range(len(normalizados)), 2)))
+    chaves, inicio = python._name_trigrams(normalizados)
+    
+    similaridade = python._trigram_jaccard(chaves, inicio, a, b)
+    
+    esperado = [_jaccard(normalizados[i], normalizados[j]) for i, j in zip(a, b)]
+    np.testing.assert_allclose(similaridade, esperado)
+
+
+def test_pares_dos_blocos_cobrem_os_pares_parecidos():
+    _, normalizados = python.normalize_company_names(NOMES)
+    pendentes = np.ones(len(normalizados), dtype=bool)
+    
+    a, b = python._candidate_pairs(normalizados, pendentes)
+    
+    candidatos = set(zip(a.tolist(), b.tolist()))
+    parecidos = {
+        (i, j) for i, j in itertools.combinations(range(len(normalizados)), 2)
+        if normalizados[i] and normalizados[j] and _jaccard(normalizados[i], normalizados[j]) >= python.FUZZY_THRESHOLD
+    }
+    assert parecidos and parecidos <= candidatos
+
+
+# Função de referência: compara todos os pares de registros e junta os grupos (union-find)
+def _resolver_todos_os_pares(registros, threshold):
+    grupo = list(range(len(registros)))
+    
+    def raiz(i):
+        while grupo[i] != i:
+            i = grupo[i]
+        return i
+    
+    nomes = [_normalizar(nome) for nome, _ in registros]
+    for i, j in itertools.combinations(range(len(registros)), 2):
+        if nomes[i] and nomes[j] and _jaccard(nomes[i], nomes[j]) >= threshold:
+            grupo[raiz(j)] = raiz(i)
+    
+    grupos = {}
+    for i, (_, valido) in enumerate(registros):
+        grupos.setdefault(raiz(i), []).append(valido)
+    # Cada CNPJ válido é uma empresa; grupo sem nenhum CNPJ válido é mais uma
+    empresas = sum(sum(validos) + (not any(validos)) for validos in grupos.values())
+    vinculados = sum(len(validos) > 1 and not all(validos) and validos.count(False) for validos in grupos.values())
+    return empresas, vinculados
+
+
+@pytest.mark.parametrize("threshold", [0.5, 0.7, 0.9])
+def test_resolucao_igual_a_comparar_todos_os_pares(threshold):
+    # CNPJs válidos, um inválido (dígito verificador errado) e linhas sem CNPJ
+    a = pd.DataFrame({
+        'CNPJ': ['11222333000181', '45997418000153', '11222333000182', None, None, None, None, None],
+        'RAZÃO SOCIAL': ['Padaria Pão Bom LTDA', 'Mercado Azul', 'Oficina do Zé', 'Padaria Pao Bom',
+                         'PADARIA PÃO BOMM ME', 'Mercado Azul Eireli', 'Oficina Ze', None],
+    })
+    b = pd.DataFrame({
+        'CNPJ': ['11444777000161', None, None, None],
+        'RAZÃO SOCIAL': ['Padaria Pão Doce', 'Transportes Rápidos S.A.', 'Transportes Rapidos', 'Bar do Zé'],
+    })
+    dfs_clean = {sheet_name: python.clean_data(df, sheet_name) for sheet_name, df in {'A': a, 'B': b}.items()}
+    index = python.build_cnpj_index(dfs_clean)
+    
+    resolucao = python.resolve_company_names(dfs_clean, index, threshold=threshold)
+    
+    # Registros: um por CNPJ (nome da primeira ocorrência) e um por linha sem CNPJ
+    validos = dict(zip(index['cnpjs'], python.valid_cnpj_mask(index['cnpjs'])))
+    registros = [(razao, validos[cnpj]) for df in dfs_clean.values() for cnpj, razao in zip(df['CNPJ'], df['RAZÃO SOCIAL']) if not pd.isna(cnpj)]
+    registros += [(razao, False) for df in dfs_clean.values() for cnpj, razao in zip(df['CNPJ'], df['RAZÃO SOCIAL']) if pd.isna(cnpj)]
+    empresas, vinculados = _resolver_todos_os_pares(registros, threshold)
+    
+    assert resolucao['empresas'] == empresas
+    assert resolucao['vinculados'] == vinculados
+    assert resolucao['grupos']['CNPJ VÁLIDO'].sum() <= len(index['cnpjs'])
@@ -0,0 +1,51 @@
+"""
+Custo de importar python.py (partida a frio do app e da CLI)
+
+As dependências pesadas e opcionais só devem ser carregadas por quem as usa
+(gráficos, exportação, backend DuckDB). O orçamento do tempo de importação pode
+ser ajustado com RELATORIO_IMPORT_BUDGET_MS em máquinas mais lentas.
+"""
+
+import os
+import re
+import subprocess
+import sys
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ORCAMENTO_MS = float(os.environ.get("RELATORIO_IMPORT_BUDGET_MS", "1800"))
+
+# Módulos que não podem ser carregados só por importar o app
+MODULOS_ADIADOS = ["duckdb", "xlsxwriter", "python_calamine", "jinja2", "plotly.express", "openpyxl"]
+
+_LINHA_IMPORTTIME = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|\s*(\S+)\s*$")
+
+
+# Função para importar o app num processo novo, com -X importtime
+def _importar_app():
+    codigo = "import sys, python; print(','.join(m for m in sys.argv[1:] if m in sys.modules))"
+    resultado = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", codigo, *MODULOS_ADIADOS],
+        cwd=RAIZ, capture_output=True, text=True, timeout=120,
+    )
+    assert resultado.returncode == 0, resultado.stderr[-2000:]
+    
+    cumulativo = {}
+    for linha in resultado.stderr.splitlines():
+        match = _LINHA_IMPORTTIME.match(linha)
+        if match:
+            cumulativo[match.group(3)] = int(match.group(2)) / 1000
+    carregados = [m for m in resultado.stdout.strip().split(",") if m]
+    return cumulativo, carregados
+
+
+def test_import_nao_carrega_dependencias_pesadas():
+    _, carregados = _importar_app()
+    assert carregados == [], f"importados na partida: {carregados}"
+
+
+def test_import_dentro_do_orcamento():
+    cumulativo, _ = _importar_app()
+    assert "python" in cumulativo
+    assert cumulativo["python"] <= ORCAMENTO_MS, (
+        f"import python levou {cumulativo['python']:.0f}ms (orçamento {ORCAMENTO_MS:.0f}ms)"
+    )
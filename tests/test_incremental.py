@@ -0,0 +1,107 @@
+"""
+Ingestão incremental: juntar as linhas novas às do cache deve dar o mesmo
+resultado que ler e limpar o arquivo inteiro de novo
+"""
+
+import os
+
+import pandas as pd
+import pytest
+from openpyxl import load_workbook
+
+import python
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LINHAS_NOVAS = 25
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(python, "CACHE_DIR", str(tmp_path / "planilhas"))
+    monkeypatch.setattr(python, "INCREMENTAL_DIR", str(tmp_path / "planilhas" / "incremental"))
+    return tmp_path
+
+
+@pytest.fixture
+def linhas_limpas(monkeypatch):
+    # Quantas linhas passaram por clean_data
+    contagem = []
+    clean_data = python.clean_data
+    
+    def contar(df, sheet_name):
+        contagem.append(len(df))
+        return clean_data(df, sheet_name)
+    
+    monkeypatch.setattr(python, "clean_data", contar)
+    return contagem
+
+
+# Função para gravar a planilha de exemplo sem as últimas linhas de cada aba (o arquivo "de ontem")
+def _salvar_sem_cauda(caminho, n, editar=None):
+    workbook = load_workbook(os.path.join(RAIZ, "NITEROI_BIRA.xlsx"))
+    for ws in workbook.worksheets:
+        ws.delete_rows(ws.max_row - n + 1, n)
+    if editar:
+        editar(workbook)
+    workbook.save(caminho)
+
+
+# Função para ingerir um arquivo como o upload faz (cache em disco + índice do nome)
+def _ingerir(caminho, store_key="NITEROI_BIRA.xlsx"):
+    with open(caminho, "rb") as f:
+        file_hash = python.workbook_hash(f.read())
+    dfs_clean = python.ingest_workbook(str(caminho), store_key)
+    python.save_cached_workbook(file_hash, dfs_clean)
+    python.save_incremental_index(store_key, file_hash)
+    return dfs_clean
+
+
+def _assert_igual_a_leitura_completa(dfs_clean, caminho):
+    esperado = python.load_and_clean_workbook(str(caminho), mode="serial")
+    assert list(dfs_clean) == list(esperado)
+    for sheet_name, df in esperado.items():
+        pd.testing.assert_frame_equal(dfs_clean[sheet_name], df)
+        assert dfs_clean[sheet_name].attrs['formatos_data'] == df.attrs['formatos_data']
+
+
+def test_incremental_igual_a_leitura_completa(cache_dir, linhas_limpas):
+    ontem, hoje = cache_dir / "ontem.xlsx", cache_dir / "hoje.xlsx"
+    _salvar_sem_cauda(ontem, LINHAS_NOVAS)
+    _salvar_sem_cauda(hoje, 0)
+    
+    _ingerir(ontem)
+    linhas_limpas.clear()
+    dfs_clean = _ingerir(hoje)
+    
+    # Só as linhas novas de cada planilha foram limpas
+    assert linhas_limpas == [LINHAS_NOVAS] * len(dfs_clean)
+    _assert_igual_a_leitura_completa(dfs_clean, hoje)
+    
+    # Mesmo arquivo de novo: nada para limpar
+    linhas_limpas.clear()
+    dfs_clean = _ingerir(hoje)
+    assert linhas_limpas == []
+    _assert_igual_a_leitura_completa(dfs_clean, hoje)
+
+
+def test_incremental_linha_antiga_alterada_limpa_a_planilha_inteira(cache_dir, linhas_limpas):
+    ontem, hoje = cache_dir / "ontem.xlsx", cache_dir / "hoje.xlsx"
+    _salvar_sem_cauda(ontem, LINHAS_NOVAS)
+    
+    def mudar_situacao(workbook):
+        ws = workbook["NITEROI_BIRA_1"]
+        for cell in ws[1] + ws[2] + ws[3]:
+            if cell.value == "SITUAÇÃO":
+                ws.cell(row=cell.row + 1, column=cell.column, value="Baixada")
+                return
+        raise AssertionError("coluna SITUAÇÃO não encontrada")
+    
+    _salvar_sem_cauda(hoje, 0, mudar_situacao)
+    
+    _ingerir(ontem)
+    linhas_limpas.clear()
+    dfs_clean = _ingerir(hoje)
+    
+    assert len(linhas_limpas) == len(dfs_clean)
+    assert len(dfs_clean["NITEROI_BIRA_1"]) in linhas_limpas
+    _assert_igual_a_leitura_completa(dfs_clean, hoje)
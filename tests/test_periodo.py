@@ -0,0 +1,47 @@
+"""
+Período (AAAA-MM) tirado do nome dos arquivos enviados juntos; a ordem das
+categorias de PERÍODO na visão consolidada depende dele
+"""
+
+import pandas as pd
+import pytest
+
+import python
+
+
+@pytest.mark.parametrize("nome, periodo", [
+    ("relatorio_2025-09.xlsx", "2025-09"),
+    ("2025_09_15.xlsx", "2025-09"),
+    ("202509.xlsx", "2025-09"),
+    ("09-2025.xlsx", "2025-09"),
+    ("ligacoes_09_25.xlsx", "2025-09"),
+    ("15_09_2025.xlsx", "2025-09"),
+    ("setembro_2025.xlsx", "2025-09"),
+    ("Set25.xlsx", "2025-09"),
+    ("dez-2024.xlsx", "2024-12"),
+    ("março 2025.xlsx", "2025-03"),
+    ("operador 3 - 2025-09.xlsx", "2025-09"),
+    ("v2_10_25.xlsx", "2025-10"),
+    ("v2.xlsx", None),
+    ("NITEROI_BIRA_2.xlsx", None),
+    ("equipe2_2025.xlsx", None),
+    ("base13_2025.xlsx", None),
+    ("2025-13.xlsx", None),
+    ("00-2025.xlsx", None),
+    ("20250915.xlsx", None),
+])
+def test_workbook_period(nome, periodo):
+    assert python.workbook_period(nome) == periodo
+
+
+def test_merge_ordena_os_periodos():
+    bruto = pd.DataFrame({'CNPJ': ['12345678000199'], 'SITUAÇÃO': ['Não atende']})
+    workbooks = [
+        (nome, {'NITEROI_BIRA_1': python.clean_data(bruto, 'NITEROI_BIRA_1')})
+        for nome in ["v2_10_25.xlsx", "NITEROI_BIRA.xlsx", "dez-2024.xlsx", "2025_09_15.xlsx"]
+    ]
+    
+    df = python.merge_workbooks(workbooks)['NITEROI_BIRA_1']
+    
+    assert list(df['PERÍODO'].cat.categories) == ["2024-12", "2025-09", "2025-10", python.SEM_PERIODO]
+    assert df['PERÍODO'].tolist() == ["2025-10", python.SEM_PERIODO, "2024-12", "2025-09"]
@@ -0,0 +1,45 @@
+"""
+Normalização vetorizada da situação: mesmo resultado, linha a linha, que a
+função original normalize_situacao
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import python
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# Função para comparar a versão vetorizada com a aplicação linha a linha
+def _assert_igual_por_linha(series):
+    esperado = series.map(python.normalize_situacao)
+    resultado = python.normalize_situacao_series(series)
+    
+    assert isinstance(resultado.dtype, pd.CategoricalDtype)
+    assert resultado.index.equals(series.index)
+    assert resultado.astype(object).tolist() == esperado.tolist()
+
+
+@pytest.mark.parametrize("sheet_name", ["CARGAS_NITEROI", "NITEROI_BIRA_1", "NITEROI_BIRA_2"])
+def test_situacoes_da_planilha_de_exemplo(sheet_name):
+    df = python.read_workbook(os.path.join(RAIZ, "NITEROI_BIRA.xlsx"))[sheet_name]
+    _assert_igual_por_linha(df['SITUAÇÃO'])
+
+
+def test_situacoes_com_variacoes_e_tipos_misturados():
+    series = pd.Series([
+        'Não atende', ' nao atende ', 'N ATEND', 'não atend', 'Não Acatou', 'n acatou',
+        'Tel errado', 'TELEFONE INCORRETO', 'Número incorreto', 'Empresa Baixada', 'BAIXADA',
+        'Retornar amanhã', 'retornar às 14h', 'Sem contato', '', '  ', None, np.nan,
+        1, 1.0, True, 2.5, 'Não atende',
+    ], dtype=object, index=range(100, 123))
+    _assert_igual_por_linha(series)
+
+
+def test_situacoes_vazias_e_texto():
+    _assert_igual_por_linha(pd.Series([None, None], dtype=object))
+    _assert_igual_por_linha(pd.Series(['Não atende', None, 'Baixada'], dtype=python.SCHEMA_STRING_DTYPE))